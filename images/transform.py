@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Write resized WebP and AVIF variants of uploaded images.
+
+Runs as the media stack's ImageFunction (``handler``, on S3 ObjectCreated
+events under UPLOAD_PREFIX, for the keys ``is_image`` accepts) and locally
+through ``tools/images.py``. Needs Pillow; AVIF also needs Pillow built with libavif (or pillow-avif-plugin)
+and is skipped where it is missing. A variant that comes out larger than
+the original is not written, so the original is served instead.
+"""
+
+import io
+import os
+import urllib.parse
+
+from PIL import Image, ImageOps
+
+try:
+    import pillow_avif  # noqa: F401 (registers AVIF on older Pillow)
+except ImportError:
+    pass
+
+UPLOAD_PREFIX = os.environ.get("UPLOAD_PREFIX", "uploads/")
+VARIANT_PREFIX = os.environ.get("VARIANT_PREFIX", "variants/")
+MAX_WIDTH = int(os.environ.get("MAX_WIDTH", "2048"))
+QUALITY = {
+    "webp": int(os.environ.get("WEBP_QUALITY", "80")),
+    "avif": int(os.environ.get("AVIF_QUALITY", "50")),
+}
+PIL_FORMATS = {"webp": "WEBP", "avif": "AVIF"}
+IMAGE_EXTENSIONS = os.environ.get(
+    "IMAGE_EXTENSIONS", "jpg,jpeg,png,gif").split(",")
+
+_s3 = None
+
+
+def is_image(name, extensions=None):
+    """
+    Whether ``name`` ends in one of ``extensions``, in any case
+
+    >>> is_image("IMG_0001.JPG"), is_image("a.Jpeg"), is_image("jpg")
+    (True, True, False)
+    """
+    extension = os.path.splitext(name)[1].lower()[1:]
+    return extension in (extensions or IMAGE_EXTENSIONS)
+
+
+def formats():
+    """ Variant formats this Pillow can write """
+    Image.init()
+    return [extension for extension, name in sorted(PIL_FORMATS.items())
+            if name in Image.SAVE]
+
+
+def transform(data, max_width=MAX_WIDTH, quality=None, extensions=None):
+    """ ``{extension: bytes}`` of the variants smaller than ``data`` """
+    quality = dict(QUALITY, **(quality or {}))
+    image = Image.open(io.BytesIO(data))
+    if getattr(image, "is_animated", False):
+        return {}
+    image = ImageOps.exif_transpose(image)
+    if image.width > max_width:
+        image = image.resize(
+            (max_width, round(image.height * max_width / image.width)),
+            Image.LANCZOS)
+    if image.mode not in ("RGB", "RGBA"):
+        alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if alpha else "RGB")
+    variants = {}
+    for extension in extensions or formats():
+        out = io.BytesIO()
+        image.save(out, PIL_FORMATS[extension], quality=quality[extension])
+        if out.tell() < len(data):
+            variants[extension] = out.getvalue()
+    return variants
+
+
+def handler(event, context):
+    global _s3
+    if _s3 is None:
+        import boto3
+        _s3 = boto3.client("s3")
+    written = []
+    for record in event["Records"]:
+        bucket = record["s3"]["bucket"]["name"]
+        key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
+        if not key.startswith(UPLOAD_PREFIX) or not is_image(key):
+            continue
+        data = _s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+        for extension, body in transform(data).items():
+            variant = "{}{}.{}".format(
+                VARIANT_PREFIX, key[len(UPLOAD_PREFIX):], extension)
+            _s3.put_object(Bucket=bucket, Key=variant, Body=body,
+                           ContentType="image/" + extension)
+            written.append(variant)
+    print(written)
+    return written
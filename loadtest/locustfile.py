@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+WordPress traffic mix used by the loadtest stack and the local
+docker-compose stand-in.
+
+The mix approximates a content site: mostly anonymous page views, some
+searches, the occasional login and comment. Weights are the relative
+number of times each task is picked.
+
+The login task uses the WP_USER and WP_PASSWORD environment variables (the
+stack reads them from LoginSecretArn) and does nothing without them.
+"""
+
+import os
+import random
+
+from locust import HttpUser, between, task
+
+WP_USER = os.environ.get("WP_USER")
+WP_PASSWORD = os.environ.get("WP_PASSWORD")
+SEARCH_TERMS = ["hello", "world", "meetup", "cloudreach", "sceptre", "aws"]
+POST_IDS = [int(p) for p in os.environ.get("WP_POST_IDS", "1").split(",")]
+
+
+class WordpressVisitor(HttpUser):
+
+    wait_time = between(1, 5)
+
+    @task(6)
+    def browse(self):
+        self.client.get("/")
+        self.client.get("/?p={}".format(random.choice(POST_IDS)),
+                        name="/?p=[id]")
+
+    @task(2)
+    def search(self):
+        self.client.get("/?s={}".format(random.choice(SEARCH_TERMS)),
+                        name="/?s=[term]")
+
+    @task(1)
+    def login(self):
+        if not (WP_USER and WP_PASSWORD):
+            return
+        self.client.post("/wp-login.php", {
+            "log": WP_USER,
+            "pwd": WP_PASSWORD,
+            "wp-submit": "Log In",
+            "testcookie": "1",
+        }, name="/wp-login.php")
+
+    @task(1)
+    def comment(self):
+        post_id = random.choice(POST_IDS)
+        self.client.post("/wp-comments-post.php", {
+            "comment_post_ID": post_id,
+            "author": "loadtest",
+            "email": "loadtest@example.com",
+            "comment": "Load test comment {}".format(random.random()),
+        }, name="/wp-comments-post.php")
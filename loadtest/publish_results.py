@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Publish the aggregated row of a locust ``--csv`` stats file to CloudWatch.
+
+Usage: publish_results.py <prefix>_stats.csv <namespace> <stack-name>
+"""
+
+import csv
+import sys
+
+import boto3
+
+METRICS = [
+    ("Requests/s", "RequestsPerSecond", "Count/Second"),
+    ("Failures/s", "FailuresPerSecond", "Count/Second"),
+    ("50%", "LatencyP50", "Milliseconds"),
+    ("95%", "LatencyP95", "Milliseconds"),
+    ("99%", "LatencyP99", "Milliseconds"),
+]
+
+
+def aggregated_row(path):
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            if row["Name"] == "Aggregated":
+                return row
+    raise ValueError("no Aggregated row in {}".format(path))
+
+
+def metric_data(row, stack_name):
+    return [{
+        "MetricName": name,
+        "Dimensions": [{"Name": "StackName", "Value": stack_name}],
+        "Value": float(row[column] or 0),
+        "Unit": unit,
+    } for column, name, unit in METRICS]
+
+
+def main(argv):
+    path, namespace, stack_name = argv[1:4]
+    boto3.client("cloudwatch").put_metric_data(
+        Namespace=namespace,
+        MetricData=metric_data(aggregated_row(path), stack_name),
+    )
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+from setuptools import setup
+
+setup(
+    name="stack-output-cache",
+    version="0.1.0",
+    description="Cached !stack_output resolver for this sceptre project",
+    packages=["stack_output_cache"],
+    install_requires=["sceptre>=2.5,<3"],
+    entry_points={
+        "sceptre.resolvers": [
+            "cached_stack_output = "
+            "stack_output_cache.resolver:CachedStackOutput",
+        ],
+    },
+)
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+``!cached_stack_output``: sceptre's ``!stack_output`` with the outputs of
+each stack fetched once per run (see ``cache.OutputCache``).
+"""
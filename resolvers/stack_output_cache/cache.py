@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Stack outputs memoized per process and, optionally, on disk.
+
+Kept free of sceptre imports so the tools can exercise it offline.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+# Seconds outputs stay valid on disk; 0 (the default) keeps them in memory
+# only, which is always safe within one sceptre run
+TTL_VARIABLE = "SCEPTRE_STACK_OUTPUT_TTL"
+CACHE_FILE_VARIABLE = "SCEPTRE_STACK_OUTPUT_CACHE"
+DEFAULT_CACHE_FILE = os.path.join("build", "cache", "stack-outputs.json")
+
+
+class OutputCache(object):
+
+    """
+    ``{output key: value}`` of stacks, fetched at most once per process.
+
+    Lookups of a stack already being fetched by another thread wait for
+    that fetch instead of starting their own, so stacks launched in
+    parallel share one DescribeStacks call per dependency. With a ``ttl``,
+    outputs are also kept in ``cache_file`` for that many seconds and
+    later runs skip the call altogether.
+    """
+
+    def __init__(self, cache_file=None, ttl=0, clock=time.time):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.clock = clock
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._outputs = {}
+        self._pending = {}
+        self._disk = None
+
+    @classmethod
+    def from_environment(cls, environ=os.environ):
+        """ A cache configured by SCEPTRE_STACK_OUTPUT_TTL / _CACHE """
+        ttl = int(environ.get(TTL_VARIABLE) or 0)
+        return cls(environ.get(CACHE_FILE_VARIABLE, DEFAULT_CACHE_FILE)
+                   if ttl else None, ttl)
+
+    @staticmethod
+    def _disk_key(key):
+        return "|".join(part or "" for part in key)
+
+    def _read_disk(self):
+        if self._disk is None:
+            self._disk = {}
+            if self.cache_file and os.path.isfile(self.cache_file):
+                with open(self.cache_file) as f:
+                    self._disk = json.load(f)
+        return self._disk
+
+    def _from_disk(self, key):
+        if not self.cache_file:
+            return None
+        entry = self._read_disk().get(self._disk_key(key))
+        if entry and self.clock() - entry["fetched"] <= self.ttl:
+            return entry["outputs"]
+        return None
+
+    def _to_disk(self, key, outputs):
+        if not self.cache_file:
+            return
+        disk = self._read_disk()
+        disk[self._disk_key(key)] = {"fetched": self.clock(),
+                                     "outputs": outputs}
+        directory = os.path.dirname(self.cache_file)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.cache_file + ".tmp", "w") as f:
+            json.dump(disk, f, indent=2, sort_keys=True)
+        os.rename(self.cache_file + ".tmp", self.cache_file)
+
+    def get(self, stack_name, fetch, profile=None, region=None,
+            iam_role=None):
+        """
+        Outputs of ``stack_name``, calling ``fetch()`` only when neither
+        memory, the disk cache nor a concurrent lookup has them
+        """
+        key = (profile, region, iam_role, stack_name)
+        with self._lock:
+            if key in self._outputs:
+                return self._outputs[key]
+            outputs = self._from_disk(key)
+            if outputs is not None:
+                self._outputs[key] = outputs
+                return outputs
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return pending.result()
+
+        try:
+            outputs = fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            self.calls += 1
+            self._outputs[key] = outputs
+            del self._pending[key]
+            self._to_disk(key, outputs)
+        pending.set_result(outputs)
+        return outputs
+
+    def clear(self):
+        """ Forget the outputs held in memory """
+        with self._lock:
+            self._outputs.clear()
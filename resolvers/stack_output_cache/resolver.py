@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+from sceptre.resolvers.stack_output import StackOutput
+
+from stack_output_cache.cache import OutputCache
+
+CACHE = OutputCache.from_environment()
+
+
+class CachedStackOutput(StackOutput):
+    """
+    ``!stack_output`` that asks CloudFormation for each stack's outputs
+    once per run, however many parameters and stacks reference them.
+
+    :param argument: The Stack name and output name to get.
+    :type argument: str in the format ``"<stack name>::<output key>"``
+    """
+
+    def _get_stack_outputs(self, stack_name, profile=None, region=None,
+                           iam_role=None):
+        fetch = super(CachedStackOutput, self)._get_stack_outputs
+        return CACHE.get(
+            stack_name,
+            lambda: fetch(stack_name, profile, region, iam_role),
+            profile=profile, region=region, iam_role=iam_role)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Instance types the stacks accept and the CPU architecture of each.
+
+Graviton (arm64) families end in ``g``. EC2 instance types and RDS instance
+classes are listed per family; ``add_image`` gives a launch configuration the
+Ubuntu AMI matching its instance type parameter.
+"""
+
+from functools import lru_cache
+
+from troposphere import Equals, FindInMap, If, Parameter
+from constants import UBUNTU_AMI_PARAMETER, UBUNTU_RELEASE
+from base import ref
+
+# Architecture names as Ubuntu and its AMI parameters use them
+AMD64 = "amd64"
+ARM64 = "arm64"
+
+BURSTABLE_SIZES = ("micro", "small", "medium", "large", "xlarge", "2xlarge")
+GENERAL_SIZES = ("large", "xlarge", "2xlarge", "4xlarge")
+
+INSTANCE_FAMILIES = {
+    "t2": (AMD64, BURSTABLE_SIZES),
+    "t3": (AMD64, BURSTABLE_SIZES),
+    "t3a": (AMD64, BURSTABLE_SIZES),
+    "m5": (AMD64, GENERAL_SIZES),
+    "c5": (AMD64, GENERAL_SIZES),
+    "t4g": (ARM64, BURSTABLE_SIZES),
+    "m6g": (ARM64, GENERAL_SIZES),
+    "m7g": (ARM64, GENERAL_SIZES),
+    "c6g": (ARM64, GENERAL_SIZES),
+    "c7g": (ARM64, GENERAL_SIZES),
+}
+
+DB_INSTANCE_FAMILIES = {
+    "t2": (AMD64, BURSTABLE_SIZES),
+    "t3": (AMD64, BURSTABLE_SIZES),
+    "m5": (AMD64, GENERAL_SIZES),
+    "r5": (AMD64, GENERAL_SIZES),
+    "t4g": (ARM64, BURSTABLE_SIZES),
+    "m6g": (ARM64, GENERAL_SIZES),
+    "m7g": (ARM64, GENERAL_SIZES),
+    "r6g": (ARM64, GENERAL_SIZES),
+    "r7g": (ARM64, GENERAL_SIZES),
+}
+
+
+@lru_cache(maxsize=None)
+def instance_types(db=False):
+    """ Sorted EC2 instance types (RDS instance classes with ``db``) """
+    families, prefix = (DB_INSTANCE_FAMILIES, "db.") if db else \
+        (INSTANCE_FAMILIES, "")
+    return tuple(sorted(
+        "{}{}.{}".format(prefix, family, size)
+        for family, (_, sizes) in families.items() for size in sizes))
+
+
+@lru_cache(maxsize=None)
+def architecture(instance_type):
+    """
+    CPU architecture of an EC2 instance type or RDS instance class
+
+    >>> architecture("t4g.micro"), architecture("db.t2.micro")
+    ('arm64', 'amd64')
+    """
+    db = instance_type.startswith("db.")
+    if instance_type not in instance_types(db):
+        raise ValueError("{!r} is not one of the supported {} types".format(
+            instance_type, "DB instance" if db else "instance"))
+    families = DB_INSTANCE_FAMILIES if db else INSTANCE_FAMILIES
+    return families[instance_type.split(".")[-2]][0]
+
+
+@lru_cache(maxsize=None)
+def architecture_mapping():
+    """ AWSInstanceType2Arch mapping of every EC2 instance type """
+    return dict((instance_type, {"Arch": architecture(instance_type)})
+                for instance_type in instance_types())
+
+
+def image_parameter(arch):
+    """ Public SSM parameter of the current Ubuntu AMI for ``arch`` """
+    return UBUNTU_AMI_PARAMETER.format(
+        release=UBUNTU_RELEASE, architecture=arch)
+
+
+def add_image(template, instance_type, condition="UseArm64"):
+    """
+    Add the AMI parameters, the architecture mapping and ``condition`` (true
+    on arm64) to ``template`` and return the ImageId for ``instance_type``
+    (a parameter whose AllowedValues should be ``instance_types()``).
+    The AMI parameters default to Canonical's public parameters; point them
+    at parameters of your own to pin an image. Call it once per instance
+    type parameter, with a condition of its own, when a template launches
+    more than one kind of instance.
+    """
+    template.add_mapping("AWSInstanceType2Arch", architecture_mapping())
+    template.add_condition(condition, Equals(FindInMap(
+        "AWSInstanceType2Arch", ref(instance_type), "Arch"), ARM64))
+    images = {}
+    for arch in (AMD64, ARM64):
+        name = "ImageId" + arch.capitalize()
+        images[arch] = template.parameters.get(name) or \
+            template.add_parameter(Parameter(
+                name,
+                Type="AWS::SSM::Parameter::Value<AWS::EC2::Image::Id>",
+                Default=image_parameter(arch),
+                Description="SSM parameter holding the {} AMI".format(arch),
+            ))
+    return If(condition, ref(images[ARM64]), ref(images[AMD64]))
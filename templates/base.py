@@ -1,8 +1,133 @@
 #!/usr/bin/env python
-from troposphere import Template, Parameter
-from constants import *
+from functools import lru_cache
+from troposphere import Join, Parameter, Ref, Tags, Template
+from constants import PROJECT
 from abc import ABCMeta
 
+SERIALIZATIONS = ["pretty", "compact", "yaml"]
+
+
+def serialize(template, sceptre_user_data=None):
+    """
+    Template body in the format named by ``serialization`` in
+    sceptre_user_data: indented JSON (default), compact JSON or YAML
+    """
+    mode = (sceptre_user_data or {}).get("serialization", "pretty")
+    if mode == "pretty":
+        return template.to_json()
+    if mode == "compact":
+        return template.to_json(indent=None, separators=(",", ":"))
+    if mode == "yaml":
+        return template.to_yaml()
+    raise ValueError("serialization must be one of {}, not {!r}".format(
+        ", ".join(SERIALIZATIONS), mode))
+
+# Parameters declared the same way by every template that takes them
+SHARED_PARAMETERS = {
+    "Environment": dict(
+        Description="Value for Environment tag",
+        Type="String",
+        MinLength="1",
+        AllowedValues=["prod", "shared", "dev"]
+    ),
+    "Project": dict(
+        Type="String",
+        Description="Project Name",
+        MinLength="1",
+        MaxLength="255",
+        Default=PROJECT,
+        AllowedPattern="[\\x20-\\x7E]*",
+        ConstraintDescription="can contain only ASCII characters.",
+    ),
+    "VpcId": dict(
+        Description="VpcId",
+        Type="AWS::EC2::VPC::Id",
+    ),
+    "Subnet1": dict(
+        Type="AWS::EC2::Subnet::Id",
+        Description="Subnet1 ID",
+    ),
+    "Subnet2": dict(
+        Type="AWS::EC2::Subnet::Id",
+        Description="Subnet2 ID",
+    ),
+    "KeyName": dict(
+        ConstraintDescription="must be the name of an existing EC2 KeyPair.",
+        Type="AWS::EC2::KeyPair::KeyName",
+        Description=(
+            "Name of an existing EC2 KeyPair to enable SSH access to the "
+            "instances"),
+    ),
+    "DBName": dict(
+        Type="String",
+        Description="DB Name",
+        Default="mydb",
+        MinLength="1",
+        AllowedPattern="[a-zA-Z0-9]*",
+        MaxLength="64",
+        ConstraintDescription="Must be alphanumeric string",
+    ),
+    "DBUser": dict(
+        ConstraintDescription=(
+            "must begin with a letter and contain only alphanumeric "
+            "characters."),
+        Description="Username for MySQL database access",
+        MinLength="1",
+        AllowedPattern="[a-zA-Z][a-zA-Z0-9]*",
+        NoEcho=True,
+        MaxLength="80",
+        Type="String",
+    ),
+}
+
+# The factories below return objects shared by every template rendered in
+# the process; treat them as read-only.
+
+
+@lru_cache(maxsize=None)
+def shared_parameter(name):
+    """ Parameter ``name`` as declared in SHARED_PARAMETERS """
+    return Parameter(name, **SHARED_PARAMETERS[name])
+
+
+@lru_cache(maxsize=None)
+def _ref(name):
+    return Ref(name)
+
+
+def ref(target):
+    """ Interned Ref to a parameter, resource or pseudo parameter """
+    return _ref(target if isinstance(target, str) else target.title)
+
+
+@lru_cache(maxsize=None)
+def resource_name(*parts, project_first=True):
+    """
+    ``Project-part-...`` (or ``part-...-Project`` with
+    ``project_first=False``) as a Join on the Project parameter
+    """
+    if project_first:
+        return Join("-", [ref("Project")] + list(parts))
+    return Join("-", list(parts) + [ref("Project")])
+
+
+@lru_cache(maxsize=None)
+def standard_tags(*name, project_first=True, project=True, application=False,
+                  tags_class=Tags, **extra):
+    """
+    Name (see resource_name) and Environment tags, plus Project and the
+    stack name as Application when asked for, and any literal ``extra``
+    tags. ``tags_class`` is autoscaling.Tags for auto scaling groups.
+    """
+    tags = dict(extra)
+    tags["Name"] = resource_name(*name, project_first=project_first)
+    tags["Environment"] = ref("Environment")
+    if project:
+        tags["Project"] = ref("Project")
+    if application:
+        tags["Application"] = ref("AWS::StackName")
+    return tags_class(**tags)
+
 
 class CloudformationAbstractBaseClass:
 
@@ -18,20 +143,11 @@ class CloudformationAbstractBaseClass:
     def add_mandatory_tags(self):
         """ Add parameters for mandatory tags and naming policies """
 
-        self.Environment = self.template.add_parameter(Parameter(
-            "Environment",
-            Description="Value for Environment tag",
-            Type="String",
-            MinLength="1",
-            AllowedValues=["prod", "shared", "dev"]
-        ))
-        self.Project = self.template.add_parameter(Parameter(
-            "Project",
-            Type="String",
-            Description="Project Name",
-            MinLength="1",
-            MaxLength="255",
-            Default=PROJECT,
-            AllowedPattern="[\\x20-\\x7E]*",
-            ConstraintDescription="can contain only ASCII characters.",
-        ))
+        self.add_shared_parameters("Environment", "Project")
+
+    def add_shared_parameters(self, *names):
+        """ Add SHARED_PARAMETERS, each as an attribute of the same name """
+
+        for name in names:
+            setattr(self, name, self.template.add_parameter(
+                shared_parameter(name)))
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+Composable UserData builder.
+
+A bootstrap is a list of components. Each component is static shell text
+plus the apt packages it needs; anything stack specific (Refs, pseudo
+parameters) is passed in as shell variables set at the top of the script.
+Keeping the component text static means the component factories can be
+memoized across renders and the body can be gzipped, while the Refs stay
+in a small uncompressed header that CloudFormation resolves.
+
+A timed bootstrap (``UserData(timed=True)``) wraps the apt step and each
+component in ``phase_start``/``phase_end``. These print one line per phase::
+
+    BOOT_PHASE name=efs_mount start=1760000000.12 end=1760000004.87 status=0
+
+to the console and to PHASE_LOG. At the end, the durations are pushed as the
+PHASE_METRIC metric, with StackName and Phase dimensions and a ``total``
+phase. ``tools/boottime.py`` aggregates either the logs or the metrics.
+"""
+
+import base64
+import collections
+import gzip
+import io
+
+from functools import lru_cache
+
+from troposphere import Base64, Join
+
+# EC2 limit on raw (pre-base64) user data
+USERDATA_LIMIT = 16384
+# Bytes assumed for each resolved Ref when estimating the size
+REF_SIZE_ESTIMATE = 128
+ENV_FILE = "/etc/bootstrap.env"
+BOUNDARY = "==BOOTSTRAP=="
+
+CFN_BOOTSTRAP_URL = (
+    "https://s3.amazonaws.com/cloudformation-examples/"
+    "aws-cfn-bootstrap-py3-latest.tar.gz")
+WP_CLI_URL = (
+    "https://raw.githubusercontent.com/wp-cli/builds/gh-pages/phar/"
+    "wp-cli.phar")
+PHASE_LOG = "/var/log/boot-phases.log"
+PHASE_NAMESPACE = "Wordpress/Boot"
+PHASE_METRIC = "PhaseSeconds"
+EFS_MOUNT_OPTIONS = (
+    "nfsvers=4.1,rsize=1048576,wsize=1048576,hard,timeo=600,retrans=2")
+
+Component = collections.namedtuple(
+    "Component", ["name", "packages", "script"])
+
+# Both keep $? so that cfn-signal still reports the command before them
+PHASE_FUNCTIONS = "".join([
+    "phase_start() { local rc=$?; PHASE_START=$(date +%s.%N); return $rc; }\n",
+    "phase_end() {\n",
+    "  local rc=$?\n",
+    "  echo \"BOOT_PHASE name=$1 start=$PHASE_START end=$(date +%s.%N)",
+    " status=$rc\" | tee -a ", PHASE_LOG, "\n",
+    "  return $rc\n",
+    "}\n",
+])
+
+# One put-metric-data call with every phase and their total as JSON
+PHASE_METRICS = r"""aws cloudwatch put-metric-data --region ${AWS_REGION} \
+ --namespace %(namespace)s --metric-data "$(awk -v stack="${STACK_NAME}" '
+function metric(phase, seconds) {
+  printf "%%s{\"MetricName\":\"%(metric)s\",\"Unit\":\"Seconds\",", sep
+  printf "\"Value\":%%.3f,\"Dimensions\":[", seconds
+  printf "{\"Name\":\"StackName\",\"Value\":\"%%s\"},", stack
+  printf "{\"Name\":\"Phase\",\"Value\":\"%%s\"}]}", phase
+  sep = ","
+}
+BEGIN { printf "[" }
+$1 == "BOOT_PHASE" {
+  for (i = 2; i <= NF; i++) { split($i, kv, "="); f[kv[1]] = kv[2] }
+  metric(f["name"], f["end"] - f["start"])
+  if (first == "") first = f["start"]
+  last = f["end"]
+}
+END { if (first != "") metric("total", last - first); print "]" }
+' %(log)s)" || true
+""" % {"namespace": PHASE_NAMESPACE, "metric": PHASE_METRIC, "log": PHASE_LOG}
+
+
+@lru_cache(maxsize=None)
+def efs_mount(mount_point="/var/www/html/", options=EFS_MOUNT_OPTIONS):
+    """ Mount ${FILE_SYSTEM_ID} in the instance's AZ at ``mount_point`` """
+    return Component("efs_mount", ("nfs-common",), "".join([
+        "mkdir -p ", mount_point, "\n",
+        "EC2_AZ=$(curl -s http://169.254.169.254/latest/meta-data/placement/availability-zone)\n",
+        "echo \"$EC2_AZ.${FILE_SYSTEM_ID}.efs.${AWS_REGION}.amazonaws.com:/ ",
+        mount_point, " nfs4 ", options, " 0 0\" >> /etc/fstab\n",
+        "mount -a\n",
+    ]))
+
+
+@lru_cache(maxsize=None)
+def cfn_bootstrap():
+    """ Install the cfn-bootstrap helper scripts """
+    return Component("cfn_bootstrap", ("python3-pip",), "".join([
+        "pip3 install ", CFN_BOOTSTRAP_URL, "\n",
+    ]))
+
+
+@lru_cache(maxsize=None)
+def cfn_init(resource, config_sets):
+    """ Run ``config_sets`` of ``resource``; needs ``cfn_bootstrap`` first """
+    return Component("cfn_init", (), "".join([
+        "/usr/local/bin/cfn-init -v --stack ${STACK_NAME}",
+        " --resource ", resource,
+        " --configsets ", config_sets,
+        " --region ${AWS_REGION}\n",
+    ]))
+
+
+@lru_cache(maxsize=None)
+def wp_cli():
+    """ Download wp-cli to /usr/local/bin/wp """
+    return Component("wp_cli", (), "".join([
+        "/usr/bin/curl -O ", WP_CLI_URL, "\n",
+        "/bin/chmod +x wp-cli.phar\n",
+        "/bin/mv wp-cli.phar /usr/local/bin/wp\n",
+    ]))
+
+
+@lru_cache(maxsize=None)
+def wordpress_deploy(document_root="/var/www/html/"):
+    """
+    Move the unpacked release into place and install it with wp-cli; needs
+    ``wp_cli`` first
+    """
+    return Component("wordpress_deploy", (), "".join([
+        "/bin/mv ", document_root, "wordpress/* ", document_root, "\n",
+        "/bin/rm -f ", document_root, "index.html\n",
+        "/bin/rm -rf ", document_root, "wordpress/\n",
+        "chown www-data:www-data ", document_root, "* -R\n",
+        "/usr/sbin/service apache2 restart\n",
+        "cd ", document_root, "\n",
+        "if ! $(sudo -u www-data /usr/local/bin/wp core is-installed); then\n",
+        "sudo -u www-data /usr/local/bin/wp core install ",
+        "--url=\"${WP_URL}\" ",
+        "--title=\"${WP_TITLE}\" ",
+        "--admin_user='root' ",
+        "--admin_password='wordpress' ",
+        "--admin_email='meetup@cloudreach.com'\n",
+        "fi\n",
+    ]))
+
+
+@lru_cache(maxsize=None)
+def cfn_signal(message):
+    """ Signal ${WAIT_HANDLE} with the exit status of the last command """
+    return Component("cfn_signal", (), "".join([
+        "/usr/local/bin/cfn-signal -e $? --stack ${STACK_NAME}",
+        " -r \"", message, "\" \"${WAIT_HANDLE}\"\n",
+    ]))
+
+
+@lru_cache(maxsize=None)
+def run(name, command):
+    """ Component ``name`` running a single ``command`` """
+    return Component(name, (), command + "\n")
+
+
+def _minify(script):
+    """ Drop blank lines, comments and indentation from a shell script """
+    lines = (line.strip() for line in script.splitlines())
+    return "".join(line + "\n" for line in lines
+                   if line and not line.startswith("#"))
+
+
+def _timed(name, script):
+    return "phase_start\n" + script + "phase_end " + name + "\n"
+
+
+@lru_cache(maxsize=None)
+def _body(components, minify=False, timed=False):
+    """ Static script of ``components`` with their packages merged """
+    packages = []
+    for component in components:
+        packages.extend(p for p in component.packages if p not in packages)
+    apt = "apt-get update\n"
+    if packages:
+        apt += "apt-get install -y " + " ".join(packages) + "\n"
+    if timed:
+        lines = [PHASE_FUNCTIONS, _timed("apt", apt)]
+        lines.extend(_timed(component.name, component.script)
+                     for component in components)
+        lines.append(PHASE_METRICS)
+    else:
+        lines = [apt]
+        lines.extend(component.script for component in components)
+    body = "".join(lines)
+    return _minify(body) if minify else body
+
+
+@lru_cache(maxsize=None)
+def _gzip_base64(text):
+    """ Deterministic gzip so unchanged scripts render identical JSON """
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", mtime=0) as f:
+        f.write(text.encode("utf-8"))
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+class UserData(object):
+
+    """ Builds the UserData of a launch configuration from components """
+
+    def __init__(self, limit=USERDATA_LIMIT, minify=False, timed=False):
+        self.limit = limit
+        self.minify = minify
+        self.timed = timed
+        self.components = []
+        self.variables = collections.OrderedDict()
+
+    def add(self, *components):
+        """ Append components, skipping any already added """
+        names = [c.name for c in self.components]
+        for component in components:
+            if component.name not in names:
+                self.components.append(component)
+                names.append(component.name)
+        return self
+
+    def set(self, **variables):
+        """ Shell variables (literals or CFN functions) for the script """
+        self.variables.update(sorted(variables.items()))
+        return self
+
+    def _header(self):
+        parts = []
+        for name, value in self.variables.items():
+            parts.extend([name + "='", value, "'\n"])
+        return parts
+
+    def _plain(self):
+        return ["#!/bin/bash -x\n"] + self._header() + [
+            _body(tuple(self.components), self.minify, self.timed)]
+
+    def _multipart(self):
+        script = "".join([
+            "#!/bin/bash -x\n",
+            "set -a\n",
+            ". ", ENV_FILE, "\n",
+            "set +a\n",
+            _body(tuple(self.components), self.minify, self.timed),
+        ])
+        return [
+            "Content-Type: multipart/mixed; boundary=\"", BOUNDARY, "\"\n",
+            "MIME-Version: 1.0\n\n",
+            "--", BOUNDARY, "\n",
+            "Content-Type: text/x-shellscript\n\n",
+            "#!/bin/bash\n",
+            "cat > ", ENV_FILE, " <<'EOF'\n",
+        ] + self._header() + [
+            "EOF\n",
+            "--", BOUNDARY, "\n",
+            "Content-Type: application/x-gzip\n",
+            "Content-Transfer-Encoding: base64\n\n",
+            _gzip_base64(script), "\n",
+            "--", BOUNDARY, "--\n",
+        ]
+
+    @staticmethod
+    def _size(parts):
+        return sum(len(p.encode("utf-8")) if isinstance(p, str)
+                   else REF_SIZE_ESTIMATE for p in parts)
+
+    def size(self, compress=False):
+        """ Estimated raw size in bytes, allowing for resolved Refs """
+        return self._size(self._multipart() if compress else self._plain())
+
+    def to_base64(self, compress=None):
+        """
+        Base64 UserData for a launch configuration.
+
+        ``compress`` defaults to gzip + multipart only when the plain script
+        would not fit in the limit. Raises ValueError if neither fits.
+        """
+        if compress is None:
+            compress = self.size() > self.limit
+        parts = self._multipart() if compress else self._plain()
+        if self._size(parts) > self.limit:
+            raise ValueError("UserData is ~{} bytes, over the {} byte "
+                             "limit".format(self._size(parts), self.limit))
+        return Base64(Join("", parts))
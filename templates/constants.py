@@ -2,9 +2,19 @@
 
 PROJECT = "meetup-wp"
 
-UBUNTU_16_AMI = {
-    'eu-central-1':   {"AMI": 'ami-405f7226'},   # EU (Frankfurt)
-    'eu-west-1':      {"AMI": 'ami-405f7226'},   # EU (Ireland)
-    'us-east-1':      {"AMI": 'ami-f4cc1de2'},   # US East (N. Virginia)
-    'us-west-2':      {"AMI": 'ami-a58d0dc5'}    # US West (Oregon)
-}
+# Ubuntu LTS of the web and load test instances. Canonical publishes the
+# current AMI of each region and architecture as a public SSM parameter,
+# which CloudFormation resolves when the stack is deployed.
+UBUNTU_RELEASE = "22.04"
+UBUNTU_AMI_PARAMETER = (
+    "/aws/service/canonical/ubuntu/server/{release}/stable/current/"
+    "{architecture}/hvm/ebs-gp2/ami-id")
+
+# Media stack: the web servers copy uploaded images under MEDIA_UPLOAD_PREFIX
+# of its bucket, and its function writes their variants under
+# MEDIA_VARIANT_PREFIX as <upload path>.<format>, which Apache serves in
+# place of the original when the browser accepts the format.
+MEDIA_UPLOAD_PREFIX = "uploads/"
+MEDIA_VARIANT_PREFIX = "variants/"
+IMAGE_EXTENSIONS = ("jpg", "jpeg", "png", "gif")
+IMAGE_VARIANTS = ("avif", "webp")
@@ -1,11 +1,156 @@
 # -*- coding: utf-8 -*-
 
-from troposphere import Join, Output
-from troposphere import Parameter, Ref, Tags
-import troposphere.efs as efs
-import troposphere.ec2 as ec2
-from constants import *
-from base import CloudformationAbstractBaseClass
+from troposphere import Equals, GetAtt, If, Not, Output, Parameter
+from lazy import lazy_module
+from base import CloudformationAbstractBaseClass, ref, serialize, standard_tags
+
+awslambda = lazy_module("troposphere.awslambda")
+cloudformation = lazy_module("troposphere.cloudformation")
+efs = lazy_module("troposphere.efs")
+iam = lazy_module("troposphere.iam")
+stepfunctions = lazy_module("troposphere.stepfunctions")
+
+# Restores an AWS Backup recovery point of a file system to a new file
+# system and answers with its id; deleting the resource deletes that file
+# system. The function only starts the restore job: RestoreStateMachine
+# polls it, so a restore may take as long as the custom resource timeout
+# (an hour) rather than one Lambda invocation. The new file system keeps
+# the backed up one's encryption and gets ThroughputMode and the stack's
+# tags once restored.
+EFS_RESTORE_CODE = """\
+import json
+import time
+
+import boto3
+import cfnresponse
+
+backup = boto3.client("backup")
+efs = boto3.client("efs")
+stepfunctions = boto3.client("stepfunctions")
+
+
+def start(event, context):
+    properties = event["ResourceProperties"]
+    metadata = backup.get_recovery_point_restore_metadata(
+        BackupVaultName=properties["BackupVaultName"],
+        RecoveryPointArn=properties["RecoveryPointArn"])["RestoreMetadata"]
+    metadata.update({
+        "newFileSystem": "true",
+        "PerformanceMode": properties["PerformanceMode"],
+        "CreationToken": context.aws_request_id,
+    })
+    job = backup.start_restore_job(
+        RecoveryPointArn=properties["RecoveryPointArn"],
+        IamRoleArn=properties["RoleArn"],
+        ResourceType="EFS",
+        Metadata=metadata)["RestoreJobId"]
+    stepfunctions.start_execution(
+        stateMachineArn=properties["StateMachineArn"],
+        input=json.dumps({"RestoreJobId": job, "Event": event}))
+
+
+def configure(file_system_id, properties):
+    current = efs.describe_file_systems(
+        FileSystemId=file_system_id)["FileSystems"][0]
+    throughput = {"ThroughputMode": properties["ThroughputMode"]}
+    if properties["ThroughputMode"] == "provisioned":
+        throughput["ProvisionedThroughputInMibps"] = float(
+            properties["ProvisionedThroughput"])
+    if any(current.get(key) != value for key, value in throughput.items()):
+        efs.update_file_system(FileSystemId=file_system_id, **throughput)
+    efs.tag_resource(ResourceId=file_system_id, Tags=properties["Tags"])
+
+
+def poll(state, context):
+    event = state["Event"]
+    status = backup.describe_restore_job(RestoreJobId=state["RestoreJobId"])
+    if status["Status"] not in ("COMPLETED", "ABORTED", "FAILED"):
+        return dict(state, Done=False)
+    physical_id = event.get("PhysicalResourceId", "none")
+    try:
+        if status["Status"] != "COMPLETED":
+            raise RuntimeError(status.get("StatusMessage", status["Status"]))
+        physical_id = status["CreatedResourceArn"].split("/")[-1]
+        configure(physical_id, event["ResourceProperties"])
+        cfnresponse.send(event, context, cfnresponse.SUCCESS,
+                         {"FileSystemId": physical_id}, physical_id)
+    except Exception as e:
+        print(e)
+        cfnresponse.send(event, context, cfnresponse.FAILED, {}, physical_id)
+    return dict(state, Done=True)
+
+
+def delete(file_system_id):
+    for attempt in range(15):
+        try:
+            efs.delete_file_system(FileSystemId=file_system_id)
+            return
+        except efs.exceptions.FileSystemNotFound:
+            return
+        except efs.exceptions.FileSystemInUse:
+            time.sleep(15)
+    raise RuntimeError("{} is still in use".format(file_system_id))
+
+
+def restored(event):
+    old = event.get("OldResourceProperties", {})
+    new = event["ResourceProperties"]
+    return event["RequestType"] == "Update" and all(
+        old.get(key) == new[key]
+        for key in ("RecoveryPointArn", "PerformanceMode"))
+
+
+def handler(event, context):
+    if "RestoreJobId" in event:
+        return poll(event, context)
+    physical_id = event.get("PhysicalResourceId", "none")
+    try:
+        if restored(event):
+            configure(physical_id, event["ResourceProperties"])
+        elif event["RequestType"] in ("Create", "Update"):
+            # Answered by poll once the restore job has finished
+            return start(event, context)
+        elif physical_id.startswith("fs-"):
+            delete(physical_id)
+        cfnresponse.send(event, context, cfnresponse.SUCCESS,
+                         {"FileSystemId": physical_id}, physical_id)
+    except Exception as e:
+        print(e)
+        cfnresponse.send(event, context, cfnresponse.FAILED, {}, physical_id)
+"""
+
+# Polls the restore job through RestoreFunction every RESTORE_POLL_SECONDS
+# until the function has answered CloudFormation
+RESTORE_POLL_SECONDS = 30
+RESTORE_STATE_MACHINE = {
+    "StartAt": "Poll",
+    "States": {
+        "Poll": {
+            "Type": "Task",
+            "Resource": "arn:aws:states:::lambda:invoke",
+            "Parameters": {
+                "FunctionName": "${RestoreFunctionArn}",
+                "Payload.$": "$",
+            },
+            "OutputPath": "$.Payload",
+            "Retry": [{"ErrorEquals": ["States.ALL"], "MaxAttempts": 3}],
+            "Next": "Finished",
+        },
+        "Finished": {
+            "Type": "Choice",
+            "Choices": [
+                {"Variable": "$.Done", "BooleanEquals": True, "Next": "Done"},
+            ],
+            "Default": "Wait",
+        },
+        "Wait": {
+            "Type": "Wait",
+            "Seconds": RESTORE_POLL_SECONDS,
+            "Next": "Poll",
+        },
+        "Done": {"Type": "Succeed"},
+    },
+}
 
 
 class Efs(CloudformationAbstractBaseClass):
@@ -14,6 +159,7 @@ class Efs(CloudformationAbstractBaseClass):
         super(self.__class__, self).__init__()
         self.template.set_description("""Wordpress EFS""")
         self.add_parameters()
+        self.add_conditions()
         self.add_resources()
         self.add_outputs()
 
@@ -21,23 +167,7 @@ class Efs(CloudformationAbstractBaseClass):
 
         t = self.template
 
-        self.VpcId = t.add_parameter(Parameter(
-            "VpcId",
-            Description="VpcId",
-            Type="AWS::EC2::VPC::Id",
-        ))
-
-        self.Subnet1 = t.add_parameter(Parameter(
-            "Subnet1",
-            Type="AWS::EC2::Subnet::Id",
-            Description="Subnet1 ID",
-        ))
-
-        self.Subnet2 = t.add_parameter(Parameter(
-            "Subnet2",
-            Type="AWS::EC2::Subnet::Id",
-            Description="Subnet2 ID",
-        ))
+        self.add_shared_parameters("VpcId", "Subnet1", "Subnet2")
 
         self.EfsSecurityGroup = t.add_parameter(Parameter(
             "EfsSecurityGroup",
@@ -53,58 +183,311 @@ class Efs(CloudformationAbstractBaseClass):
             AllowedValues=["generalPurpose", "maxIO"],
         ))
 
+        self.ThroughputMode = t.add_parameter(Parameter(
+            "ThroughputMode",
+            Type="String",
+            Default="bursting",
+            Description="EFS ThroughputMode",
+            AllowedValues=["bursting", "elastic", "provisioned"],
+        ))
+
+        self.BackupRecoveryPoint = t.add_parameter(Parameter(
+            "BackupRecoveryPoint",
+            Type="String",
+            Default="",
+            Description=(
+                "ARN of an AWS Backup recovery point of a Wordpress file "
+                "system to start from; blank for an empty file system. "
+                "Changing it replaces the file system."),
+        ))
+
+        self.BackupVaultName = t.add_parameter(Parameter(
+            "BackupVaultName",
+            Type="String",
+            Default="Default",
+            Description="Backup vault of BackupRecoveryPoint",
+        ))
+
+        self.ProvisionedThroughput = t.add_parameter(Parameter(
+            "ProvisionedThroughput",
+            Type="Number",
+            Default="1",
+            Description="MiB/s, with ThroughputMode provisioned",
+            MinValue="1",
+        ))
+
+        self.ReplicaRegion = t.add_parameter(Parameter(
+            "ReplicaRegion",
+            Type="String",
+            Default="",
+            Description="Region to replicate the file system to; blank for "
+                        "none",
+        ))
+
+        self.ReplicaFileSystemId = t.add_parameter(Parameter(
+            "ReplicaFileSystemId",
+            Type="String",
+            Default="",
+            Description="File system in ReplicaRegion to replicate to, "
+                        "created with ReplicationTarget true",
+        ))
+
+        self.ReplicationTarget = t.add_parameter(Parameter(
+            "ReplicationTarget",
+            Default="false",
+            ConstraintDescription="must be either true or false.",
+            Type="String",
+            Description="Let another region's file system replicate over "
+                        "this one, which is read-only while it does",
+            AllowedValues=["true", "false"],
+        ))
+
+    def add_conditions(self):
+        self.template.add_condition(
+            "FromBackup", Not(Equals(ref(self.BackupRecoveryPoint), "")))
+        self.template.add_condition(
+            "NewFileSystem", Equals(ref(self.BackupRecoveryPoint), ""))
+        self.template.add_condition(
+            "UseProvisionedThroughput",
+            Equals(ref(self.ThroughputMode), "provisioned"))
+        self.template.add_condition(
+            "Replicate", Not(Equals(ref(self.ReplicaRegion), "")))
+        self.template.add_condition(
+            "IsReplicationTarget", Equals(ref(self.ReplicationTarget), "true"))
+
     def add_resources(self):
 
         t = self.template
 
         self.FileSystem = t.add_resource(efs.FileSystem(
             "FileSystem",
-            PerformanceMode=Ref(self.PerformanceMode),
-            FileSystemTags=Tags(
-                Name=Join("-", [Ref(self.Project), "efs"]),
-                Environment=Ref(self.Environment),
-                Project=Ref(self.Project),
-            )
+            Condition="NewFileSystem",
+            PerformanceMode=ref(self.PerformanceMode),
+            ThroughputMode=ref(self.ThroughputMode),
+            ProvisionedThroughputInMibps=If(
+                "UseProvisionedThroughput", ref(self.ProvisionedThroughput),
+                ref("AWS::NoValue")),
+            ReplicationConfiguration=If(
+                "Replicate",
+                efs.ReplicationConfiguration(Destinations=[
+                    efs.ReplicationDestination(
+                        Region=ref(self.ReplicaRegion),
+                        FileSystemId=ref(self.ReplicaFileSystemId),
+                    ),
+                ]),
+                ref("AWS::NoValue")),
+            FileSystemProtection=If(
+                "IsReplicationTarget",
+                efs.FileSystemProtection(
+                    ReplicationOverwriteProtection="DISABLED"),
+                ref("AWS::NoValue")),
+            FileSystemTags=standard_tags("efs")
         ))
 
+        self.add_restore()
+        self.FileSystemId = If(
+            "FromBackup", GetAtt(self.RestoredFileSystem, "FileSystemId"),
+            ref(self.FileSystem))
+
         self.MountTarget1 = t.add_resource(efs.MountTarget(
             "MountTarget1",
-            SubnetId=Ref(self.Subnet1),
-            FileSystemId=Ref(self.FileSystem),
-            SecurityGroups=[Ref(self.EfsSecurityGroup)],
+            SubnetId=ref(self.Subnet1),
+            FileSystemId=self.FileSystemId,
+            SecurityGroups=[ref(self.EfsSecurityGroup)],
         ))
 
         self.MountTarget2 = t.add_resource(efs.MountTarget(
             "MountTarget2",
-            SubnetId=Ref(self.Subnet2),
-            FileSystemId=Ref(self.FileSystem),
-            SecurityGroups=[Ref(self.EfsSecurityGroup)],
+            SubnetId=ref(self.Subnet2),
+            FileSystemId=self.FileSystemId,
+            SecurityGroups=[ref(self.EfsSecurityGroup)],
+        ))
+
+    def add_restore(self):
+        """
+        With a BackupRecoveryPoint, a custom resource restores it to a new
+        file system in place of FileSystem (CloudFormation cannot create a
+        file system from a backup). RestoreStateMachine waits for the
+        restore job.
+        """
+
+        t = self.template
+
+        self.RestoreRole = t.add_resource(iam.Role(
+            "RestoreRole",
+            Condition="FromBackup",
+            ManagedPolicyArns=[
+                "arn:aws:iam::aws:policy/service-role/"
+                "AWSBackupServiceRolePolicyForRestores",
+            ],
+            AssumeRolePolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Action": ["sts:AssumeRole"],
+                        "Effect": "Allow",
+                        "Principal": {"Service": ["backup.amazonaws.com"]}
+                    }
+                ]
+            }
+        ))
+
+        self.RestoreFunctionRole = t.add_resource(iam.Role(
+            "RestoreFunctionRole",
+            Condition="FromBackup",
+            ManagedPolicyArns=[
+                "arn:aws:iam::aws:policy/service-role/"
+                "AWSLambdaBasicExecutionRole",
+            ],
+            Policies=[iam.Policy(
+                PolicyName="efs-restore",
+                PolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Action": [
+                                "backup:DescribeRestoreJob",
+                                "backup:GetRecoveryPointRestoreMetadata",
+                                "backup:StartRestoreJob",
+                                "elasticfilesystem:DeleteFileSystem",
+                                "elasticfilesystem:DescribeFileSystems",
+                                "elasticfilesystem:TagResource",
+                                "elasticfilesystem:UpdateFileSystem",
+                            ],
+                            "Effect": "Allow",
+                            "Resource": ["*"]
+                        },
+                        {
+                            "Action": ["iam:PassRole"],
+                            "Effect": "Allow",
+                            "Resource": [GetAtt(self.RestoreRole, "Arn")]
+                        }
+                    ]
+                },
+            )],
+            AssumeRolePolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Action": ["sts:AssumeRole"],
+                        "Effect": "Allow",
+                        "Principal": {"Service": ["lambda.amazonaws.com"]}
+                    }
+                ]
+            }
+        ))
+
+        self.RestoreFunction = t.add_resource(awslambda.Function(
+            "RestoreFunction",
+            Condition="FromBackup",
+            Description="Restores the Wordpress file system from a backup",
+            Runtime="python3.12",
+            Handler="index.handler",
+            Timeout=300,
+            MemorySize=128,
+            Role=GetAtt(self.RestoreFunctionRole, "Arn"),
+            Code=awslambda.Code(ZipFile=EFS_RESTORE_CODE),
+            Tags=standard_tags("efs", "restore"),
         ))
 
+        self.RestoreStateMachineRole = t.add_resource(iam.Role(
+            "RestoreStateMachineRole",
+            Condition="FromBackup",
+            Policies=[iam.Policy(
+                PolicyName="efs-restore-poll",
+                PolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Action": ["lambda:InvokeFunction"],
+                            "Effect": "Allow",
+                            "Resource": [GetAtt(self.RestoreFunction, "Arn")]
+                        }
+                    ]
+                },
+            )],
+            AssumeRolePolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Action": ["sts:AssumeRole"],
+                        "Effect": "Allow",
+                        "Principal": {"Service": ["states.amazonaws.com"]}
+                    }
+                ]
+            }
+        ))
+
+        self.RestoreStateMachine = t.add_resource(stepfunctions.StateMachine(
+            "RestoreStateMachine",
+            Condition="FromBackup",
+            RoleArn=GetAtt(self.RestoreStateMachineRole, "Arn"),
+            Definition=RESTORE_STATE_MACHINE,
+            DefinitionSubstitutions={
+                "RestoreFunctionArn": GetAtt(self.RestoreFunction, "Arn"),
+            },
+        ))
+
+        # A policy of its own: the state machine already depends on the
+        # function and so on its role
+        self.RestoreStartPolicy = t.add_resource(iam.PolicyType(
+            "RestoreStartPolicy",
+            Condition="FromBackup",
+            PolicyName="efs-restore-start",
+            Roles=[ref(self.RestoreFunctionRole)],
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Action": ["states:StartExecution"],
+                        "Effect": "Allow",
+                        "Resource": [ref(self.RestoreStateMachine)]
+                    }
+                ]
+            },
+        ))
+
+        self.RestoredFileSystem = t.add_resource(
+            cloudformation.CustomResource(
+                "RestoredFileSystem",
+                Condition="FromBackup",
+                DependsOn=[self.RestoreStartPolicy],
+                ServiceToken=GetAtt(self.RestoreFunction, "Arn"),
+                StateMachineArn=ref(self.RestoreStateMachine),
+                RecoveryPointArn=ref(self.BackupRecoveryPoint),
+                BackupVaultName=ref(self.BackupVaultName),
+                RoleArn=GetAtt(self.RestoreRole, "Arn"),
+                PerformanceMode=ref(self.PerformanceMode),
+                ThroughputMode=ref(self.ThroughputMode),
+                ProvisionedThroughput=ref(self.ProvisionedThroughput),
+                Tags=standard_tags("efs"),
+            ))
+
     def add_outputs(self):
         t = self.template
 
         t.add_output(Output(
             "MountTarget1",
             Description="Mount target 1",
-            Value=Ref(self.MountTarget1),
+            Value=ref(self.MountTarget1),
         ))
 
         t.add_output(Output(
             "MountTarget2",
             Description="Mount target 2",
-            Value=Ref(self.MountTarget2),
+            Value=ref(self.MountTarget2),
         ))
 
         t.add_output(Output(
             "FileSystemID",
             Description="File system ID",
-            Value=Ref(self.FileSystem),
+            Value=self.FileSystemId,
         ))
 
 
 def sceptre_handler(sceptre_user_data):
-    return Efs(sceptre_user_data).template.to_json()
+    return serialize(
+        Efs(sceptre_user_data).template, sceptre_user_data)
 
 if __name__ == '__main__':
     print (sceptre_handler())
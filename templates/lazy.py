@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Deferred imports for troposphere resource modules.
+
+``ec2 = lazy_module("troposphere.ec2")`` behaves like
+``import troposphere.ec2 as ec2`` except that the module is only imported
+when one of its attributes is first used, so importing a template (which
+sceptre does for every command) does not pay for modules it never touches.
+"""
+
+import importlib
+
+
+class lazy_module(object):
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        # Cache on the instance so later lookups skip __getattr__
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return "<lazy module '{}'>".format(self._name)
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from troposphere import Base64, Equals, GetAtt, If, Join, Not, Output
+from troposphere import Parameter
+from lazy import lazy_module
+from base import CloudformationAbstractBaseClass, ref, resource_name
+from base import serialize, standard_tags
+import architectures
+
+ec2 = lazy_module("troposphere.ec2")
+iam = lazy_module("troposphere.iam")
+s3 = lazy_module("troposphere.s3")
+autoscaling = lazy_module("troposphere.autoscaling")
+
+LOADTEST_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "loadtest")
+
+
+def read_loadtest_file(name):
+    with open(os.path.join(LOADTEST_DIR, name)) as f:
+        return f.read()
+
+
+class LoadTest(CloudformationAbstractBaseClass):
+
+    def __init__(self, sceptre_user_data):
+        super(self.__class__, self).__init__()
+        self.template.set_description("""Wordpress load test generators""")
+        self.add_parameters()
+        self.add_mapping()
+        self.add_conditions()
+        self.add_resources()
+        self.add_outputs()
+
+    def add_mapping(self):
+        self.ImageId = architectures.add_image(
+            self.template, self.InstanceType)
+
+    def add_conditions(self):
+        self.template.add_condition(
+            "UseSsh", Not(Equals(ref(self.SshCidr), "")))
+        self.template.add_condition(
+            "UseLogin", Not(Equals(ref(self.LoginSecretArn), "")))
+
+    def add_parameters(self):
+
+        t = self.template
+
+        self.add_shared_parameters("VpcId", "Subnet1", "Subnet2", "KeyName")
+
+        self.TargetHost = t.add_parameter(Parameter(
+            "TargetHost",
+            Type="String",
+            Description="DNS name of the load balancer under test",
+            AllowedPattern="[\\x20-\\x7E]*",
+            ConstraintDescription="can contain only ASCII characters.",
+        ))
+
+        self.InstanceType = t.add_parameter(Parameter(
+            "InstanceType",
+            Default="t2.medium",
+            AllowedValues=list(architectures.instance_types()),
+            ConstraintDescription="must be a supported EC2 instance type.",
+            Type="String",
+            Description="Generator instance type",
+        ))
+
+        self.GeneratorCount = t.add_parameter(Parameter(
+            "GeneratorCount",
+            Description="The number of load generator instances",
+            Default="1",
+            Type="Number",
+            MaxValue="10",
+            MinValue="0",
+            ConstraintDescription="must be between 0 and 10 EC2 instances.",
+        ))
+
+        self.Users = t.add_parameter(Parameter(
+            "Users",
+            Description="Concurrent simulated users per generator",
+            Default="50",
+            Type="Number",
+            MinValue="1",
+        ))
+
+        self.SpawnRate = t.add_parameter(Parameter(
+            "SpawnRate",
+            Description="Simulated users started per second per generator",
+            Default="5",
+            Type="Number",
+            MinValue="1",
+        ))
+
+        self.Duration = t.add_parameter(Parameter(
+            "Duration",
+            Description="Run time of the test, e.g. 10m or 1h",
+            Default="10m",
+            Type="String",
+            AllowedPattern="\\d+[smh]",
+            ConstraintDescription="Must be a number followed by s, m or h",
+        ))
+
+        self.ResultsRetention = t.add_parameter(Parameter(
+            "ResultsRetention",
+            Default="30",
+            Type="Number",
+            Description="Days to keep the test results",
+            MinValue="1",
+        ))
+
+        self.SshCidr = t.add_parameter(Parameter(
+            "SshCidr",
+            Description="Network allowed to SSH to the generators; empty "
+                        "allows none",
+            Default="",
+            Type="String",
+            AllowedPattern="^((\\d{1,3}\\.){3}\\d{1,3}/\\d{1,2})?$",
+            ConstraintDescription="must be empty or an IPv4 CIDR",
+        ))
+
+        self.LoginSecretArn = t.add_parameter(Parameter(
+            "LoginSecretArn",
+            Description="Secrets Manager secret with the username and "
+                        "password the login task uses; empty skips logins",
+            Default="",
+            Type="String",
+        ))
+
+        self.MetricNamespace = t.add_parameter(Parameter(
+            "MetricNamespace",
+            Description="CloudWatch namespace for the test results",
+            Default="WordpressLoadTest",
+            Type="String",
+        ))
+
+    def add_resources(self):
+
+        t = self.template
+
+        # Kept on stack deletion; the lifecycle rule empties it
+        self.ResultsBucket = t.add_resource(s3.Bucket(
+            "ResultsBucket",
+            DeletionPolicy="Retain",
+            LifecycleConfiguration=s3.LifecycleConfiguration(Rules=[
+                s3.LifecycleRule(
+                    Id="expire-results",
+                    Status="Enabled",
+                    ExpirationInDays=ref(self.ResultsRetention),
+                ),
+            ]),
+            Tags=standard_tags("loadtest"),
+        ))
+
+        self.GeneratorSecurityGroup = t.add_resource(ec2.SecurityGroup(
+            "GeneratorSecurityGroup",
+            SecurityGroupIngress=If("UseSsh", [
+                {"ToPort": "22", "IpProtocol": "tcp",
+                    "CidrIp": ref(self.SshCidr), "FromPort": "22"}
+            ], ref("AWS::NoValue")),
+            VpcId=ref(self.VpcId),
+            GroupDescription=resource_name("loadtest", "sg"),
+            Tags=standard_tags("loadtest", "sg")
+        ))
+
+        self.GeneratorRole = t.add_resource(iam.Role(
+            "GeneratorRole",
+            Policies=[iam.Policy(
+                PolicyName="loadtest-results",
+                PolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Action": ["s3:PutObject"],
+                            "Effect": "Allow",
+                            "Resource": [Join("", [
+                                GetAtt(self.ResultsBucket, "Arn"), "/*"])]
+                        },
+                        {
+                            "Action": ["cloudwatch:PutMetricData"],
+                            "Effect": "Allow",
+                            "Resource": ["*"]
+                        },
+                        # Each generator takes itself out when its run is
+                        # over, so the group ends at zero
+                        {
+                            "Action": [
+                                "autoscaling:TerminateInstanceInAutoScalingGroup"],
+                            "Effect": "Allow",
+                            "Resource": ["*"],
+                            "Condition": {"StringEquals": {
+                                "autoscaling:ResourceTag/aws:cloudformation:stack-name":
+                                    ref("AWS::StackName")}}
+                        },
+                        If("UseLogin", {
+                            "Action": ["secretsmanager:GetSecretValue"],
+                            "Effect": "Allow",
+                            "Resource": [ref(self.LoginSecretArn)]
+                        }, ref("AWS::NoValue"))
+                    ]
+                },
+            )],
+            AssumeRolePolicyDocument={
+                "Version": "2008-10-17",
+                "Statement": [
+                    {
+                        "Action": ["sts:AssumeRole"],
+                        "Effect": "Allow",
+                        "Principal": {"Service": ["ec2.amazonaws.com"]}
+                    }
+                ]
+            }
+        ))
+
+        self.GeneratorProfile = t.add_resource(iam.InstanceProfile(
+            "GeneratorProfile",
+            Roles=[ref(self.GeneratorRole)]
+        ))
+
+        metadata = {
+            "AWS::CloudFormation::Init": {
+                "configSets": {
+                    "loadtest_install": [
+                        "install_loadtest"]
+                },
+                "install_loadtest": {
+                    "files": {
+                        "/opt/loadtest/locustfile.py": {
+                            "content": read_loadtest_file("locustfile.py"),
+                            "mode": "000644",
+                            "owner": "root",
+                            "group": "root"
+                        },
+                        "/opt/loadtest/publish_results.py": {
+                            "content": read_loadtest_file(
+                                "publish_results.py"),
+                            "mode": "000755",
+                            "owner": "root",
+                            "group": "root"
+                        }
+                    }
+                }
+            }
+        }
+
+        self.GeneratorLaunchConfiguration = t.add_resource(autoscaling.LaunchConfiguration(
+            "GeneratorLaunchConfiguration",
+            Metadata=metadata,
+            UserData=Base64(Join("", [
+                "#!/bin/bash -x\n",
+                "apt-get update\n",
+                "apt-get install python3-pip awscli -y\n",
+                "pip3 install https://s3.amazonaws.com/cloudformation-examples/aws-cfn-bootstrap-py3-latest.tar.gz\n",
+                "pip3 install locust boto3\n",
+                "/usr/local/bin/cfn-init -v  --stack ", ref("AWS::StackName"),
+                "         --resource GeneratorLaunchConfiguration ",
+                "         --configsets loadtest_install ",
+                "         --region ", ref("AWS::Region"),
+                "\n",
+                "INSTANCE_ID=$(curl -s http://169.254.169.254/latest/meta-data/instance-id)\n",
+                "SECRET_ARN='", ref(self.LoginSecretArn), "'\n",
+                "if [ -n \"$SECRET_ARN\" ]; then\n",
+                "  set +x\n",
+                "  SECRET=$(aws secretsmanager get-secret-value --secret-id $SECRET_ARN"
+                " --region $(echo $SECRET_ARN | cut -d: -f4)"
+                " --query SecretString --output text)\n",
+                "  export WP_USER=$(echo \"$SECRET\" | python3 -c 'import json, sys; print(json.load(sys.stdin)[\"username\"])')\n",
+                "  export WP_PASSWORD=$(echo \"$SECRET\" | python3 -c 'import json, sys; print(json.load(sys.stdin)[\"password\"])')\n",
+                "  set -x\n",
+                "fi\n",
+                "mkdir -p /opt/loadtest/results\n",
+                "cd /opt/loadtest\n",
+                "locust -f locustfile.py --headless",
+                " --host http://", ref(self.TargetHost),
+                " -u ", ref(self.Users),
+                " -r ", ref(self.SpawnRate),
+                " -t ", ref(self.Duration),
+                " --csv results/$INSTANCE_ID\n",
+                "aws s3 cp --recursive results/ s3://",
+                ref(self.ResultsBucket),
+                "/", ref("AWS::StackName"), "/$(date +%Y%m%dT%H%M%S)/",
+                " --region ", ref("AWS::Region"), "\n",
+                "AWS_DEFAULT_REGION=", ref("AWS::Region"),
+                " python3 publish_results.py results/${INSTANCE_ID}_stats.csv ",
+                ref(self.MetricNamespace), " ", ref("AWS::StackName"), "\n",
+                "aws autoscaling terminate-instance-in-auto-scaling-group",
+                " --instance-id $INSTANCE_ID --should-decrement-desired-capacity",
+                " --region ", ref("AWS::Region"), "\n",
+            ])),
+            ImageId=self.ImageId,
+            KeyName=ref(self.KeyName),
+            SecurityGroups=[ref(self.GeneratorSecurityGroup)],
+            InstanceType=ref(self.InstanceType),
+            IamInstanceProfile=ref(self.GeneratorProfile),
+            AssociatePublicIpAddress=True,
+        ))
+
+        self.GeneratorAutoScalingGroup = t.add_resource(autoscaling.AutoScalingGroup(
+            "GeneratorAutoScalingGroup",
+            MinSize="0",
+            DesiredCapacity=ref(self.GeneratorCount),
+            MaxSize=ref(self.GeneratorCount),
+            VPCZoneIdentifier=[ref(self.Subnet1), ref(self.Subnet2)],
+            Tags=standard_tags("loadtest", "asg", tags_class=autoscaling.Tags),
+            LaunchConfigurationName=ref(self.GeneratorLaunchConfiguration),
+        ))
+
+    def add_outputs(self):
+
+        self.out = self.template.add_output([
+            Output("ResultsBucket", Value=ref(self.ResultsBucket)),
+            Output("MetricNamespace", Value=ref(self.MetricNamespace)),
+        ])
+
+
+def sceptre_handler(sceptre_user_data):
+    return serialize(
+        LoadTest(sceptre_user_data).template, sceptre_user_data)
+
+if __name__ == '__main__':
+    print (sceptre_handler())
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from troposphere import GetAtt, Join, Output, Parameter
+from lazy import lazy_module
+from base import CloudformationAbstractBaseClass, ref, serialize
+from base import standard_tags
+from constants import IMAGE_EXTENSIONS, MEDIA_UPLOAD_PREFIX
+from constants import MEDIA_VARIANT_PREFIX
+
+awslambda = lazy_module("troposphere.awslambda")
+iam = lazy_module("troposphere.iam")
+s3 = lazy_module("troposphere.s3")
+
+IMAGES_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "images")
+
+
+def read_transform_code():
+    with open(os.path.join(IMAGES_DIR, "transform.py")) as f:
+        return f.read()
+
+
+class Media(CloudformationAbstractBaseClass):
+
+    def __init__(self, sceptre_user_data):
+        super(self.__class__, self).__init__()
+        self.template.set_description("""Wordpress image variants""")
+        self.add_parameters()
+        self.add_resources()
+        self.add_outputs()
+
+    def add_parameters(self):
+
+        t = self.template
+
+        self.ImageLayerArn = t.add_parameter(Parameter(
+            "ImageLayerArn",
+            Type="String",
+            Description="Lambda layer providing Pillow (with AVIF) for "
+                        "python3.12",
+            MinLength="1",
+        ))
+
+        self.MaxWidth = t.add_parameter(Parameter(
+            "MaxWidth",
+            Description="Variants wider than this are scaled down (px)",
+            Default="2048",
+            Type="Number",
+            MinValue="320",
+        ))
+
+        self.WebpQuality = t.add_parameter(Parameter(
+            "WebpQuality",
+            Default="80",
+            Type="Number",
+            MinValue="1",
+            MaxValue="100",
+        ))
+
+        self.AvifQuality = t.add_parameter(Parameter(
+            "AvifQuality",
+            Default="50",
+            Type="Number",
+            MinValue="1",
+            MaxValue="100",
+        ))
+
+    def add_resources(self):
+
+        t = self.template
+
+        self.ImageFunctionRole = t.add_resource(iam.Role(
+            "ImageFunctionRole",
+            ManagedPolicyArns=[
+                "arn:aws:iam::aws:policy/service-role/"
+                "AWSLambdaBasicExecutionRole",
+            ],
+            AssumeRolePolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Action": ["sts:AssumeRole"],
+                        "Effect": "Allow",
+                        "Principal": {"Service": ["lambda.amazonaws.com"]}
+                    }
+                ]
+            }
+        ))
+
+        self.ImageFunction = t.add_resource(awslambda.Function(
+            "ImageFunction",
+            Description="Writes WebP and AVIF variants of uploaded images",
+            Runtime="python3.12",
+            Handler="index.handler",
+            Timeout=60,
+            MemorySize=1024,
+            Role=GetAtt(self.ImageFunctionRole, "Arn"),
+            Layers=[ref(self.ImageLayerArn)],
+            Code=awslambda.Code(ZipFile=read_transform_code()),
+            Environment=awslambda.Environment(Variables={
+                "UPLOAD_PREFIX": MEDIA_UPLOAD_PREFIX,
+                "VARIANT_PREFIX": MEDIA_VARIANT_PREFIX,
+                "IMAGE_EXTENSIONS": ",".join(IMAGE_EXTENSIONS),
+                "MAX_WIDTH": ref(self.MaxWidth),
+                "WEBP_QUALITY": ref(self.WebpQuality),
+                "AVIF_QUALITY": ref(self.AvifQuality),
+            }),
+            Tags=standard_tags("media", "images"),
+        ))
+
+        # Scoped to the account rather than the bucket ARN, which would make
+        # the bucket and the permission depend on each other
+        self.ImageFunctionPermission = t.add_resource(awslambda.Permission(
+            "ImageFunctionPermission",
+            Action="lambda:InvokeFunction",
+            FunctionName=ref(self.ImageFunction),
+            Principal="s3.amazonaws.com",
+            SourceAccount=ref("AWS::AccountId"),
+        ))
+
+        # Only uploads trigger the function, so its variants do not
+        self.MediaBucket = t.add_resource(s3.Bucket(
+            "MediaBucket",
+            DependsOn=[self.ImageFunctionPermission],
+            PublicAccessBlockConfiguration=s3.PublicAccessBlockConfiguration(
+                BlockPublicAcls=True,
+                BlockPublicPolicy=True,
+                IgnorePublicAcls=True,
+                RestrictPublicBuckets=True,
+            ),
+            # Suffix filters are case sensitive, so the function picks the
+            # images out of the uploads itself
+            NotificationConfiguration=s3.NotificationConfiguration(
+                LambdaConfigurations=[
+                    s3.LambdaConfigurations(
+                        Event="s3:ObjectCreated:*",
+                        Function=GetAtt(self.ImageFunction, "Arn"),
+                        Filter=s3.Filter(S3Key=s3.S3Key(Rules=[
+                            s3.Rules(Name="prefix",
+                                     Value=MEDIA_UPLOAD_PREFIX),
+                        ])),
+                    ),
+                ],
+            ),
+            Tags=standard_tags("media"),
+        ))
+
+        t.add_resource(iam.PolicyType(
+            "ImageFunctionPolicy",
+            PolicyName="media-variants",
+            Roles=[ref(self.ImageFunctionRole)],
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Action": ["s3:GetObject"],
+                        "Effect": "Allow",
+                        "Resource": [Join("", [
+                            GetAtt(self.MediaBucket, "Arn"), "/",
+                            MEDIA_UPLOAD_PREFIX, "*"])]
+                    },
+                    {
+                        "Action": ["s3:PutObject"],
+                        "Effect": "Allow",
+                        "Resource": [Join("", [
+                            GetAtt(self.MediaBucket, "Arn"), "/",
+                            MEDIA_VARIANT_PREFIX, "*"])]
+                    }
+                ]
+            },
+        ))
+
+    def add_outputs(self):
+
+        self.template.add_output([
+            Output("MediaBucket", Value=ref(self.MediaBucket)),
+            Output("ImageFunction", Value=GetAtt(self.ImageFunction, "Arn")),
+        ])
+
+
+def sceptre_handler(sceptre_user_data):
+    return serialize(Media(sceptre_user_data).template, sceptre_user_data)
+
+if __name__ == '__main__':
+    print (sceptre_handler())
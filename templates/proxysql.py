@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+ProxySQL sidecar of the web servers.
+
+With ``ProxySQL: "true"`` on the wordpress stack every web server runs
+ProxySQL on 127.0.0.1:LISTEN_PORT and WordPress connects to it instead of
+RDSEndpoint. ProxySQL multiplexes the PHP processes' connections over at
+most ``max_connections`` to the database and answers hot read-only queries
+(``QUERY_RULES``: option and term lookups) from its query cache for
+``cache_ttl`` milliseconds. Writes are not cached, so a cached option can be
+up to ``cache_ttl`` stale.
+
+``config`` renders ``CONFIG_TEMPLATE``. Its values may be CloudFormation
+functions, so it returns the parts of an ``Fn::Join``. No credentials are in
+it: ``INSTALL_SCRIPT`` generates an admin password on each server, kept in
+``ADMIN_CNF``, and writes ``CONFIG_FILE`` from the template with it.
+``USERS_SCRIPT`` loads the database user from the cached DB credentials into
+the running ProxySQL, at boot and whenever the password rotates.
+``METRICS_SCRIPT`` publishes ProxySQL's counters to CloudWatch every minute.
+"""
+
+LISTEN_PORT = 6033
+ADMIN_PORT = 6032
+CONFIG_FILE = "/etc/proxysql.cnf"
+CONFIG_TEMPLATE = CONFIG_FILE + ".in"
+ADMIN_CNF = "/etc/proxysql-admin.cnf"
+ADMIN_PASSWORD = "@ADMIN_PASSWORD@"
+DATA_DIR = "/var/lib/proxysql"
+HOSTGROUP = 0
+VERSION = "2.6.x"
+REPOSITORY = "https://repo.proxysql.com/ProxySQL/proxysql-" + VERSION
+
+METRICS_NAMESPACE = "Wordpress/ProxySQL"
+
+# (digest regex, what it is) of the queries served from the query cache.
+# Digests have literals replaced with ``?``
+QUERY_RULES = [
+    (r"^SELECT option_name, option_value FROM \w+options WHERE autoload",
+     "autoloaded options"),
+    (r"^SELECT option_value FROM \w+options WHERE option_name = \? LIMIT",
+     "single option"),
+    (r"^SELECT .* FROM \w+terms AS t\s+INNER JOIN \w+term_taxonomy AS tt",
+     "term queries"),
+    (r"^SELECT term_id, meta_key, meta_value FROM \w+termmeta",
+     "term meta"),
+]
+
+# Read by USERS_SCRIPT and METRICS_SCRIPT; the admin interface only listens
+# on localhost
+ADMIN = "mysql --defaults-extra-file={} -NB".format(ADMIN_CNF)
+
+
+def quote(value):
+    r"""
+    A libconfig string
+
+    >>> print(quote(r'^SELECT .* FROM \w+terms'))
+    "^SELECT .* FROM \\w+terms"
+    """
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def config(host, cache_ttl, max_connections, cache_size_mb=64):
+    """
+    Parts of the proxysql.cnf text, for ``Join("", ...)``, with
+    ADMIN_PASSWORD in place of the admin password
+
+    >>> text = "".join(config("db.example.com", "5000", "20"))
+    >>> print(text.splitlines()[3].strip())
+    admin_credentials="admin:@ADMIN_PASSWORD@"
+    >>> print(text[text.index("mysql_servers"):text.index("mysql_query")])
+    ... # doctest: +NORMALIZE_WHITESPACE
+    mysql_servers=
+    (
+        { address="db.example.com", port=3306, hostgroup=0,
+          max_connections=20 }
+    )
+    >>> print(text[text.index("mysql_query_rules"):].splitlines()[2])
+    ... # doctest: +NORMALIZE_WHITESPACE
+    { rule_id=1, active=1, match_digest="^SELECT option_name, option_value
+      FROM \\\\w+options WHERE autoload", cache_ttl=5000, apply=1 },
+    """
+    parts = [
+        'datadir="', DATA_DIR, '"\n',
+        "admin_variables=\n",
+        "{\n",
+        '    admin_credentials="admin:', ADMIN_PASSWORD, '"\n',
+        '    mysql_ifaces="127.0.0.1:', str(ADMIN_PORT), '"\n',
+        "}\n",
+        "mysql_variables=\n",
+        "{\n",
+        "    threads=2\n",
+        '    interfaces="127.0.0.1:', str(LISTEN_PORT), '"\n',
+        '    server_version="8.0.35"\n',
+        "    monitor_enabled=false\n",
+        # Share idle backend connections between client connections, and
+        # close the ones left over after a busy spell
+        "    multiplexing=true\n",
+        "    free_connections_pct=10\n",
+        "    connection_max_age_ms=300000\n",
+        "    query_cache_size_MB=", str(cache_size_mb), "\n",
+        "}\n",
+        "mysql_servers=\n",
+        "(\n",
+        '    { address="', host, '", port=3306, hostgroup=', str(HOSTGROUP),
+        ", max_connections=", max_connections, " }\n",
+        ")\n",
+        "mysql_query_rules=\n",
+        "(\n",
+    ]
+    for rule_id, (digest, _) in enumerate(QUERY_RULES, 1):
+        parts.extend([
+            "    { rule_id=", str(rule_id), ", active=1, match_digest=",
+            quote(digest), ", cache_ttl=", cache_ttl, ", apply=1 }",
+            ",\n" if rule_id < len(QUERY_RULES) else "\n",
+        ])
+    parts.append(")\n")
+    return parts
+
+
+# Installs ProxySQL from its repository and (re)starts it with CONFIG_FILE,
+# which only seeds an empty data directory. The admin password is generated
+# once per server.
+INSTALL_SCRIPT = r"""#!/bin/bash
+set -e
+export DEBIAN_FRONTEND=noninteractive
+if ! command -v proxysql > /dev/null; then
+  mkdir -p /etc/apt/keyrings
+  curl -fsSL %(repository)s/repo_pub_key |
+    gpg --dearmor --yes -o /etc/apt/keyrings/proxysql.gpg
+  echo "deb [signed-by=/etc/apt/keyrings/proxysql.gpg]" \
+    "%(repository)s/$(lsb_release -sc)/ ./" \
+    > /etc/apt/sources.list.d/proxysql.list
+  apt-get update
+  apt-get install -y proxysql
+fi
+umask 077
+if [ ! -f %(admin_cnf)s ]; then
+  printf '[client]\nhost=127.0.0.1\nport=%(admin_port)d\nuser=admin\npassword=%%s\n' \
+    "$(openssl rand -hex 16)" > %(admin_cnf)s
+fi
+PASSWORD=$(sed -n 's/^password=//p' %(admin_cnf)s)
+sed "s/%(placeholder)s/$PASSWORD/" %(template)s > %(config)s
+systemctl stop proxysql || true
+rm -f %(data_dir)s/proxysql.db
+systemctl enable proxysql
+systemctl start proxysql
+""" % {"repository": REPOSITORY, "data_dir": DATA_DIR, "admin_cnf": ADMIN_CNF,
+       "admin_port": ADMIN_PORT, "placeholder": ADMIN_PASSWORD,
+       "template": CONFIG_TEMPLATE, "config": CONFIG_FILE}
+
+# Loads the user of the DB credentials' my.cnf ($1) into the running
+# ProxySQL
+USERS_SCRIPT = r"""#!/bin/bash
+set -e
+systemctl is-active -q proxysql || exit 0
+USER=$(sed -n 's/^user=//p' "$1")
+PASSWORD=$(sed -n 's/^password="\(.*\)"$/\1/p' "$1")
+%(admin)s <<EOF
+DELETE FROM mysql_users;
+INSERT INTO mysql_users (username, password, default_hostgroup)
+  VALUES ('$USER', '$PASSWORD', %(hostgroup)d);
+LOAD MYSQL USERS TO RUNTIME;
+SAVE MYSQL USERS TO DISK;
+EOF
+""" % {"admin": ADMIN, "hostgroup": HOSTGROUP}
+
+# Publishes ProxySQL's counters as their change since the last run (kept in
+# $STATE; a restart resets them) and its connection counts. Needs
+# STACK_NAME and AWS_REGION set before it.
+METRICS_SCRIPT = r"""STATE=/var/lib/proxysql-metrics.last
+systemctl is-active -q proxysql || exit 0
+NOW=$(%(admin)s -e "SELECT variable_name, variable_value
+  FROM stats_mysql_global WHERE variable_name IN ('Questions',
+  'Query_Cache_count_GET', 'Query_Cache_count_GET_OK',
+  'Client_Connections_connected', 'Server_Connections_connected')")
+[ -f $STATE ] || { echo "$NOW" > $STATE; exit 0; }
+DATA=$( (sed 's/^/last /' $STATE; echo "$NOW" | sed 's/^/now /') |
+awk -v stack="$STACK_NAME" '
+$1 == "last" { last[$2] = $3; next }
+{ now[$2] = $3 }
+function delta(name) {
+  return now[name] < last[name] ? now[name] : now[name] - last[name]
+}
+function metric(name, value) {
+  printf "%%s{\"MetricName\":\"%%s\",\"Value\":%%d,", sep, name, value
+  printf "\"Unit\":\"Count\",\"Dimensions\":[{\"Name\":\"StackName\","
+  printf "\"Value\":\"%%s\"}]}", stack
+  sep = ","
+}
+END {
+  printf "["
+  metric("Queries", delta("Questions"))
+  metric("QueryCacheLookups", delta("Query_Cache_count_GET"))
+  metric("QueryCacheHits", delta("Query_Cache_count_GET_OK"))
+  metric("ClientConnections", now["Client_Connections_connected"])
+  metric("BackendConnections", now["Server_Connections_connected"])
+  print "]"
+}')
+echo "$NOW" > $STATE
+aws cloudwatch put-metric-data --region $AWS_REGION \
+  --namespace %(namespace)s --metric-data "$DATA"
+""" % {"admin": ADMIN, "namespace": METRICS_NAMESPACE}
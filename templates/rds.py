@@ -1,9 +1,32 @@
-from troposphere import GetAtt, Join, Output
-from troposphere import Parameter, Ref, Tags
-from constants import *
-import troposphere.ec2 as ec2
-import troposphere.rds as rds
-from base import CloudformationAbstractBaseClass
+from troposphere import And, Condition, Equals, GetAtt, If, Join, Not
+from troposphere import Output, Select, Split
+from troposphere import Parameter
+from lazy import lazy_module
+from base import CloudformationAbstractBaseClass, ref, resource_name
+from base import serialize, standard_tags
+import architectures
+
+ec2 = lazy_module("troposphere.ec2")
+rds = lazy_module("troposphere.rds")
+secretsmanager = lazy_module("troposphere.secretsmanager")
+
+# Kept out of generated passwords so they can be quoted in shell, PHP and
+# my.cnf without escaping
+PASSWORD_EXCLUDE_CHARACTERS = "\"'\\/@`$"
+
+# WordPress connects as DBUser + APP_USER_SUFFIX, created by the web servers
+# with the master credentials. Its secret rotates between that user and a
+# "_clone" of it, so the password the web servers have cached keeps working
+# until the rotation after next.
+APP_USER_SUFFIX = "_app"
+
+
+def regional_arn(arn, region):
+    """ ``arn`` of a Secrets Manager secret, as its replica in ``region`` """
+    parts = Split(":", arn)
+    return Join(":", [Select(0, parts), Select(1, parts), Select(2, parts),
+                      region, Select(4, parts), Select(5, parts),
+                      Select(6, parts)])
 
 
 class WordpressRDS(CloudformationAbstractBaseClass):
@@ -11,7 +34,10 @@ class WordpressRDS(CloudformationAbstractBaseClass):
     def __init__(self, sceptre_user_data):
         super(self.__class__, self).__init__()
         self.template.set_description("Wordpress for RDS MySQL")
+        # Needed by the hosted rotation Lambda of the credentials secret
+        self.template.set_transform("AWS::SecretsManager-2020-07-23")
         self.add_parameters()
+        self.add_conditions()
         self.add_resources()
         self.add_outputs()
 
@@ -19,11 +45,8 @@ class WordpressRDS(CloudformationAbstractBaseClass):
 
         t = self.template
 
-        self.VpcId = t.add_parameter(Parameter(
-            "VpcId",
-            Description="VpcId",
-            Type="AWS::EC2::VPC::Id",
-        ))
+        self.add_shared_parameters(
+            "VpcId", "Subnet1", "Subnet2", "DBName", "DBUser")
 
         self.MultiAZDatabase = t.add_parameter(Parameter(
             "MultiAZDatabase",
@@ -36,17 +59,22 @@ class WordpressRDS(CloudformationAbstractBaseClass):
 
         self.DatabaseSnapshot = t.add_parameter(Parameter(
             "DatabaseSnapshot",
-            AllowedPattern="[a-zA-Z0-9]*",
+            AllowedPattern="[a-zA-Z0-9:-]*",
             Default="",
             Type="String",
-            ConstraintDescription="Must be alphanumeric string",
-            Description="DB Snapshot (optional)",
+            ConstraintDescription="Must be a snapshot identifier or ARN",
+            Description=(
+                "DB snapshot (identifier, or ARN if shared) to create the "
+                "primary from; its master user must be DBUser. Blank for an "
+                "empty database. Changing it replaces the database."),
         ))
 
         self.DBInstanceClass = t.add_parameter(Parameter(
             "DBInstanceClass",
             Default="db.t2.micro",
-            ConstraintDescription="Must be valid RDS instance type db.xx.xxxx",
+            AllowedValues=list(architectures.instance_types(db=True)),
+            ConstraintDescription="must be a supported RDS instance class; "
+                                  "db.*g.* classes are Graviton",
             Type="String",
             Description="The database instance type",
         ))
@@ -59,18 +87,6 @@ class WordpressRDS(CloudformationAbstractBaseClass):
             Description="Number of dats which automatic backups are retained",
         ))
 
-        self.Subnet1 = t.add_parameter(Parameter(
-            "Subnet1",
-            Type="AWS::EC2::Subnet::Id",
-            Description="Subnet1 ID",
-        ))
-
-        self.Subnet2 = t.add_parameter(Parameter(
-            "Subnet2",
-            Type="AWS::EC2::Subnet::Id",
-            Description="Subnet2 ID",
-        ))
-
         self.DBAllocatedStorage = t.add_parameter(Parameter(
             "DBAllocatedStorage",
             Description="The size of the database (Gb)",
@@ -81,17 +97,6 @@ class WordpressRDS(CloudformationAbstractBaseClass):
             ConstraintDescription="must be between 5 and 1024Gb.",
         ))
 
-        self.DBName = t.add_parameter(Parameter(
-            "DBName",
-            Type="String",
-            Description="DB Name",
-            Default="mydb",
-            MinLength="1",
-            AllowedPattern="[a-zA-Z0-9]*",
-            MaxLength="64",
-            ConstraintDescription="Must be alphanumeric string",
-        ))
-
         self.DatabaseMaintenanceWindow = t.add_parameter(Parameter(
             "DatabaseMaintenanceWindow",
             AllowedPattern=(
@@ -125,29 +130,6 @@ class WordpressRDS(CloudformationAbstractBaseClass):
             Type="String",
         ))
 
-        self.DBPass = t.add_parameter(Parameter(
-            "DBPass",
-            MinLength="8",
-            Type="String",
-            NoEcho=True,
-            Description="The database admin account password",
-            MaxLength="41",
-        ))
-
-        self.DBUser = t.add_parameter(Parameter(
-            "DBUser",
-            ConstraintDescription=(
-                "must begin with a letter and contain only alphanumeric "
-                "characters."
-            ),
-            Description="Username for MySQL database access",
-            MinLength="1",
-            AllowedPattern="[a-zA-Z][a-zA-Z0-9]*",
-            NoEcho=True,
-            MaxLength="80",
-            Type="String",
-        ))
-
         self.DatabaseEngineVersion = t.add_parameter(Parameter(
             "DatabaseEngineVersion",
             Default="5.6",
@@ -194,52 +176,280 @@ class WordpressRDS(CloudformationAbstractBaseClass):
             Type="AWS::EC2::SecurityGroup::Id",
         ))
 
+        self.RotationSecurityGroup = t.add_parameter(Parameter(
+            "RotationSecurityGroup",
+            Description="SG of the credentials rotation Lambda",
+            Type="AWS::EC2::SecurityGroup::Id",
+        ))
+
+        self.EndpointSecurityGroup = t.add_parameter(Parameter(
+            "EndpointSecurityGroup",
+            Description="SG of the Secrets Manager VPC endpoint",
+            Type="AWS::EC2::SecurityGroup::Id",
+        ))
+
+        self.DBSecretRotationDays = t.add_parameter(Parameter(
+            "DBSecretRotationDays",
+            Description="Days between rotations of the master password",
+            Default="30",
+            Type="Number",
+            MinValue="1",
+            MaxValue="365",
+        ))
+
+        self.ReplicaRegion = t.add_parameter(Parameter(
+            "ReplicaRegion",
+            Default="",
+            Type="String",
+            Description=(
+                "Region the credentials secrets are replicated to, for its "
+                "read replica stack (blank for none)"),
+        ))
+
+        self.SourceDBSecretArn = t.add_parameter(Parameter(
+            "SourceDBSecretArn",
+            Default="",
+            Type="String",
+            Description=(
+                "This region's replica of the primary's WordPress "
+                "credentials secret when this is a cross-region read "
+                "replica (blank for a primary)"),
+        ))
+
+        self.SourceDBMasterSecretArn = t.add_parameter(Parameter(
+            "SourceDBMasterSecretArn",
+            Default="",
+            Type="String",
+            Description=(
+                "This region's replica of the primary's master credentials "
+                "secret when this is a cross-region read replica (blank for "
+                "a primary)"),
+        ))
+
+        self.SourceDBInstanceArn = t.add_parameter(Parameter(
+            "SourceDBInstanceArn",
+            Default="",
+            Type="String",
+            Description=(
+                "ARN of the primary instance when this is a cross-region "
+                "read replica (blank for a primary)"),
+        ))
+
+    def add_conditions(self):
+        self.template.add_condition(
+            "IsPrimary", Equals(ref(self.SourceDBInstanceArn), ""))
+        self.template.add_condition("IsReplica", Not(Condition("IsPrimary")))
+        self.template.add_condition("ReplicateSecrets", And(
+            Condition("IsPrimary"), Not(Equals(ref(self.ReplicaRegion), ""))))
+        self.template.add_condition("FromSnapshot", And(
+            Condition("IsPrimary"),
+            Not(Equals(ref(self.DatabaseSnapshot), ""))))
+
     def add_resources(self):
 
+        self.DBSecret = self.template.add_resource(secretsmanager.Secret(
+            "DBSecret",
+            Condition="IsPrimary",
+            Description=resource_name("rds", "credentials"),
+            GenerateSecretString=secretsmanager.GenerateSecretString(
+                SecretStringTemplate=Join("", [
+                    '{"username": "', ref(self.DBUser), '"}']),
+                GenerateStringKey="password",
+                PasswordLength=32,
+                ExcludeCharacters=PASSWORD_EXCLUDE_CHARACTERS,
+            ),
+            ReplicaRegions=self.replica_regions(),
+            Tags=standard_tags("rds", "credentials"),
+        ))
+
+        self.AppDBSecret = self.template.add_resource(secretsmanager.Secret(
+            "AppDBSecret",
+            Condition="IsPrimary",
+            Description=resource_name("rds", "app", "credentials"),
+            GenerateSecretString=secretsmanager.GenerateSecretString(
+                SecretStringTemplate=Join("", [
+                    '{"username": "', ref(self.DBUser), APP_USER_SUFFIX,
+                    '"}']),
+                GenerateStringKey="password",
+                PasswordLength=32,
+                ExcludeCharacters=PASSWORD_EXCLUDE_CHARACTERS,
+            ),
+            ReplicaRegions=self.replica_regions(),
+            Tags=standard_tags("rds", "app", "credentials"),
+        ))
+
         self.MySQLDBSubnetGroup = self.template.add_resource(rds.DBSubnetGroup(
             "MySQLDBSubnetGroup",
-            SubnetIds=[Ref(self.Subnet1), Ref(self.Subnet2)],
+            SubnetIds=[ref(self.Subnet1), ref(self.Subnet2)],
             DBSubnetGroupDescription="MySQLDBSubnetGroup",
-            Tags=Tags(
-                Name=Join("-", ["DB-SUB-GRP", Ref(self.Project)]),
-                Environment=Ref(self.Environment),
-            ),
+            Tags=standard_tags(
+                "DB-SUB-GRP", project_first=False, project=False),
         ))
 
         self.MySQLDatabase = self.template.add_resource(rds.DBInstance(
             "MySQLDatabase",
-            DBInstanceIdentifier=Join("-", ["rds", Ref(self.Project)]),
+            Condition="IsPrimary",
+            DBInstanceIdentifier=resource_name("rds", project_first=False),
+            Engine="MySQL",
+            MultiAZ=ref(self.MultiAZDatabase),
+            PubliclyAccessible="false",
+            # A restored instance keeps the snapshot's database and master
+            # user; the password is still set from the secret
+            DBSnapshotIdentifier=If(
+                "FromSnapshot", ref(self.DatabaseSnapshot),
+                ref("AWS::NoValue")),
+            MasterUsername=If(
+                "FromSnapshot", ref("AWS::NoValue"), ref(self.DBUser)),
+            MasterUserPassword=Join("", [
+                "{{resolve:secretsmanager:", ref(self.DBSecret),
+                ":SecretString:password}}"]),
+            VPCSecurityGroups=[ref(self.RDSSecurityGroup)],
+            AllocatedStorage=ref(self.DBAllocatedStorage),
+            DBInstanceClass=ref(self.DBInstanceClass),
+            DBSubnetGroupName=ref(self.MySQLDBSubnetGroup),
+            DBName=If("FromSnapshot", ref("AWS::NoValue"), ref(self.DBName)),
+            Tags=standard_tags("rds", project_first=False)
+        ))
+
+        self.MySQLReplica = self.template.add_resource(rds.DBInstance(
+            "MySQLReplica",
+            Condition="IsReplica",
+            DBInstanceIdentifier=resource_name("rds", project_first=False),
+            SourceDBInstanceIdentifier=ref(self.SourceDBInstanceArn),
             Engine="MySQL",
-            MultiAZ=Ref(self.MultiAZDatabase),
             PubliclyAccessible="false",
-            MasterUsername=Ref(self.DBUser),
-            MasterUserPassword=Ref(self.DBPass),
-            VPCSecurityGroups=[Ref(self.RDSSecurityGroup)],
-            AllocatedStorage=Ref(self.DBAllocatedStorage),
-            DBInstanceClass=Ref(self.DBInstanceClass),
-            DBSubnetGroupName=Ref(self.MySQLDBSubnetGroup),
-            DBName=Ref(self.DBName),
-            Tags=Tags(
-                Name=Join("-", ["rds", Ref(self.Project)]),
-                Environment=Ref(self.Environment),
-                Project=Ref(self.Project),
-            )
+            VPCSecurityGroups=[ref(self.RDSSecurityGroup)],
+            DBInstanceClass=ref(self.DBInstanceClass),
+            DBSubnetGroupName=ref(self.MySQLDBSubnetGroup),
+            Tags=standard_tags("rds", project_first=False)
         ))
 
+        self.add_rotation()
+
+    def replica_regions(self):
+        return If("ReplicateSecrets", [
+            secretsmanager.ReplicaRegion(Region=ref(self.ReplicaRegion))],
+            ref("AWS::NoValue"))
+
+    def add_rotation(self):
+        """
+        Rotate the master and WordPress passwords from Lambdas in the private
+        subnets, which reach Secrets Manager through an interface endpoint
+        """
+
+        t = self.template
+
+        self.DBSecretAttachment = t.add_resource(
+            secretsmanager.SecretTargetAttachment(
+                "DBSecretAttachment",
+                Condition="IsPrimary",
+                SecretId=ref(self.DBSecret),
+                TargetId=ref(self.MySQLDatabase),
+                TargetType="AWS::RDS::DBInstance",
+            ))
+
+        # The rotation Lambda connects to the host the attachment adds
+        self.AppDBSecretAttachment = t.add_resource(
+            secretsmanager.SecretTargetAttachment(
+                "AppDBSecretAttachment",
+                Condition="IsPrimary",
+                SecretId=ref(self.AppDBSecret),
+                TargetId=ref(self.MySQLDatabase),
+                TargetType="AWS::RDS::DBInstance",
+            ))
+
+        self.SecretsManagerEndpoint = t.add_resource(ec2.VPCEndpoint(
+            "SecretsManagerEndpoint",
+            Condition="IsPrimary",
+            VpcId=ref(self.VpcId),
+            ServiceName=Join("", [
+                "com.amazonaws.", ref("AWS::Region"), ".secretsmanager"]),
+            VpcEndpointType="Interface",
+            PrivateDnsEnabled=True,
+            SubnetIds=[ref(self.Subnet1), ref(self.Subnet2)],
+            SecurityGroupIds=[ref(self.EndpointSecurityGroup)],
+        ))
+
+        # Only the web servers' first boot and the WordPress rotation use
+        # the master password, so changing it in place is safe
+        self.DBSecretRotation = t.add_resource(secretsmanager.RotationSchedule(
+            "DBSecretRotation",
+            Condition="IsPrimary",
+            DependsOn=["SecretsManagerEndpoint"],
+            SecretId=ref(self.DBSecretAttachment),
+            HostedRotationLambda=secretsmanager.HostedRotationLambda(
+                RotationType="MySQLSingleUser",
+                ExcludeCharacters=PASSWORD_EXCLUDE_CHARACTERS,
+                VpcSubnetIds=Join(",", [ref(self.Subnet1), ref(self.Subnet2)]),
+                VpcSecurityGroupIds=ref(self.RotationSecurityGroup),
+            ),
+            RotationRules=secretsmanager.RotationRules(
+                AutomaticallyAfterDays=ref(self.DBSecretRotationDays),
+            ),
+        ))
+
+        # Alternates between two users, so the web servers' cached password
+        # stays valid through a rotation. Not rotated on creation: the user
+        # is created when the first web server boots.
+        self.AppDBSecretRotation = t.add_resource(
+            secretsmanager.RotationSchedule(
+                "AppDBSecretRotation",
+                Condition="IsPrimary",
+                DependsOn=["SecretsManagerEndpoint", "DBSecretAttachment"],
+                SecretId=ref(self.AppDBSecretAttachment),
+                RotateImmediatelyOnUpdate=False,
+                HostedRotationLambda=secretsmanager.HostedRotationLambda(
+                    RotationType="MySQLMultiUser",
+                    MasterSecretArn=ref(self.DBSecret),
+                    ExcludeCharacters=PASSWORD_EXCLUDE_CHARACTERS,
+                    VpcSubnetIds=Join(",", [
+                        ref(self.Subnet1), ref(self.Subnet2)]),
+                    VpcSecurityGroupIds=ref(self.RotationSecurityGroup),
+                ),
+                RotationRules=secretsmanager.RotationRules(
+                    AutomaticallyAfterDays=ref(self.DBSecretRotationDays),
+                ),
+            ))
+
     def add_outputs(self):
 
         self.out = self.template.add_output([
-            Output("DBUser", Value=Ref(self.DBUser)),
-            Output("DBName", Value=Ref(self.DBName)),
-            Output("MySQLPort", Value=GetAtt(
-                self.MySQLDatabase, "Endpoint.Port")),
-            Output("MySQLAddress", Value=GetAtt(
-                self.MySQLDatabase, "Endpoint.Address")),
+            Output("DBUser", Value=ref(self.DBUser)),
+            Output("DBName", Value=ref(self.DBName)),
+            Output("MySQLPort", Value=If(
+                "IsReplica",
+                GetAtt(self.MySQLReplica, "Endpoint.Port"),
+                GetAtt(self.MySQLDatabase, "Endpoint.Port"))),
+            Output("MySQLAddress", Value=If(
+                "IsReplica",
+                GetAtt(self.MySQLReplica, "Endpoint.Address"),
+                GetAtt(self.MySQLDatabase, "Endpoint.Address"))),
+            Output("DBSecretArn", Value=If(
+                "IsReplica",
+                ref(self.SourceDBSecretArn),
+                ref(self.AppDBSecret))),
+            Output("DBMasterSecretArn", Value=If(
+                "IsReplica",
+                ref(self.SourceDBMasterSecretArn),
+                ref(self.DBSecret))),
+            Output("DBSecretReplicaArn", Condition="ReplicateSecrets",
+                   Value=regional_arn(ref(self.AppDBSecret),
+                                      ref(self.ReplicaRegion))),
+            Output("DBMasterSecretReplicaArn", Condition="ReplicateSecrets",
+                   Value=regional_arn(ref(self.DBSecret),
+                                      ref(self.ReplicaRegion))),
+            Output("DBInstanceArn", Value=Join(":", [
+                "arn", ref("AWS::Partition"), "rds", ref("AWS::Region"),
+                ref("AWS::AccountId"), "db", If(
+                    "IsReplica",
+                    ref(self.MySQLReplica),
+                    ref(self.MySQLDatabase))])),
         ])
 
 
 def sceptre_handler(sceptre_user_data):
-    return WordpressRDS(sceptre_user_data).template.to_json()
+    return serialize(
+        WordpressRDS(sceptre_user_data).template, sceptre_user_data)
 
 if __name__ == '__main__':
     print (sceptre_handler())
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from troposphere import GetAtt, Output
-from troposphere import Ref, Template
-import troposphere.iam as iam
+from troposphere import Template
+from lazy import lazy_module
+from base import ref, serialize
+
+iam = lazy_module("troposphere.iam")
 
 
 class IamRole(object):
@@ -71,7 +74,7 @@ class IamRole(object):
 
         self.inst_profile = self.template.add_resource(iam.InstanceProfile(
             "InstanceProfile",
-            Roles=[Ref(self.Ec2Role)]
+            Roles=[ref(self.Ec2Role)]
         ))
 
     def add_outputs(self):
@@ -82,7 +85,8 @@ class IamRole(object):
 
 
 def sceptre_handler(sceptre_user_data):
-    return IamRole(sceptre_user_data).template.to_json()
+    return serialize(
+        IamRole(sceptre_user_data).template, sceptre_user_data)
 
 if __name__ == '__main__':
     print (sceptre_handler())
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Office hours schedule of a non-prod environment.
+
+The schedule is set once in the stack group config and handed to the stacks
+that act on it through sceptre_user_data::
+
+    schedule:
+      start: "0 7 * * 1-5"            # web tier back in service (UTC)
+      stop: "0 19 * * 1-5"            # web tier and database stopped
+      database_start: "40 6 * * 1-5"  # defaults to start
+      resume_target_seconds: 180
+
+Expressions use the five field cron format of auto scaling scheduled
+actions. ``eventbridge_cron`` converts them for the EventBridge rules that
+start and stop the database.
+"""
+
+import re
+
+DEFAULT_RESUME_TARGET_SECONDS = 180
+
+# Published by the web servers on every boot out of the warm pool
+RESUME_NAMESPACE = "Wordpress/Resume"
+RESUME_METRIC = "ResumeSeconds"
+
+_DAY_NUMBER = re.compile("[0-7]")
+
+
+def parse(sceptre_user_data):
+    """
+    The ``schedule`` of ``sceptre_user_data`` with defaults filled in, or
+    None when the environment runs around the clock
+
+    >>> parse({"schedule": {"start": "0 7 * * 1-5", "stop": "0 19 * * 1-5"}})
+    ... # doctest: +NORMALIZE_WHITESPACE
+    {'start': '0 7 * * 1-5', 'stop': '0 19 * * 1-5',
+     'database_start': '0 7 * * 1-5', 'resume_target_seconds': 180}
+    """
+    schedule = (sceptre_user_data or {}).get("schedule")
+    if not schedule:
+        return None
+    for key in ("start", "stop"):
+        if not schedule.get(key):
+            raise ValueError("schedule needs a {!r} expression".format(key))
+    parsed = {
+        "start": schedule["start"],
+        "stop": schedule["stop"],
+        "database_start": schedule.get("database_start") or schedule["start"],
+        "resume_target_seconds": int(schedule.get(
+            "resume_target_seconds", DEFAULT_RESUME_TARGET_SECONDS)),
+    }
+    for key in ("start", "stop", "database_start"):
+        if len(parsed[key].split()) != 5:
+            raise ValueError("schedule {}: {!r} is not a five field cron "
+                             "expression".format(key, parsed[key]))
+    return parsed
+
+
+def eventbridge_cron(expression):
+    """
+    EventBridge schedule for a five field cron ``expression``. EventBridge
+    numbers days of the week from Sunday = 1 and wants ``?`` in one of the
+    two day fields.
+
+    >>> eventbridge_cron("0 19 * * 1-5")
+    'cron(0 19 ? * 2-6 *)'
+    >>> eventbridge_cron("30 6 1 * *")
+    'cron(30 6 1 * ? *)'
+    """
+    minute, hour, day, month, weekday = expression.split()
+    if weekday == "*":
+        weekday = "?"
+    elif day == "*":
+        day = "?"
+        weekday = _DAY_NUMBER.sub(
+            lambda m: str(int(m.group()) % 7 + 1), weekday)
+    else:
+        raise ValueError("{!r}: EventBridge cannot restrict both the day of "
+                         "the month and the day of the week".format(
+                             expression))
+    return "cron({} {} {} {} {} *)".format(minute, hour, day, month, weekday)
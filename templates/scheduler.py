@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+from troposphere import GetAtt, Output, Parameter
+from lazy import lazy_module
+from base import CloudformationAbstractBaseClass, ref, resource_name
+from base import serialize, standard_tags
+import schedule
+
+awslambda = lazy_module("troposphere.awslambda")
+events = lazy_module("troposphere.events")
+iam = lazy_module("troposphere.iam")
+
+# Starts or stops the instance named by DB_INSTANCE_ARN unless it is already
+# on its way there, so a late or repeated event is harmless
+DB_SCHEDULER_CODE = """\
+import os
+
+import boto3
+
+rds = boto3.client("rds")
+ACTIONS = {
+    "start": ("stopped", rds.start_db_instance),
+    "stop": ("available", rds.stop_db_instance),
+}
+
+
+def handler(event, context):
+    identifier = os.environ["DB_INSTANCE_ARN"].split(":")[-1]
+    status = rds.describe_db_instances(
+        DBInstanceIdentifier=identifier)["DBInstances"][0]["DBInstanceStatus"]
+    from_status, action = ACTIONS[event["action"]]
+    if status == from_status:
+        action(DBInstanceIdentifier=identifier)
+    print(event["action"], identifier, status)
+    return status
+"""
+
+
+class Scheduler(CloudformationAbstractBaseClass):
+
+    def __init__(self, sceptre_user_data):
+        super(self.__class__, self).__init__()
+        self.schedule = schedule.parse(sceptre_user_data)
+        if self.schedule is None:
+            raise ValueError("the scheduler stack needs a schedule in "
+                             "sceptre_user_data")
+        self.template.set_description("Wordpress office hours scheduler")
+        self.add_parameters()
+        self.add_resources()
+        self.add_outputs()
+
+    def add_parameters(self):
+
+        self.DBInstanceArn = self.template.add_parameter(Parameter(
+            "DBInstanceArn",
+            Type="String",
+            Description="ARN of the RDS instance to stop out of hours",
+            MinLength="1",
+        ))
+
+    def add_resources(self):
+
+        t = self.template
+
+        self.DBSchedulerRole = t.add_resource(iam.Role(
+            "DBSchedulerRole",
+            ManagedPolicyArns=[
+                "arn:aws:iam::aws:policy/service-role/"
+                "AWSLambdaBasicExecutionRole",
+            ],
+            Policies=[iam.Policy(
+                PolicyName="db-start-stop",
+                PolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Action": [
+                                "rds:DescribeDBInstances",
+                                "rds:StartDBInstance",
+                                "rds:StopDBInstance",
+                            ],
+                            "Effect": "Allow",
+                            "Resource": [ref(self.DBInstanceArn)]
+                        }
+                    ]
+                },
+            )],
+            AssumeRolePolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Action": ["sts:AssumeRole"],
+                        "Effect": "Allow",
+                        "Principal": {"Service": ["lambda.amazonaws.com"]}
+                    }
+                ]
+            }
+        ))
+
+        self.DBSchedulerFunction = t.add_resource(awslambda.Function(
+            "DBSchedulerFunction",
+            Description="Starts and stops the Wordpress database",
+            Runtime="python3.12",
+            Handler="index.handler",
+            Timeout=30,
+            MemorySize=128,
+            Role=GetAtt(self.DBSchedulerRole, "Arn"),
+            Code=awslambda.Code(ZipFile=DB_SCHEDULER_CODE),
+            Environment=awslambda.Environment(Variables={
+                "DB_INSTANCE_ARN": ref(self.DBInstanceArn),
+            }),
+            Tags=standard_tags("db", "scheduler"),
+        ))
+
+        for action, expression in [
+                ("Start", self.schedule["database_start"]),
+                ("Stop", self.schedule["stop"])]:
+            t.add_resource(events.Rule(
+                "DB{}Rule".format(action),
+                Name=resource_name("db", action.lower()),
+                Description="{} the database ({} UTC)".format(
+                    action, expression),
+                ScheduleExpression=schedule.eventbridge_cron(expression),
+                State="ENABLED",
+                Targets=[events.Target(
+                    Id="DBScheduler",
+                    Arn=GetAtt(self.DBSchedulerFunction, "Arn"),
+                    Input='{{"action": "{}"}}'.format(action.lower()),
+                )],
+            ))
+            t.add_resource(awslambda.Permission(
+                "DB{}Permission".format(action),
+                Action="lambda:InvokeFunction",
+                FunctionName=ref(self.DBSchedulerFunction),
+                Principal="events.amazonaws.com",
+                SourceArn=GetAtt("DB{}Rule".format(action), "Arn"),
+            ))
+
+    def add_outputs(self):
+
+        self.template.add_output([
+            Output("DBSchedulerFunction",
+                   Value=GetAtt(self.DBSchedulerFunction, "Arn")),
+        ])
+
+
+def sceptre_handler(sceptre_user_data):
+    return serialize(Scheduler(sceptre_user_data).template, sceptre_user_data)
+
+if __name__ == '__main__':
+    print (sceptre_handler())
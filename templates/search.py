@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+from troposphere import Equals, GetAtt, If, Join, Not, Output, Parameter
+from lazy import lazy_module
+from base import CloudformationAbstractBaseClass, ref, serialize, standard_tags
+
+opensearch = lazy_module("troposphere.opensearchservice")
+
+ENGINE_VERSION = "OpenSearch_2.11"
+
+
+class Search(CloudformationAbstractBaseClass):
+
+    def __init__(self, sceptre_user_data):
+        super(self.__class__, self).__init__()
+        self.template.set_description("""Wordpress search (OpenSearch)""")
+        self.add_parameters()
+        self.add_conditions()
+        self.add_resources()
+        self.add_outputs()
+
+    def add_parameters(self):
+
+        t = self.template
+
+        self.add_shared_parameters("Subnet1", "Subnet2")
+
+        self.SearchSecurityGroup = t.add_parameter(Parameter(
+            "SearchSecurityGroup",
+            Description="Search SG",
+            Type="AWS::EC2::SecurityGroup::Id",
+        ))
+
+        self.SearchInstanceCount = t.add_parameter(Parameter(
+            "SearchInstanceCount",
+            Description="Data nodes; more than one spreads them over both "
+                        "subnets",
+            Default="2",
+            Type="String",
+            AllowedValues=["1", "2", "4", "6"],
+        ))
+
+        self.SearchInstanceType = t.add_parameter(Parameter(
+            "SearchInstanceType",
+            Description="OpenSearch instance type",
+            Default="t3.small.search",
+            Type="String",
+            AllowedPattern="[a-z0-9]+\\.[a-z0-9]+\\.search",
+            ConstraintDescription="must be an OpenSearch instance type, "
+                                  "e.g. t3.small.search",
+        ))
+
+        self.SearchVolumeSize = t.add_parameter(Parameter(
+            "SearchVolumeSize",
+            Description="EBS volume per node (GiB)",
+            Default="10",
+            Type="Number",
+            MinValue="10",
+        ))
+
+    def add_conditions(self):
+        self.template.add_condition(
+            "MultiNode", Not(Equals(ref(self.SearchInstanceCount), "1")))
+
+    def add_resources(self):
+
+        self.SearchDomain = self.template.add_resource(opensearch.Domain(
+            "SearchDomain",
+            EngineVersion=ENGINE_VERSION,
+            ClusterConfig=opensearch.ClusterConfig(
+                InstanceCount=ref(self.SearchInstanceCount),
+                InstanceType=ref(self.SearchInstanceType),
+                ZoneAwarenessEnabled=If("MultiNode", True, False),
+                ZoneAwarenessConfig=If(
+                    "MultiNode",
+                    opensearch.ZoneAwarenessConfig(AvailabilityZoneCount=2),
+                    ref("AWS::NoValue")),
+            ),
+            EBSOptions=opensearch.EBSOptions(
+                EBSEnabled=True,
+                VolumeType="gp3",
+                VolumeSize=ref(self.SearchVolumeSize),
+            ),
+            VPCOptions=opensearch.VPCOptions(
+                SubnetIds=If("MultiNode",
+                             [ref(self.Subnet1), ref(self.Subnet2)],
+                             [ref(self.Subnet1)]),
+                SecurityGroupIds=[ref(self.SearchSecurityGroup)],
+            ),
+            EncryptionAtRestOptions=opensearch.EncryptionAtRestOptions(
+                Enabled=True,
+            ),
+            NodeToNodeEncryptionOptions=opensearch.NodeToNodeEncryptionOptions(
+                Enabled=True,
+            ),
+            DomainEndpointOptions=opensearch.DomainEndpointOptions(
+                EnforceHTTPS=True,
+            ),
+            # Reachable only through the search SG, which admits the web
+            # tier; the search plugin does not sign its requests
+            AccessPolicies={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Effect": "Allow",
+                        "Principal": {"AWS": "*"},
+                        "Action": ["es:ESHttp*"],
+                        "Resource": Join("", [
+                            "arn:", ref("AWS::Partition"), ":es:",
+                            ref("AWS::Region"), ":", ref("AWS::AccountId"),
+                            ":domain/*"]),
+                    }
+                ]
+            },
+            Tags=standard_tags("search"),
+        ))
+
+    def add_outputs(self):
+
+        self.template.add_output([
+            Output("SearchEndpoint",
+                   Value=GetAtt(self.SearchDomain, "DomainEndpoint")),
+            Output("SearchDomainArn", Value=GetAtt(self.SearchDomain, "Arn")),
+        ])
+
+
+def sceptre_handler(sceptre_user_data):
+    return serialize(Search(sceptre_user_data).template, sceptre_user_data)
+
+if __name__ == '__main__':
+    print (sceptre_handler())
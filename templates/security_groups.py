@@ -1,106 +1,232 @@
 # -*- coding: utf-8 -*-
 
-from troposphere import Base64, Select, FindInMap, GetAtt, GetAZs, Join, Output
-from troposphere import Parameter, Ref, Tags, Template
-import troposphere.efs as efs
-import troposphere.ec2 as ec2
-from constants import *
-from base import CloudformationAbstractBaseClass
+from troposphere import Equals, If, Not, Output, Parameter
+from lazy import lazy_module
+from base import CloudformationAbstractBaseClass, ref, resource_name
+from base import serialize, standard_tags
+import sg_rules
+
+ec2 = lazy_module("troposphere.ec2")
+
+# Groups other stacks import: resource title and output name. Groups added
+# through sceptre_user_data get <Name>SecurityGroup and <NAME>sg.
+GROUPS = {
+    "efs": ("MountTargetSecurityGroup", "EFSsg"),
+    "elb": ("ElbSecurityGroup", "ELBsg"),
+    "web": ("WebSecurityGroup", "WEBsg"),
+    "rds": ("RDSSecurityGroup", "RDSsg"),
+}
+
+# With OriginPrefixList set the load balancer only admits the waf stack's
+# CloudFront distribution, which talks plain HTTP to it, instead of the
+# world. EC2 counts the CloudFront origin-facing list as 55 rules.
+EDGE_GROUP = "elb"
+EDGE_PORT = 80
+EDGE_WEIGHT = 55
+WORLD = ("0.0.0.0/0", "::/0")
+
+# SSH to the web servers is only admitted from SshCidr, when it is set
+SSH_GROUP = "web"
+SSH_PORT = 22
+
+# Only the load balancer is open to the world; every tier behind it admits
+# the tier in front by security group. "rotation" is the DB credentials
+# rotation Lambda, "endpoint" the Secrets Manager VPC endpoint and "search"
+# the OpenSearch domain of the optional search stack.
+DEFAULT_RULES = {
+    "efs": {"ingress": [{"ports": 2049, "from": "web"}]},
+    "elb": {"ingress": [{"ports": [80, 443], "cidrs": ["0.0.0.0/0"]}]},
+    "web": {"ingress": [{"ports": 80, "from": "elb"}]},
+    "rds": {"ingress": [
+        {"ports": 3306, "from": "web"},
+        {"ports": 3306, "from": "rotation"},
+    ]},
+    "rotation": {"ingress": []},
+    "endpoint": {"ingress": [
+        {"ports": 443, "from": "web"},
+        {"ports": 443, "from": "rotation"},
+    ]},
+    "search": {"ingress": [{"ports": 443, "from": "web"}]},
+}
+
+
+def group_names(group):
+    """ Resource title and output name of security group ``group`` """
+    return GROUPS.get(group, (
+        group.capitalize() + "SecurityGroup", group.upper() + "sg"))
 
 
 class SecurityGroup(CloudformationAbstractBaseClass):
 
     def __init__(self, sceptre_user_data):
         super(self.__class__, self).__init__()
+        sceptre_user_data = sceptre_user_data or {}
+        spec = dict(DEFAULT_RULES)
+        spec.update(sceptre_user_data.get("security_groups") or {})
+        self.limit = sceptre_user_data.get(
+            "rules_per_group", sg_rules.RULES_PER_GROUP)
+        self.rules = sg_rules.compile_rules(spec, self.limit)
+        count = 1 + sum(map(sg_rules.weight, self.rules[SSH_GROUP]))
+        if count > self.limit:
+            raise ValueError("{}: {} ingress rules with SSH, over the limit "
+                             "of {}".format(SSH_GROUP, count, self.limit))
         self.template.set_description("""Wordpress SG""")
         self.add_parameters()
+        self.add_conditions()
         self.add_resources()
         self.add_outputs()
 
     def add_parameters(self):
 
-        self.VpcId = self.template.add_parameter(Parameter(
-            "VpcId",
-            Description="VpcId",
-            Type="AWS::EC2::VPC::Id",
+        self.add_shared_parameters("VpcId")
+
+        self.OriginPrefixList = self.template.add_parameter(Parameter(
+            "OriginPrefixList",
+            Type="String",
+            Default="",
+            AllowedPattern="^(pl-[0-9a-f]+)?$",
+            Description="Managed prefix list that alone may reach the load "
+                        "balancer, the region's "
+                        "com.amazonaws.global.cloudfront.origin-facing when "
+                        "the waf stack fronts it; blank admits the world",
         ))
 
+        self.SshCidr = self.template.add_parameter(Parameter(
+            "SshCidr",
+            Type="String",
+            Default="",
+            AllowedPattern="^((\\d{1,3}\\.){3}\\d{1,3}/\\d{1,2})?$",
+            ConstraintDescription="must be empty or an IPv4 CIDR",
+            Description="Network allowed to SSH to the web servers; blank "
+                        "admits none",
+        ))
+
+    def add_conditions(self):
+        self.template.add_condition(
+            "UseOriginPrefixList", Not(Equals(ref(self.OriginPrefixList), "")))
+        self.template.add_condition(
+            "UseSsh", Not(Equals(ref(self.SshCidr), "")))
+
     def add_resources(self):
 
         t = self.template
 
-        self.MountTargetSecurityGroup = t.add_resource(ec2.SecurityGroup(
-            "MountTargetSecurityGroup",
-            SecurityGroupIngress=[
-                {"ToPort": "2049", "IpProtocol": "tcp", "CidrIp": "0.0.0.0/0", "FromPort": "2049"}],
-            VpcId=Ref(self.VpcId),
-            GroupDescription=Join("-", [Ref(self.Project), "efs", "sg"]),
-            Tags=Tags(
-                Name=Join("-", [Ref(self.Project), "efs", "sg"]),
-                Environment=Ref(self.Environment),
-                Project=Ref(self.Project),
-            )
-        ))
-
-        self.ElbSecurityGroup = self.template.add_resource(ec2.SecurityGroup(
-            "ElbSecurityGroup",
-            SecurityGroupIngress=[
-                {"ToPort": "80", "IpProtocol": "tcp",
-                    "CidrIp": "0.0.0.0/0", "FromPort": "80"},
-                {"ToPort": "443", "IpProtocol": "tcp",
-                    "CidrIp": "0.0.0.0/0", "FromPort": "443"}
-            ],
-            VpcId=Ref(self.VpcId),
-            GroupDescription=Join("-", [Ref(self.Project), "elb", "sg"]),
-            Tags=Tags(
-                Name=Join("-", [Ref(self.Project), "elb", "sg"]),
-                Environment=Ref(self.Environment),
-                Project=Ref(self.Project),
-            )
+        self.groups = {}
+        for group, rules in self.rules.items():
+            title = group_names(group)[0]
+            inline = []
+            prefix_lists = {}
+            for rule in rules:
+                if rule.kind != sg_rules.PREFIX_LIST:
+                    continue
+                if rule.source not in prefix_lists:
+                    number = str(len(prefix_lists) + 1)
+                    prefix_lists[rule.source] = t.add_resource(ec2.PrefixList(
+                        group.capitalize() + "PrefixList" + number,
+                        PrefixListName=resource_name(group, number),
+                        AddressFamily=(
+                            "IPv6" if ":" in rule.source[0] else "IPv4"),
+                        MaxEntries=len(rule.source),
+                        Entries=[ec2.Entry(Cidr=cidr) for cidr in rule.source],
+                        Tags=standard_tags(group, number),
+                    ))
+                inline.append(self.rule(rule, SourcePrefixListId=ref(
+                    prefix_lists[rule.source])))
+            for rule in rules:
+                if rule.kind != sg_rules.CIDR:
+                    continue
+                if ":" in rule.source:
+                    inline.append(self.rule(rule, CidrIpv6=rule.source))
+                else:
+                    inline.append(self.rule(rule, CidrIp=rule.source))
+            if group == EDGE_GROUP:
+                inline = self.edge_ingress(rules, inline)
+            properties = {"SecurityGroupIngress": inline} if inline else {}
+            self.groups[group] = t.add_resource(ec2.SecurityGroup(
+                title,
+                VpcId=ref(self.VpcId),
+                GroupDescription=resource_name(group, "sg"),
+                Tags=standard_tags(group, "sg"),
+                **properties
+            ))
+            setattr(self, title, self.groups[group])
+
+        # Group to group rules are separate resources so that groups can
+        # admit each other without a circular dependency
+        for group, rules in self.rules.items():
+            for rule in rules:
+                if rule.kind != sg_rules.GROUP:
+                    continue
+                t.add_resource(ec2.SecurityGroupIngress(
+                    "{}IngressFrom{}{}{}".format(
+                        group.capitalize(), rule.source.capitalize(),
+                        "" if rule.protocol == "tcp"
+                        else rule.protocol.capitalize(),
+                        rule.from_port if rule.from_port == rule.to_port
+                        else "{}to{}".format(rule.from_port, rule.to_port)),
+                    GroupId=ref(self.groups[group]),
+                    SourceSecurityGroupId=ref(self.groups[rule.source]),
+                    Description="from " + rule.source,
+                    IpProtocol=rule.protocol,
+                    FromPort=rule.from_port,
+                    ToPort=rule.to_port,
+                ))
+
+        t.add_resource(ec2.SecurityGroupIngress(
+            SSH_GROUP.capitalize() + "IngressSsh",
+            Condition="UseSsh",
+            GroupId=ref(self.groups[SSH_GROUP]),
+            CidrIp=ref(self.SshCidr),
+            Description="SSH",
+            IpProtocol="tcp",
+            FromPort=SSH_PORT,
+            ToPort=SSH_PORT,
         ))
 
-        self.WebSecurityGroup = self.template.add_resource(ec2.SecurityGroup(
-            "WebSecurityGroup",
-            SecurityGroupIngress=[
-                {"ToPort": "80", "IpProtocol": "tcp",
-                    "CidrIp": "0.0.0.0/0", "FromPort": "80"},
-                {"ToPort": "22", "IpProtocol": "tcp",
-                    "CidrIp": "0.0.0.0/0", "FromPort": "22"}
-            ],
-            VpcId=Ref(self.VpcId),
-            GroupDescription=Join("-", [Ref(self.Project), "web", "sg"]),
-            Tags=Tags(
-                Name=Join("-", [Ref(self.Project), "web", "sg"]),
-                Environment=Ref(self.Environment),
-                Project=Ref(self.Project),
+    def edge_ingress(self, rules, inline):
+        """ ``inline``, or without its world rules behind the edge """
+        count = EDGE_WEIGHT + sum(
+            sg_rules.weight(rule) for rule in rules
+            if rule.kind != sg_rules.CIDR or rule.source not in WORLD)
+        if count > self.limit:
+            raise ValueError("{}: {} ingress rules behind the edge, over the "
+                             "limit of {}".format(EDGE_GROUP, count,
+                                                  self.limit))
+        kept = [
+            ingress for ingress in inline
+            if getattr(ingress, "CidrIp", None) not in WORLD
+            and getattr(ingress, "CidrIpv6", None) not in WORLD
+        ]
+        edge = [
+            ec2.SecurityGroupRule(
+                Description="CloudFront origin-facing",
+                IpProtocol="tcp",
+                FromPort=EDGE_PORT,
+                ToPort=EDGE_PORT,
+                SourcePrefixListId=ref(self.OriginPrefixList),
             )
-        ))
+        ] + kept
+        return If("UseOriginPrefixList", edge, inline)
 
-        self.RDSSecurityGroup = self.template.add_resource(ec2.SecurityGroup(
-            "RDSSecurityGroup",
-            SecurityGroupIngress=[
-                {"ToPort": "3306", "IpProtocol": "tcp", "CidrIp": "0.0.0.0/0", "FromPort": "3306"}],
-            VpcId=Ref(self.VpcId),
-            GroupDescription=Join("-", [Ref(self.Project), "rds", "sg"]),
-            Tags=Tags(
-                Name=Join("-", [Ref(self.Project), "rds", "sg"]),
-                Environment=Ref(self.Environment),
-                Project=Ref(self.Project),
-            )
-        ))
+    def rule(self, rule, **source):
+        return ec2.SecurityGroupRule(
+            IpProtocol=rule.protocol,
+            FromPort=rule.from_port,
+            ToPort=rule.to_port,
+            **source
+        )
 
     def add_outputs(self):
 
         self.template.add_output([
-            Output("EFSsg", Value=Ref(self.MountTargetSecurityGroup)),
-            Output("ELBsg", Value=Ref(self.ElbSecurityGroup)),
-            Output("WEBsg", Value=Ref(self.WebSecurityGroup)),
-            Output("RDSsg", Value=Ref(self.RDSSecurityGroup)),
+            Output(group_names(group)[1], Value=ref(resource))
+            for group, resource in sorted(self.groups.items())
         ])
 
 
 def sceptre_handler(sceptre_user_data):
-    return SecurityGroup(sceptre_user_data).template.to_json()
+    return serialize(
+        SecurityGroup(sceptre_user_data).template, sceptre_user_data)
 
 if __name__ == '__main__':
     print (sceptre_handler())
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Security group rule compiler.
+
+A rule specification maps each security group to its ingress rules::
+
+    web:
+      ingress:
+        - ports: 80
+          from: elb                   # another group of the same stack
+        - ports: [22, 8000-8080]
+          cidrs: [10.0.0.0/24, 10.0.1.0/24]
+        - ports: 443
+          cidrs: [...]
+          prefix_list: true           # one managed prefix list per family
+
+``compile_rules`` turns it into ``Rule`` tuples: ports are merged into
+ranges, CIDR lists are collapsed into the smallest covering set of prefixes
+and every group is checked against the per-group rule quota. A prefix list
+reference counts as its MaxEntries towards that quota, the way EC2 counts
+it, so prefix lists keep long lists manageable but do not lift the limit.
+"""
+
+import collections
+import ipaddress
+import re
+
+# Default EC2 quota of inbound rules per security group
+RULES_PER_GROUP = 60
+
+CIDR = "cidr"
+GROUP = "group"
+PREFIX_LIST = "prefix_list"
+
+GROUP_NAME = re.compile("^[a-z][a-z0-9]*$")
+
+Rule = collections.namedtuple(
+    "Rule", ["protocol", "from_port", "to_port", "kind", "source"])
+
+
+def aggregate(cidrs):
+    """
+    Smallest set of prefixes covering exactly ``cidrs``, IPv4 first
+
+    >>> aggregate(["10.0.1.0/24", "10.0.0.0/24", "10.0.0.128/25", "::/0"])
+    ['10.0.0.0/23', '::/0']
+    """
+    networks = [ipaddress.ip_network(cidr) for cidr in cidrs]
+    return [str(network) for version in (4, 6)
+            for network in ipaddress.collapse_addresses(
+                n for n in networks if n.version == version)]
+
+
+def port_ranges(ports):
+    """
+    Merge ports (numbers or ``"from-to"`` strings) into sorted ranges
+
+    >>> port_ranges([443, 80, 81, "8000-8080", 8080])
+    [(80, 81), (443, 443), (8000, 8080)]
+    """
+    if not isinstance(ports, list):
+        ports = [ports]
+    ranges = []
+    for port in ports:
+        low, _, high = str(port).partition("-")
+        ranges.append((int(low), int(high or low)))
+    merged = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(high, merged[-1][1]))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def weight(rule):
+    """ Rules a ``Rule`` counts as against the per-group quota """
+    return len(rule.source) if rule.kind == PREFIX_LIST else 1
+
+
+def _sources(group, rule, groups):
+    if "from" in rule:
+        if rule["from"] not in groups:
+            raise ValueError("{}: ingress from unknown group {!r}".format(
+                group, rule["from"]))
+        return [(GROUP, rule["from"])]
+    cidrs = aggregate(rule.get("cidrs", []))
+    if not cidrs:
+        raise ValueError("{}: ingress rule needs 'from' or 'cidrs'".format(
+            group))
+    if not rule.get("prefix_list"):
+        return [(CIDR, cidr) for cidr in cidrs]
+    families = collections.OrderedDict()
+    for cidr in cidrs:
+        families.setdefault(":" in cidr, []).append(cidr)
+    return [(PREFIX_LIST, tuple(entries)) for entries in families.values()]
+
+
+def compile_rules(spec, limit=RULES_PER_GROUP):
+    """
+    ``{group: [Rule, ...]}`` for a rule specification
+
+    >>> for rule in compile_rules({"elb": {}, "web": {"ingress": [
+    ...         {"ports": [80, 81], "from": "elb"},
+    ...         {"ports": "81-90", "from": "elb"}]}})["web"]:
+    ...     print(rule)
+    Rule(protocol='tcp', from_port=80, to_port=90, kind='group', source='elb')
+    """
+    compiled = collections.OrderedDict()
+    for group in sorted(spec):
+        if not GROUP_NAME.match(group):
+            raise ValueError("security group name {!r} must be lower case "
+                             "alphanumeric".format(group))
+        # Ports of every source, merged over all the rules naming it
+        ports = collections.OrderedDict()
+        for rule in (spec[group] or {}).get("ingress", []):
+            protocol = rule.get("protocol", "tcp")
+            for kind, source in _sources(group, rule, spec):
+                ports.setdefault((protocol, kind, source), []).extend(
+                    rule["ports"] if isinstance(rule["ports"], list)
+                    else [rule["ports"]])
+        rules = [Rule(protocol, from_port, to_port, kind, source)
+                 for (protocol, kind, source), merged in ports.items()
+                 for from_port, to_port in port_ranges(merged)]
+        count = sum(weight(rule) for rule in rules)
+        if count > limit:
+            raise ValueError("{}: {} ingress rules, over the limit of "
+                             "{}".format(group, count, limit))
+        compiled[group] = rules
+    return compiled
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
-from troposphere import Join, Output
-from troposphere import Parameter, Ref, Tags
-import troposphere.ec2 as ec2
-from base import CloudformationAbstractBaseClass
+from troposphere import Join, Output, Parameter
+from lazy import lazy_module
+from base import CloudformationAbstractBaseClass, ref, serialize, standard_tags
+
+ec2 = lazy_module("troposphere.ec2")
 
 
 class Vpc(CloudformationAbstractBaseClass):
@@ -90,148 +91,122 @@ class Vpc(CloudformationAbstractBaseClass):
 
         self.PublicRouteTable = t.add_resource(ec2.RouteTable(
             "PublicRouteTable",
-            VpcId=Ref("VPC"),
-            Tags=Tags(
-                Application=Ref("AWS::StackName"),
-                Network="Public",
-                Environment=Ref(self.Environment),
-                Name=Join("-", ["RT-PU-1", Ref(self.Project)]),
-            ),
+            VpcId=ref("VPC"),
+            Tags=standard_tags(
+                "RT-PU-1", project_first=False, project=False,
+                application=True, Network="Public"),
         ))
 
         self.GatewayToInternet = t.add_resource(ec2.VPCGatewayAttachment(
             "GatewayToInternet",
-            VpcId=Ref("VPC"),
-            InternetGatewayId=Ref("InternetGateway"),
+            VpcId=ref("VPC"),
+            InternetGatewayId=ref("InternetGateway"),
         ))
 
         self.PubSubnet1 = t.add_resource(ec2.Subnet(
             "PubSubnet1",
-            Tags=Tags(
-                Application=Ref("AWS::StackName"),
-                Environment=Ref(self.Environment),
-                Network="Public",
-                Name=Join("-", ["NT-PU-1", Ref(self.Project)]),
-            ),
-            VpcId=Ref("VPC"),
-            CidrBlock=Ref(self.PublicSubnet1),
-            AvailabilityZone=Ref(self.AvailabilityZone1),
+            Tags=standard_tags(
+                "NT-PU-1", project_first=False, project=False,
+                application=True, Network="Public"),
+            VpcId=ref("VPC"),
+            CidrBlock=ref(self.PublicSubnet1),
+            AvailabilityZone=ref(self.AvailabilityZone1),
             MapPublicIpOnLaunch=True,
         ))
 
         self.PubSubnet2 = t.add_resource(ec2.Subnet(
             "PubSubnet2",
-            Tags=Tags(
-                Application=Ref("AWS::StackName"),
-                Environment=Ref(self.Environment),
-                Network="Public",
-                Name=Join("-", ["NT-PU-2", Ref(self.Project)]),
-            ),
-            VpcId=Ref("VPC"),
-            CidrBlock=Ref(self.PublicSubnet2),
-            AvailabilityZone=Ref(self.AvailabilityZone2),
+            Tags=standard_tags(
+                "NT-PU-2", project_first=False, project=False,
+                application=True, Network="Public"),
+            VpcId=ref("VPC"),
+            CidrBlock=ref(self.PublicSubnet2),
+            AvailabilityZone=ref(self.AvailabilityZone2),
             MapPublicIpOnLaunch=True,
         ))
 
         self.PriSubnet2 = t.add_resource(ec2.Subnet(
             "PriSubnet2",
-            Tags=Tags(
-                Application=Ref("AWS::StackName"),
-                Environment=Ref(self.Environment),
-                Network="Private",
-                Name=Join("-", ["NT-PR-2", Ref(self.Project)]),
-            ),
-            VpcId=Ref("VPC"),
-            CidrBlock=Ref(self.PrivateSubnet2),
-            AvailabilityZone=Ref(self.AvailabilityZone2),
+            Tags=standard_tags(
+                "NT-PR-2", project_first=False, project=False,
+                application=True, Network="Private"),
+            VpcId=ref("VPC"),
+            CidrBlock=ref(self.PrivateSubnet2),
+            AvailabilityZone=ref(self.AvailabilityZone2),
         ))
 
         self.PriSubnet1 = t.add_resource(ec2.Subnet(
             "PriSubnet1",
-            Tags=Tags(
-                Application=Ref("AWS::StackName"),
-                Environment=Ref(self.Environment),
-                Network="Private",
-                Name=Join("-", ["NT-PR-1", Ref(self.Project)]),
-            ),
-            VpcId=Ref("VPC"),
-            CidrBlock=Ref(self.PrivateSubnet1),
-            AvailabilityZone=Ref(self.AvailabilityZone1),
+            Tags=standard_tags(
+                "NT-PR-1", project_first=False, project=False,
+                application=True, Network="Private"),
+            VpcId=ref("VPC"),
+            CidrBlock=ref(self.PrivateSubnet1),
+            AvailabilityZone=ref(self.AvailabilityZone1),
         ))
 
         self.PrivateRouteTable2 = t.add_resource(ec2.RouteTable(
             "PrivateRouteTable2",
-            VpcId=Ref("VPC"),
-            Tags=Tags(
-                Application=Ref("AWS::StackName"),
-                Environment=Ref(self.Environment),
-                Network="Private",
-                Name=Join("-", ["RT-PR-2", Ref(self.Project)]),
-            ),
+            VpcId=ref("VPC"),
+            Tags=standard_tags(
+                "RT-PR-2", project_first=False, project=False,
+                application=True, Network="Private"),
         ))
 
         self.PublicRoute = t.add_resource(ec2.Route(
             "PublicRoute",
-            GatewayId=Ref("InternetGateway"),
+            GatewayId=ref("InternetGateway"),
             DestinationCidrBlock="0.0.0.0/0",
-            RouteTableId=Ref(self.PublicRouteTable),
+            RouteTableId=ref(self.PublicRouteTable),
         ))
 
         self.PrivateRouteTable1 = t.add_resource(ec2.RouteTable(
             "PrivateRouteTable1",
-            VpcId=Ref("VPC"),
-            Tags=Tags(
-                Application=Ref("AWS::StackName"),
-                Environment=Ref(self.Environment),
-                Network="Private",
-                Name=Join("-", ["RT-PR-1", Ref(self.Project)]),
-            ),
+            VpcId=ref("VPC"),
+            Tags=standard_tags(
+                "RT-PR-1", project_first=False, project=False,
+                application=True, Network="Private"),
         ))
 
         self.PriSubnet2RTAssoc = t.add_resource(ec2.SubnetRouteTableAssociation(
             "PriSubnet2RTAssoc",
-            SubnetId=Ref(self.PriSubnet2),
-            RouteTableId=Ref(self.PrivateRouteTable2),
+            SubnetId=ref(self.PriSubnet2),
+            RouteTableId=ref(self.PrivateRouteTable2),
         ))
 
         self.InternetGateway = t.add_resource(ec2.InternetGateway(
             "InternetGateway",
-            Tags=Tags(
-                Application=Ref("AWS::StackName"),
-                Environment=Ref(self.Environment),
-                Network="Public",
-                Name=Join("-", ["IGW", Ref(self.Project)]),
-            ),
+            Tags=standard_tags(
+                "IGW", project_first=False, project=False,
+                application=True, Network="Public"),
         ))
 
         self.VPC = t.add_resource(ec2.VPC(
             "VPC",
-            CidrBlock=Ref(self.VpcCidr),
+            CidrBlock=ref(self.VpcCidr),
             EnableDnsSupport=True,
             EnableDnsHostnames=True,
-            Tags=Tags(
-                Name=Join("-", ["VPC", Ref(self.Project)]),
-                Environment=Ref(self.Environment),
-                Application=Ref("AWS::StackName"),
-            ),
+            Tags=standard_tags(
+                "VPC", project_first=False, project=False,
+                application=True),
         ))
 
         self.PubSubnet2RTAssoc = t.add_resource(ec2.SubnetRouteTableAssociation(
             "PubSubnet2RTAssoc",
-            SubnetId=Ref(self.PubSubnet2),
-            RouteTableId=Ref(self.PublicRouteTable),
+            SubnetId=ref(self.PubSubnet2),
+            RouteTableId=ref(self.PublicRouteTable),
         ))
 
         self.PubSubnet1RTAssoc = t.add_resource(ec2.SubnetRouteTableAssociation(
             "PubSubnet1RTAssoc",
-            SubnetId=Ref(self.PubSubnet1),
-            RouteTableId=Ref(self.PublicRouteTable),
+            SubnetId=ref(self.PubSubnet1),
+            RouteTableId=ref(self.PublicRouteTable),
         ))
 
         self.PriSubnet1RTAssoc = t.add_resource(ec2.SubnetRouteTableAssociation(
             "PriSubnet1RTAssoc",
-            SubnetId=Ref(self.PriSubnet1),
-            RouteTableId=Ref(self.PrivateRouteTable1),
+            SubnetId=ref(self.PriSubnet1),
+            RouteTableId=ref(self.PrivateRouteTable1),
         ))
 
     def add_outputs(self):
@@ -240,66 +215,67 @@ class Vpc(CloudformationAbstractBaseClass):
         self.InternetGateway = t.add_output(Output(
             "InternetGatewayID",
             Description="InternetGatewayID",
-            Value=Join("", [Ref(self.InternetGateway)]),
+            Value=Join("", [ref(self.InternetGateway)]),
         ))
 
         self.VpcId = t.add_output(Output(
             "VpcId",
             Description="VPC ID",
-            Value=Join("", [Ref(self.VPC)]),
+            Value=Join("", [ref(self.VPC)]),
         ))
 
         self.PublicRouteTable1 = t.add_output(Output(
             "PrivateRouteTable1",
             Description="Private Route Table1 ID.",
-            Value=Ref(self.PrivateRouteTable1),
+            Value=ref(self.PrivateRouteTable1),
         ))
 
         self.PublicRouteTable2 = t.add_output(Output(
             "PrivateRouteTable2",
             Description="Private Route Table2 ID.",
-            Value=Ref(self.PrivateRouteTable2),
+            Value=ref(self.PrivateRouteTable2),
         ))
 
         self.PublicRouteTable = t.add_output(Output(
             "PublicRouteTable",
             Description="Public Route Table.",
-            Value=Join("", [Ref(self.PublicRouteTable)]),
+            Value=Join("", [ref(self.PublicRouteTable)]),
         ))
 
         self.PublicSubnet1ID = t.add_output(Output(
             "PublicSubnet1ID",
             Description="Public Subnet 1 ID",
-            Value=Join("", [Ref(self.PubSubnet1)]),
+            Value=Join("", [ref(self.PubSubnet1)]),
         ))
 
         self.PublicSubnet2ID = t.add_output(Output(
             "PublicSubnet2ID",
             Description="Public Subnet 2 ID",
-            Value=Join("", [Ref(self.PubSubnet2)]),
+            Value=Join("", [ref(self.PubSubnet2)]),
         ))
 
         self.PrivateSubnet1ID = t.add_output(Output(
             "PrivateSubnet1ID",
             Description="Private Subnet 1 ID",
-            Value=Join("", [Ref(self.PriSubnet1)]),
+            Value=Join("", [ref(self.PriSubnet1)]),
         ))
 
         self.PrivateSubnet2ID = t.add_output(Output(
             "PrivateSubnet2ID",
             Description="Private Subnet 2 ID",
-            Value=Join("", [Ref(self.PriSubnet2)]),
+            Value=Join("", [ref(self.PriSubnet2)]),
         ))
 
         t.add_output(Output(
             "Environment",
             Description="Environment",
-            Value=Ref(self.Environment),
+            Value=ref(self.Environment),
         ))
 
 
 def sceptre_handler(sceptre_user_data):
-    return Vpc(sceptre_user_data).template.to_json()
+    return serialize(
+        Vpc(sceptre_user_data).template, sceptre_user_data)
 
 if __name__ == '__main__':
     print (sceptre_handler())
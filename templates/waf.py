@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+from troposphere import Equals, GetAtt, If, Not, Output, Parameter
+from lazy import lazy_module
+from base import CloudformationAbstractBaseClass, ref, serialize, standard_tags
+
+cloudfront = lazy_module("troposphere.cloudfront")
+wafv2 = lazy_module("troposphere.wafv2")
+
+# AWS managed rule groups, evaluated in this order after the path and rate
+# rules
+MANAGED_RULE_GROUPS = [
+    "AWSManagedRulesAmazonIpReputationList",
+    "AWSManagedRulesCommonRuleSet",
+    "AWSManagedRulesKnownBadInputsRuleSet",
+    "AWSManagedRulesPHPRuleSet",
+    "AWSManagedRulesWordPressRuleSet",
+]
+LOGIN_PATHS = ["/wp-login.php", "/xmlrpc.php"]
+XMLRPC_PATH = "/xmlrpc.php"
+
+# Rules of the managed groups that only count. The editor posts large bodies
+# and HTML to wp-admin and the REST API, which these rules block, so they
+# are blocked again by label by ``block-body-outside-admin`` everywhere else
+COUNTED_RULES = {
+    "AWSManagedRulesCommonRuleSet": [
+        "SizeRestrictions_BODY",
+        "CrossSiteScripting_BODY",
+    ],
+}
+COUNTED_LABELS = [
+    "awswaf:managed:aws:core-rule-set:SizeRestrictions_Body",
+    "awswaf:managed:aws:core-rule-set:CrossSiteScripting_Body",
+]
+ADMIN_PATHS = ["/wp-admin/", "/wp-json/"]
+
+# CloudFront managed policies: nothing is cached and the whole request
+# (Host header, cookies, query string) goes to the load balancer, so pages
+# behave as they do without the distribution
+CACHING_DISABLED_POLICY = "4135ea2d-6df8-44a3-9df3-4b5a84be39ad"
+ALL_VIEWER_POLICY = "216adef6-5c7f-47e4-b989-5492eafa07d3"
+ORIGIN_ID = "elb"
+
+
+def visibility(metric_name):
+    return wafv2.VisibilityConfig(
+        CloudWatchMetricsEnabled=True,
+        MetricName=metric_name,
+        SampledRequestsEnabled=True,
+    )
+
+
+def path_statement(path, position="ENDS_WITH"):
+    """ Matches requests for ``path`` (case insensitive) """
+    return wafv2.Statement(ByteMatchStatement=wafv2.ByteMatchStatement(
+        FieldToMatch=wafv2.FieldToMatch(UriPath={}),
+        PositionalConstraint=position,
+        SearchString=path,
+        TextTransformations=[
+            wafv2.TextTransformation(Priority=0, Type="LOWERCASE")],
+    ))
+
+
+def paths_statement(paths, position="ENDS_WITH"):
+    if len(paths) == 1:
+        return path_statement(paths[0], position)
+    return wafv2.Statement(OrStatement=wafv2.OrStatement(
+        Statements=[path_statement(path, position) for path in paths]))
+
+
+def rate_rule(name, priority, limit, paths=None):
+    """ Block an IP above ``limit`` requests (to ``paths``) per 5 minutes """
+    statement = wafv2.RateBasedStatement(AggregateKeyType="IP", Limit=limit)
+    if paths:
+        statement.ScopeDownStatement = paths_statement(paths)
+    return wafv2.WebACLRule(
+        Name=name,
+        Priority=priority,
+        Action=wafv2.RuleAction(Block=wafv2.BlockAction()),
+        Statement=wafv2.Statement(RateBasedStatement=statement),
+        VisibilityConfig=visibility(name),
+    )
+
+
+def block_rule(name, priority, paths):
+    return wafv2.WebACLRule(
+        Name=name,
+        Priority=priority,
+        Action=wafv2.RuleAction(Block=wafv2.BlockAction()),
+        Statement=paths_statement(paths),
+        VisibilityConfig=visibility(name),
+    )
+
+
+def managed_rule(group, priority):
+    statement = wafv2.ManagedRuleGroupStatement(VendorName="AWS", Name=group)
+    if group in COUNTED_RULES:
+        statement.RuleActionOverrides = [
+            wafv2.RuleActionOverride(
+                Name=name,
+                ActionToUse=wafv2.RuleAction(Count=wafv2.CountAction()))
+            for name in COUNTED_RULES[group]]
+    return wafv2.WebACLRule(
+        Name=group,
+        Priority=priority,
+        OverrideAction=wafv2.OverrideAction(**{"None": {}}),
+        Statement=wafv2.Statement(ManagedRuleGroupStatement=statement),
+        VisibilityConfig=visibility(group),
+    )
+
+
+def label_rule(name, priority, labels, except_paths):
+    """ Block requests with any of ``labels`` outside ``except_paths`` """
+    labelled = [
+        wafv2.Statement(LabelMatchStatement=wafv2.LabelMatchStatement(
+            Scope="LABEL", Key=label))
+        for label in labels]
+    return wafv2.WebACLRule(
+        Name=name,
+        Priority=priority,
+        Action=wafv2.RuleAction(Block=wafv2.BlockAction()),
+        Statement=wafv2.Statement(AndStatement=wafv2.AndStatement(Statements=[
+            wafv2.Statement(OrStatement=wafv2.OrStatement(
+                Statements=labelled)),
+            wafv2.Statement(NotStatement=wafv2.NotStatement(
+                Statement=paths_statement(except_paths, "STARTS_WITH"))),
+        ])),
+        VisibilityConfig=visibility(name),
+    )
+
+
+class Waf(CloudformationAbstractBaseClass):
+
+    def __init__(self, sceptre_user_data):
+        super(self.__class__, self).__init__()
+        self.template.set_description(
+            """Wordpress web ACL and CloudFront distribution""")
+        self.add_parameters()
+        self.add_conditions()
+        self.add_resources()
+        self.add_outputs()
+
+    def add_parameters(self):
+
+        t = self.template
+
+        self.OriginDomainName = t.add_parameter(Parameter(
+            "OriginDomainName",
+            Type="String",
+            Description="DNS name of the wordpress stack's load balancer",
+            MinLength="1",
+        ))
+
+        self.Fqdn = t.add_parameter(Parameter(
+            "Fqdn",
+            Type="String",
+            Description="Site hostname, served by the distribution when "
+                        "CertificateArn is set",
+        ))
+
+        self.CertificateArn = t.add_parameter(Parameter(
+            "CertificateArn",
+            Type="String",
+            Default="",
+            Description="ACM certificate (us-east-1) for Fqdn; blank serves "
+                        "only the cloudfront.net name",
+        ))
+
+        self.RateLimit = t.add_parameter(Parameter(
+            "RateLimit",
+            Description="Requests per 5 minutes from one IP before it is "
+                        "blocked",
+            Default="2000",
+            Type="Number",
+            MinValue="100",
+        ))
+
+        self.LoginRateLimit = t.add_parameter(Parameter(
+            "LoginRateLimit",
+            Description="Requests per 5 minutes from one IP to wp-login.php "
+                        "and xmlrpc.php before it is blocked",
+            Default="100",
+            Type="Number",
+            MinValue="100",
+        ))
+
+        self.BlockXmlrpc = t.add_parameter(Parameter(
+            "BlockXmlrpc",
+            Default="true",
+            ConstraintDescription="must be either true or false.",
+            Type="String",
+            Description="Block xmlrpc.php altogether (Jetpack and the "
+                        "mobile apps need it)",
+            AllowedValues=["true", "false"],
+        ))
+
+    def add_conditions(self):
+        self.template.add_condition(
+            "UseCertificate", Not(Equals(ref(self.CertificateArn), "")))
+        self.template.add_condition(
+            "UseXmlrpcBlock", Equals(ref(self.BlockXmlrpc), "true"))
+
+    def add_resources(self):
+
+        t = self.template
+
+        rules = [
+            If("UseXmlrpcBlock",
+               block_rule("block-xmlrpc", 0, [XMLRPC_PATH]),
+               ref("AWS::NoValue")),
+            rate_rule("login-rate-limit", 1, ref(self.LoginRateLimit),
+                      LOGIN_PATHS),
+            rate_rule("rate-limit", 2, ref(self.RateLimit)),
+        ]
+        rules.extend(managed_rule(group, priority)
+                     for priority, group in enumerate(
+                         MANAGED_RULE_GROUPS, len(rules)))
+        rules.append(label_rule("block-body-outside-admin", len(rules),
+                                COUNTED_LABELS, ADMIN_PATHS))
+
+        # Web ACLs for CloudFront can only be created in us-east-1
+        self.WebACL = t.add_resource(wafv2.WebACL(
+            "WebACL",
+            Name=ref("AWS::StackName"),
+            Scope="CLOUDFRONT",
+            DefaultAction=wafv2.DefaultAction(Allow=wafv2.AllowAction()),
+            Rules=rules,
+            VisibilityConfig=visibility("wordpress"),
+            Tags=standard_tags("waf"),
+        ))
+
+        self.Distribution = t.add_resource(cloudfront.Distribution(
+            "Distribution",
+            DistributionConfig=cloudfront.DistributionConfig(
+                Enabled=True,
+                Comment=ref(self.Fqdn),
+                Aliases=If("UseCertificate", [ref(self.Fqdn)],
+                           ref("AWS::NoValue")),
+                ViewerCertificate=If(
+                    "UseCertificate",
+                    cloudfront.ViewerCertificate(
+                        AcmCertificateArn=ref(self.CertificateArn),
+                        SslSupportMethod="sni-only",
+                        MinimumProtocolVersion="TLSv1.2_2021",
+                    ),
+                    cloudfront.ViewerCertificate(
+                        CloudFrontDefaultCertificate=True,
+                    )),
+                WebACLId=GetAtt(self.WebACL, "Arn"),
+                HttpVersion="http2",
+                PriceClass="PriceClass_100",
+                Origins=[cloudfront.Origin(
+                    Id=ORIGIN_ID,
+                    DomainName=ref(self.OriginDomainName),
+                    CustomOriginConfig=cloudfront.CustomOriginConfig(
+                        OriginProtocolPolicy="http-only",
+                        # Longer than the default 30s for wp-admin pages
+                        OriginReadTimeout=60,
+                    ),
+                )],
+                DefaultCacheBehavior=cloudfront.DefaultCacheBehavior(
+                    TargetOriginId=ORIGIN_ID,
+                    ViewerProtocolPolicy="allow-all",
+                    AllowedMethods=["GET", "HEAD", "OPTIONS", "PUT", "POST",
+                                    "PATCH", "DELETE"],
+                    CachePolicyId=CACHING_DISABLED_POLICY,
+                    OriginRequestPolicyId=ALL_VIEWER_POLICY,
+                    Compress=True,
+                ),
+            ),
+            Tags=standard_tags("cdn"),
+        ))
+
+    def add_outputs(self):
+
+        self.template.add_output([
+            Output("EdgeDomainName",
+                   Value=GetAtt(self.Distribution, "DomainName")),
+            Output("WebACLArn", Value=GetAtt(self.WebACL, "Arn")),
+            Output("WebACLName", Description="WebACL dimension of its "
+                   "AWS/WAFV2 metrics", Value=ref("AWS::StackName")),
+        ])
+
+
+def sceptre_handler(sceptre_user_data):
+    return serialize(Waf(sceptre_user_data).template, sceptre_user_data)
+
+if __name__ == '__main__':
+    print (sceptre_handler())
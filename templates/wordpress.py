@@ -1,39 +1,172 @@
 # -*- coding: utf-8 -*-
 
-from troposphere import Base64, FindInMap, GetAtt, Join, Output
-from troposphere import Parameter, Ref, Tags
-from constants import *
-import troposphere.ec2 as ec2
-import troposphere.route53 as route53
-import troposphere.elasticloadbalancing as elb
-import troposphere.cloudwatch as cloudwatch
-import troposphere.autoscaling as autoscaling
-import troposphere.cloudformation as cloudformation
-from base import CloudformationAbstractBaseClass
+from troposphere import And, Condition, Equals, FindInMap, GetAtt, If, Join
+from troposphere import Not, Output, Parameter
+from lazy import lazy_module
+from base import CloudformationAbstractBaseClass, ref, resource_name
+from base import serialize, standard_tags
+from constants import IMAGE_EXTENSIONS, IMAGE_VARIANTS
+from constants import MEDIA_UPLOAD_PREFIX, MEDIA_VARIANT_PREFIX
+import architectures
+import bootstrap
+import proxysql
+import schedule
+
+route53 = lazy_module("troposphere.route53")
+elb = lazy_module("troposphere.elasticloadbalancing")
+cloudwatch = lazy_module("troposphere.cloudwatch")
+autoscaling = lazy_module("troposphere.autoscaling")
+cloudformation = lazy_module("troposphere.cloudformation")
+s3 = lazy_module("troposphere.s3")
+iam = lazy_module("troposphere.iam")
+policies = lazy_module("troposphere.policies")
+
+# Cached copy of the DB credentials secret on the web servers
+CREDENTIALS_DIR = "/etc/wordpress"
+
+# With a schedule, instances launch (and resume from the warm pool) held by
+# this lifecycle hook until they answer locally with a warm opcache
+WARM_BOOT_HOOK = "WarmBoot"
+INSTALLED_MARKER = "/var/lib/wordpress/installed"
+
+# wp-cron runs from cron instead of on page loads. The lock is on EFS, so one
+# runner at a time across the fleet; with CronWorker=true only the instance
+# carrying CRON_WORKER_MARKER runs it.
+WP_CRON_LOCK = "/var/www/html/.wp-cron.lock"
+CRON_WORKER_MARKER = "/etc/wordpress-cron-worker"
+
+# ELB access logs land under this prefix of the access log bucket. Classic
+# load balancers write them as the regional Elastic Load Balancing account,
+# which the bucket policy has to name (tools/accesslogs.py reads them).
+ACCESS_LOG_PREFIX = "elb"
+ELB_LOG_ACCOUNTS = {
+    "us-east-1": "127311923021",
+    "us-east-2": "033677994240",
+    "us-west-1": "027434742980",
+    "us-west-2": "797873946194",
+    "ca-central-1": "985666609251",
+    "eu-west-1": "156460612806",
+    "eu-west-2": "652711504416",
+    "eu-west-3": "009996457667",
+    "eu-central-1": "054676820928",
+    "eu-north-1": "897822967062",
+    "ap-northeast-1": "582318560864",
+    "ap-northeast-2": "600734575887",
+    "ap-southeast-1": "114774131450",
+    "ap-southeast-2": "783225319266",
+    "ap-south-1": "718504428378",
+    "sa-east-1": "507241528517",
+}
+
+UPLOADS_DIR = "/var/www/html/wp-content/uploads"
+
+# Search offload plugin, pointed at the search stack's OpenSearch domain
+SEARCH_PLUGIN = "elasticpress"
+
+
+def any_case(text):
+    """
+    Glob pattern matching ``text`` in any case; aws s3 filters are case
+    sensitive
+
+    >>> any_case("jpg")
+    '[jJ][pP][gG]'
+    """
+    return "".join("[{}{}]".format(c.lower(), c.upper()) for c in text)
+
+
+def image_variants_conf():
+    """
+    Apache config serving <image>.<variant>, when it exists, to browsers
+    accepting the variant, in IMAGE_VARIANTS order
+    """
+    extensions = "|".join(IMAGE_EXTENSIONS)
+    lines = [
+        "<Directory {}>\n".format(UPLOADS_DIR),
+        "    RewriteEngine On\n",
+    ]
+    for variant in IMAGE_VARIANTS:
+        lines.extend([
+            "    RewriteCond %{{HTTP_ACCEPT}} image/{}\n".format(variant),
+            "    RewriteCond %{{REQUEST_FILENAME}}.{} -f\n".format(variant),
+            "    RewriteRule \\.({})$ %{{REQUEST_URI}}.{} "
+            "[NC,T=image/{},L]\n".format(extensions, variant, variant),
+        ])
+    lines.extend([
+        "    Header merge Vary Accept\n",
+        "</Directory>\n",
+    ])
+    return "".join(lines)
 
 
 class WordpressASG(CloudformationAbstractBaseClass):
 
     def __init__(self, sceptre_user_data):
         super(self.__class__, self).__init__()
+        self.sceptre_user_data = sceptre_user_data or {}
+        self.schedule = schedule.parse(self.sceptre_user_data)
         self.template.set_description("""Wordpress Web ASG""")
         self.add_parameters()
+        self.add_conditions()
         self.add_mapping()
         self.add_elb()
         self.add_resources()
         self.add_outputs()
 
     def add_mapping(self):
-        self.template.add_mapping("AWSRegion2AMI", UBUNTU_16_AMI)
+        self.ImageId = architectures.add_image(
+            self.template, self.InstanceType)
+        self.CronWorkerImageId = architectures.add_image(
+            self.template, self.CronWorkerInstanceType, "CronWorkerUseArm64")
+        self.template.add_mapping("ElbLogAccount", dict(
+            (region, {"AccountId": account})
+            for region, account in ELB_LOG_ACCOUNTS.items()))
+
+    def add_conditions(self):
+        self.template.add_condition(
+            "UseFailoverRouting", Not(Equals(ref(self.Failover), "none")))
+        self.template.add_condition(
+            "UseSimpleRouting", Equals(ref(self.Failover), "none"))
+        self.template.add_condition(
+            "IsStandby", Equals(ref(self.Standby), "true"))
+        self.template.add_condition(
+            "IsActive", Equals(ref(self.Standby), "false"))
+        self.template.add_condition(
+            "UseCronWorker", And(Equals(ref(self.CronWorker), "true"),
+                                 Condition("IsActive")))
+        self.template.add_condition(
+            "FixedCapacity", Equals(ref(self.WebServerMaxCapacity), "0"))
+        self.template.add_condition(
+            "UseMedia", Not(Equals(ref(self.MediaBucket), "")))
+        self.template.add_condition(
+            "UseProxySQL", Equals(ref(self.ProxySQL), "true"))
+        self.template.add_condition(
+            "UseSearch", Not(Equals(ref(self.SearchEndpoint), "")))
+        self.template.add_condition(
+            "UseEdge", Not(Equals(ref(self.EdgeDomainName), "")))
 
     def add_parameters(self):
 
         t = self.template
 
-        self.VpcId = t.add_parameter(Parameter(
-            "VpcId",
-            Description="VpcId",
-            Type="AWS::EC2::VPC::Id",
+        self.add_shared_parameters(
+            "VpcId", "DBName", "KeyName", "Subnet1", "Subnet2")
+
+        self.DBSecretArn = t.add_parameter(Parameter(
+            "DBSecretArn",
+            Type="String",
+            Description="ARN of the Secrets Manager secret of the WordPress "
+                        "DB credentials, in this region",
+            MinLength="1",
+        ))
+
+        self.DBMasterSecretArn = t.add_parameter(Parameter(
+            "DBMasterSecretArn",
+            Type="String",
+            Description="ARN of the Secrets Manager secret of the DB master "
+                        "credentials, in this region, used to create the "
+                        "WordPress user",
+            MinLength="1",
         ))
 
         self.Hostname = t.add_parameter(Parameter(
@@ -59,26 +192,6 @@ class WordpressASG(CloudformationAbstractBaseClass):
             ConstraintDescription="can contain only ASCII characters.",
         ))
 
-        self.DBName = t.add_parameter(Parameter(
-            "DBName",
-            Type="String",
-            Description="DB Name",
-            Default="mydb",
-            MinLength="1",
-            AllowedPattern="[a-zA-Z0-9]*",
-            MaxLength="64",
-            ConstraintDescription="Must be alphanumeric string",
-        ))
-
-        self.DBPass = t.add_parameter(Parameter(
-            "DBPass",
-            MinLength="8",
-            Type="String",
-            NoEcho=True,
-            Description="The database admin account password",
-            MaxLength="41",
-        ))
-
         self.FileSystemID = t.add_parameter(Parameter(
             "FileSystemID",
             Type="String",
@@ -88,41 +201,6 @@ class WordpressASG(CloudformationAbstractBaseClass):
             ConstraintDescription="Must be a valid EFS FileSystemID",
         ))
 
-        self.DBUser = t.add_parameter(Parameter(
-            "DBUser",
-            ConstraintDescription=(
-                "must begin with a letter and contain only alphanumeric "
-                "characters."),
-            Description="Username for MySQL database access",
-            MinLength="1",
-            AllowedPattern="[a-zA-Z][a-zA-Z0-9]*",
-            NoEcho=True,
-            MaxLength="80",
-            Type="String",
-        ))
-
-        self.KeyName = t.add_parameter(Parameter(
-            "KeyName",
-            ConstraintDescription=(
-                "must be the name of an existing EC2 KeyPair."),
-            Type="AWS::EC2::KeyPair::KeyName",
-            Description=(
-                "Name of an existing EC2 KeyPair to enable SSH access to the "
-                "instances"),
-        ))
-
-        self.Subnet1 = self.template.add_parameter(Parameter(
-            "Subnet1",
-            Type="AWS::EC2::Subnet::Id",
-            Description="Subnet1 ID",
-        ))
-
-        self.Subnet2 = self.template.add_parameter(Parameter(
-            "Subnet2",
-            Type="AWS::EC2::Subnet::Id",
-            Description="Subnet2 ID",
-        ))
-
         self.AvailabilityZone1 = t.add_parameter(Parameter(
             "AvailabilityZone1",
             Default="eu-west-1a",
@@ -140,7 +218,8 @@ class WordpressASG(CloudformationAbstractBaseClass):
         self.InstanceType = t.add_parameter(Parameter(
             "InstanceType",
             Default="t2.micro",
-            ConstraintDescription="must be a valid EC2 instance type.",
+            AllowedValues=list(architectures.instance_types()),
+            ConstraintDescription="must be a supported EC2 instance type.",
             Type="String",
             Description="Instance type",
         ))
@@ -155,6 +234,17 @@ class WordpressASG(CloudformationAbstractBaseClass):
             ConstraintDescription="must be between 1 and 20 EC2 instances.",
         ))
 
+        self.WebServerMaxCapacity = t.add_parameter(Parameter(
+            "WebServerMaxCapacity",
+            Description="Most WebServer instances the scaling policies may "
+                        "add up to; 0 keeps the group at WebServerCapacity",
+            Default="0",
+            Type="Number",
+            MaxValue="20",
+            MinValue="0",
+            ConstraintDescription="must be between 0 and 20 EC2 instances.",
+        ))
+
         self.WebSecurityGroup = t.add_parameter(Parameter(
             "WebSecurityGroup",
             Description="Web SG",
@@ -165,22 +255,194 @@ class WordpressASG(CloudformationAbstractBaseClass):
             "ElbSecurityGroup",
             Description="ELB SG",
             Type="AWS::EC2::SecurityGroup::Id",
-        ))        
+        ))
+
+        self.Failover = t.add_parameter(Parameter(
+            "Failover",
+            Default="none",
+            Type="String",
+            Description=(
+                "Publish the hostname as the PRIMARY or SECONDARY failover "
+                "record of this region instead of a simple CNAME"),
+            AllowedValues=["none", "PRIMARY", "SECONDARY"],
+        ))
+
+        self.Standby = t.add_parameter(Parameter(
+            "Standby",
+            Default="false",
+            ConstraintDescription="must be either true or false.",
+            Type="String",
+            Description=(
+                "Run no web servers until the region is promoted; its EFS "
+                "replica is read-only until then"),
+            AllowedValues=["true", "false"],
+        ))
+
+        self.EdgeDomainName = t.add_parameter(Parameter(
+            "EdgeDomainName",
+            Default="",
+            Type="String",
+            Description=(
+                "CloudFront domain of the waf stack to publish the hostname "
+                "as, instead of the load balancer; blank for none"),
+        ))
+
+        self.AccessLogInterval = t.add_parameter(Parameter(
+            "AccessLogInterval",
+            Default="60",
+            Type="Number",
+            Description="Minutes between ELB access log files",
+            AllowedValues=["5", "60"],
+        ))
+
+        self.AccessLogRetention = t.add_parameter(Parameter(
+            "AccessLogRetention",
+            Default="30",
+            Type="Number",
+            Description="Days to keep ELB access logs",
+            MinValue="1",
+        ))
+
+        self.SearchEndpoint = t.add_parameter(Parameter(
+            "SearchEndpoint",
+            Default="",
+            Type="String",
+            Description=(
+                "Endpoint of the search stack's OpenSearch domain; empty "
+                "leaves search in MySQL"),
+        ))
+
+        self.MediaBucket = t.add_parameter(Parameter(
+            "MediaBucket",
+            Default="",
+            Type="String",
+            Description=(
+                "Bucket of the media stack; empty serves uploaded images "
+                "as they are"),
+        ))
+
+        self.ProxySQL = t.add_parameter(Parameter(
+            "ProxySQL",
+            Default="false",
+            ConstraintDescription="must be either true or false.",
+            Type="String",
+            Description=(
+                "Run ProxySQL on every web server, pooling its database "
+                "connections and caching option and term lookups"),
+            AllowedValues=["true", "false"],
+        ))
+
+        self.ProxySQLCacheTTL = t.add_parameter(Parameter(
+            "ProxySQLCacheTTL",
+            Description="Milliseconds ProxySQL serves a cached lookup for",
+            Default="5000",
+            Type="Number",
+            MinValue="0",
+        ))
+
+        self.ProxySQLMaxConnections = t.add_parameter(Parameter(
+            "ProxySQLMaxConnections",
+            Description="Most database connections of one web server's "
+                        "ProxySQL",
+            Default="20",
+            Type="Number",
+            MinValue="1",
+        ))
+
+        self.CronWorker = t.add_parameter(Parameter(
+            "CronWorker",
+            Default="false",
+            ConstraintDescription="must be either true or false.",
+            Type="String",
+            Description=(
+                "Run wp-cron on a dedicated worker instance instead of on "
+                "the web servers"),
+            AllowedValues=["true", "false"],
+        ))
+
+        self.CronWorkerInstanceType = t.add_parameter(Parameter(
+            "CronWorkerInstanceType",
+            Default="t3.micro",
+            AllowedValues=list(architectures.instance_types()),
+            ConstraintDescription="must be a supported EC2 instance type.",
+            Type="String",
+            Description="Instance type of the wp-cron worker",
+        ))
 
     def add_elb(self):
 
+        # Kept on stack deletion; the lifecycle rule empties it
+        self.AccessLogBucket = self.template.add_resource(s3.Bucket(
+            "AccessLogBucket",
+            DeletionPolicy="Retain",
+            BucketEncryption=s3.BucketEncryption(
+                ServerSideEncryptionConfiguration=[
+                    s3.ServerSideEncryptionRule(
+                        ServerSideEncryptionByDefault=s3.ServerSideEncryptionByDefault(
+                            SSEAlgorithm="AES256",
+                        ),
+                    ),
+                ],
+            ),
+            PublicAccessBlockConfiguration=s3.PublicAccessBlockConfiguration(
+                BlockPublicAcls=True,
+                BlockPublicPolicy=True,
+                IgnorePublicAcls=True,
+                RestrictPublicBuckets=True,
+            ),
+            LifecycleConfiguration=s3.LifecycleConfiguration(Rules=[
+                s3.LifecycleRule(
+                    Id="expire-access-logs",
+                    Status="Enabled",
+                    ExpirationInDays=ref(self.AccessLogRetention),
+                ),
+            ]),
+            Tags=standard_tags("elb", "logs"),
+        ))
+
+        self.AccessLogBucketPolicy = self.template.add_resource(s3.BucketPolicy(
+            "AccessLogBucketPolicy",
+            Bucket=ref(self.AccessLogBucket),
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Action": ["s3:PutObject"],
+                        "Effect": "Allow",
+                        "Principal": {"AWS": Join("", [
+                            "arn:", ref("AWS::Partition"), ":iam::",
+                            FindInMap("ElbLogAccount", ref("AWS::Region"),
+                                      "AccountId"),
+                            ":root"])},
+                        "Resource": [Join("", [
+                            GetAtt(self.AccessLogBucket, "Arn"), "/",
+                            ACCESS_LOG_PREFIX, "/AWSLogs/",
+                            ref("AWS::AccountId"), "/*"])]
+                    }
+                ]
+            },
+        ))
+
         self.ElasticLoadBalancer = self.template.add_resource(elb.LoadBalancer(
             "ElbWeb",
-            Subnets=[Ref(self.Subnet1), Ref(self.Subnet2)],
+            Subnets=[ref(self.Subnet1), ref(self.Subnet2)],
             Listeners=[{"InstancePort": "80",
                         "LoadBalancerPort": "80", "Protocol": "HTTP"}],
             CrossZone="true",
-            LoadBalancerName=Join("-", ["elb", Ref(self.Project)]),
-            SecurityGroups=[Ref(self.ElbSecurityGroup)],
+            LoadBalancerName=resource_name("elb", project_first=False),
+            SecurityGroups=[ref(self.ElbSecurityGroup)],
             ConnectionDrainingPolicy=elb.ConnectionDrainingPolicy(
                 Enabled=True,
                 Timeout=300,
             ),
+            AccessLoggingPolicy=elb.AccessLoggingPolicy(
+                Enabled=True,
+                EmitInterval=ref(self.AccessLogInterval),
+                S3BucketName=ref(self.AccessLogBucket),
+                S3BucketPrefix=ACCESS_LOG_PREFIX,
+            ),
+            # The load balancer checks that it can write to the bucket
+            DependsOn=[self.AccessLogBucketPolicy],
             HealthCheck=elb.HealthCheck(
                 HealthyThreshold="3",
                 Interval="30",
@@ -188,20 +450,52 @@ class WordpressASG(CloudformationAbstractBaseClass):
                 Timeout="5",
                 UnhealthyThreshold="5",
             ),
-            Tags=Tags(
-                Name=Join("-", ["ELB", Ref(self.Project)]),
-                Environment=Ref(self.Environment),
-            ),
+            Tags=standard_tags("ELB", project_first=False, project=False),
         ))
 
+        # Through the waf stack's distribution when there is one
+        site_target = If("UseEdge", ref(self.EdgeDomainName),
+                         GetAtt(self.ElasticLoadBalancer, "DNSName"))
+
         self.ELBcname = self.template.add_resource(route53.RecordSetType(
             "ELBcname",
-            HostedZoneName=Join("", [Ref(self.Domain), "."]),
+            Condition="UseSimpleRouting",
+            HostedZoneName=Join("", [ref(self.Domain), "."]),
             Comment="CNAME to Web ELB",
-            Name=Join(".", [Ref(self.Hostname), Ref(self.Domain)]),
+            Name=Join(".", [ref(self.Hostname), ref(self.Domain)]),
             Type="CNAME",
             TTL="60",
-            ResourceRecords=[GetAtt(self.ElasticLoadBalancer, "DNSName")]
+            ResourceRecords=[site_target]
+        ))
+
+        self.ElbHealthCheck = self.template.add_resource(route53.HealthCheck(
+            "ElbHealthCheck",
+            Condition="UseFailoverRouting",
+            HealthCheckConfig=route53.HealthCheckConfig(
+                Type="HTTP",
+                FullyQualifiedDomainName=GetAtt(
+                    self.ElasticLoadBalancer, "DNSName"),
+                Port=80,
+                ResourcePath="/",
+                RequestInterval=30,
+                FailureThreshold=3,
+            ),
+        ))
+
+        # Route53 answers with the secondary only while the primary's
+        # health check fails
+        self.ELBfailover = self.template.add_resource(route53.RecordSetType(
+            "ELBfailover",
+            Condition="UseFailoverRouting",
+            HostedZoneName=Join("", [ref(self.Domain), "."]),
+            Comment="Failover record to Web ELB",
+            Name=Join(".", [ref(self.Hostname), ref(self.Domain)]),
+            Type="CNAME",
+            TTL="60",
+            SetIdentifier=ref("AWS::Region"),
+            Failover=ref(self.Failover),
+            HealthCheckId=ref(self.ElbHealthCheck),
+            ResourceRecords=[site_target]
         ))
 
     def add_resources(self):
@@ -209,8 +503,13 @@ class WordpressASG(CloudformationAbstractBaseClass):
         metadata = {
             "AWS::CloudFormation::Init": {
                 "configSets": {
-                    "wordpress_install": [
-                        "install_wordpress"]
+                    "wordpress_install": If(
+                        "UseProxySQL",
+                        If("UseMedia",
+                           ["install_wordpress", "proxysql", "media"],
+                           ["install_wordpress", "proxysql"]),
+                        If("UseMedia", ["install_wordpress", "media"],
+                           ["install_wordpress"]))
                 },
                 "install_wordpress": {
                     "packages": {
@@ -218,13 +517,12 @@ class WordpressASG(CloudformationAbstractBaseClass):
                             "apache2": [],
                             "php": [],
                             "php-mysql": [],
-                            "php7.0": [],
-                            "php7.0-mysql": [],
-                            "libapache2-mod-php7.0": [],
-                            "php7.0-cli": [],
-                            "php7.0-cgi": [],
-                            "php7.0-gd": [],
+                            "libapache2-mod-php": [],
+                            "php-cli": [],
+                            "php-cgi": [],
+                            "php-gd": [],
                             "mysql-client": [],
+                            "awscli": [],
                             "sendmail": []
                         }
                     },
@@ -237,30 +535,173 @@ class WordpressASG(CloudformationAbstractBaseClass):
                                 "Fn::Join": ["", [
                                     "#!/bin/bash\n",
                                     "cp /var/www/html/wordpress/wp-config-sample.php /var/www/html/wordpress/wp-config.php\n",
-                                    "sed -i \"s/'database_name_here'/'", Ref(
+                                    "sed -i \"s/'database_name_here'/'", ref(
                                         self.DBName), "'/g\" wp-config.php\n",
-                                    "sed -i \"s/'username_here'/'", Ref(
-                                        self.DBUser), "'/g\" wp-config.php\n",
-                                    "sed -i \"s/'password_here'/'", Ref(
-                                        self.DBPass), "'/g\" wp-config.php\n",
-                                    "sed -i \"s/'localhost'/'", Ref(
-                                        self.RDSEndpoint), "'/g\" wp-config.php\n"
+                                    "sed -i \"s/'localhost'/'", If(
+                                        "UseProxySQL", "127.0.0.1:{}".format(
+                                            proxysql.LISTEN_PORT),
+                                        ref(self.RDSEndpoint)),
+                                    "'/g\" wp-config.php\n",
+                                    "sed -i \"/'DB_USER'/d; /'DB_PASSWORD'/d\" wp-config.php\n",
+                                    "sed -i \"1a require '", CREDENTIALS_DIR,
+                                    "/db-credentials.php';\" wp-config.php\n",
+                                    "sed -i \"1a define('DISABLE_WP_CRON', true);\" wp-config.php\n",
+                                    # Read by configure-search's ElasticPress
+                                    If("UseSearch", Join("", [
+                                        "sed -i \"1a define('EP_HOST', 'https://",
+                                        ref(self.SearchEndpoint),
+                                        "');\" wp-config.php\n"]), "")
                                 ]]
                             },
                             "mode": "000500",
                             "owner": "root",
                             "group": "root"
+                        },
+                        "/usr/local/bin/refresh-db-credentials": {
+                            "content": self.refresh_credentials_script(),
+                            "mode": "000500",
+                            "owner": "root",
+                            "group": "root"
+                        },
+                        "/usr/local/bin/run-wp-cron": {
+                            "content": Join("", [
+                                "#!/bin/bash\n",
+                                "if [ '", ref(self.CronWorker), "' = true ] &&"
+                                " [ ! -f ", CRON_WORKER_MARKER, " ]; then\n",
+                                "  exit 0\n",
+                                "fi\n",
+                                "exec flock -n ", WP_CRON_LOCK,
+                                " sudo -u www-data /usr/local/bin/wp cron event"
+                                " run --due-now --quiet --path=/var/www/html\n",
+                            ]),
+                            "mode": "000500",
+                            "owner": "root",
+                            "group": "root"
+                        },
+                        "/usr/local/bin/configure-search": {
+                            "content": self.configure_search_script(),
+                            "mode": "000500",
+                            "owner": "root",
+                            "group": "root"
+                        },
+                        "/usr/local/bin/rehome-wordpress": {
+                            "content": self.rehome_script(),
+                            "mode": "000500",
+                            "owner": "root",
+                            "group": "root"
+                        },
+                        "/etc/cron.d/wp-cron": {
+                            "content": "* * * * * root /usr/local/bin/run-wp-cron\n",
+                            "mode": "000644",
+                            "owner": "root",
+                            "group": "root"
+                        },
+                        "/etc/cron.d/refresh-db-credentials": {
+                            "content": "".join([
+                                "SHELL=/bin/bash\n",
+                                "* * * * * root sleep $((RANDOM \\% 30)) && "
+                                "/usr/local/bin/refresh-db-credentials\n",
+                            ]),
+                            "mode": "000644",
+                            "owner": "root",
+                            "group": "root"
                         }
                     },
                     "commands": {
-                        "01_configure_wordpress": {
+                        "01_fetch_db_credentials": {
+                            "command": "/usr/local/bin/refresh-db-credentials"
+                        },
+                        "02_configure_wordpress": {
                             "command": "/tmp/create-wp-config",
                             "cwd": "/var/www/html/wordpress"
                         }
                     }
+                },
+                # Only in the config set with UseMedia
+                "media": {
+                    "files": {
+                        "/usr/local/bin/sync-media": {
+                            "content": self.sync_media_script(),
+                            "mode": "000500",
+                            "owner": "root",
+                            "group": "root"
+                        },
+                        "/etc/cron.d/sync-media": {
+                            "content": "* * * * * root /usr/local/bin/sync-media\n",
+                            "mode": "000644",
+                            "owner": "root",
+                            "group": "root"
+                        },
+                        "/etc/apache2/conf-available/image-variants.conf": {
+                            "content": image_variants_conf(),
+                            "mode": "000644",
+                            "owner": "root",
+                            "group": "root"
+                        }
+                    },
+                    "commands": {
+                        "01_enable_image_variants": {
+                            "command": "a2enmod rewrite headers && "
+                                       "a2enconf image-variants"
+                        }
+                    }
+                },
+                # Only in the config set with UseProxySQL. Runs after
+                # install_wordpress has fetched the DB credentials.
+                "proxysql": {
+                    "files": {
+                        proxysql.CONFIG_TEMPLATE: {
+                            "content": Join("", proxysql.config(
+                                ref(self.RDSEndpoint),
+                                ref(self.ProxySQLCacheTTL),
+                                ref(self.ProxySQLMaxConnections))),
+                            "mode": "000600",
+                            "owner": "root",
+                            "group": "root"
+                        },
+                        "/usr/local/bin/install-proxysql": {
+                            "content": proxysql.INSTALL_SCRIPT,
+                            "mode": "000500",
+                            "owner": "root",
+                            "group": "root"
+                        },
+                        "/usr/local/bin/sync-proxysql-users": {
+                            "content": proxysql.USERS_SCRIPT,
+                            "mode": "000500",
+                            "owner": "root",
+                            "group": "root"
+                        },
+                        "/usr/local/bin/proxysql-metrics": {
+                            "content": Join("", [
+                                "#!/bin/bash\n",
+                                "STACK_NAME=", ref("AWS::StackName"), "\n",
+                                "AWS_REGION=", ref("AWS::Region"), "\n",
+                                proxysql.METRICS_SCRIPT,
+                            ]),
+                            "mode": "000500",
+                            "owner": "root",
+                            "group": "root"
+                        },
+                        "/etc/cron.d/proxysql-metrics": {
+                            "content": "* * * * * root /usr/local/bin/proxysql-metrics\n",
+                            "mode": "000644",
+                            "owner": "root",
+                            "group": "root"
+                        }
+                    },
+                    "commands": {
+                        "01_install_proxysql": {
+                            "command": "/usr/local/bin/install-proxysql && "
+                                       "/usr/local/bin/sync-proxysql-users " +
+                                       CREDENTIALS_DIR + "/my.cnf"
+                        }
+                    }
                 }
             }
         }
+        if self.schedule:
+            self.add_warm_boot(
+                metadata["AWS::CloudFormation::Init"]["install_wordpress"])
 
         self.WaitHandle = self.template.add_resource(cloudformation.WaitConditionHandle(
             "WaitHandle",
@@ -268,84 +709,192 @@ class WordpressASG(CloudformationAbstractBaseClass):
 
         self.WaitCondition = self.template.add_resource(cloudformation.WaitCondition(
             "WaitCondition",
-            Handle=Ref(self.WaitHandle),
+            Condition="IsActive",
+            Handle=ref(self.WaitHandle),
             Timeout="600",
             DependsOn="WebServerAutoScalingGroup",
         ))
 
+        role_policies = [iam.Policy(
+            PolicyName="db-credentials",
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Action": ["secretsmanager:GetSecretValue"],
+                        "Effect": "Allow",
+                        "Resource": [ref(self.DBSecretArn),
+                                     ref(self.DBMasterSecretArn)]
+                    }
+                ]
+            },
+        )]
+        role_policies.append(iam.Policy(
+            PolicyName="metrics",
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Action": ["cloudwatch:PutMetricData"],
+                        "Effect": "Allow",
+                        "Resource": ["*"],
+                        "Condition": {"StringEquals": {
+                            "cloudwatch:namespace": [
+                                bootstrap.PHASE_NAMESPACE,
+                                proxysql.METRICS_NAMESPACE,
+                            ],
+                        }}
+                    }
+                ]
+            },
+        ))
+        role_policies.append(If("UseMedia", iam.Policy(
+            PolicyName="media-sync",
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Action": ["s3:ListBucket"],
+                        "Effect": "Allow",
+                        "Resource": [Join("", [
+                            "arn:", ref("AWS::Partition"), ":s3:::",
+                            ref(self.MediaBucket)])]
+                    },
+                    {
+                        "Action": ["s3:PutObject"],
+                        "Effect": "Allow",
+                        "Resource": [Join("", [
+                            "arn:", ref("AWS::Partition"), ":s3:::",
+                            ref(self.MediaBucket), "/",
+                            MEDIA_UPLOAD_PREFIX, "*"])]
+                    },
+                    {
+                        "Action": ["s3:GetObject"],
+                        "Effect": "Allow",
+                        "Resource": [Join("", [
+                            "arn:", ref("AWS::Partition"), ":s3:::",
+                            ref(self.MediaBucket), "/",
+                            MEDIA_VARIANT_PREFIX, "*"])]
+                    }
+                ]
+            },
+        ), ref("AWS::NoValue")))
+        if self.schedule:
+            role_policies.append(iam.Policy(
+                PolicyName="warm-boot",
+                PolicyDocument={
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Action": [
+                                "autoscaling:CompleteLifecycleAction",
+                                "autoscaling:DescribeAutoScalingInstances",
+                                "cloudwatch:PutMetricData",
+                            ],
+                            "Effect": "Allow",
+                            "Resource": ["*"]
+                        }
+                    ]
+                },
+            ))
+
+        self.WebServerRole = self.template.add_resource(iam.Role(
+            "WebServerRole",
+            Policies=role_policies,
+            AssumeRolePolicyDocument={
+                "Version": "2008-10-17",
+                "Statement": [
+                    {
+                        "Action": ["sts:AssumeRole"],
+                        "Effect": "Allow",
+                        "Principal": {"Service": ["ec2.amazonaws.com"]}
+                    }
+                ]
+            }
+        ))
+
+        self.WebServerProfile = self.template.add_resource(iam.InstanceProfile(
+            "WebServerProfile",
+            Roles=[ref(self.WebServerRole)]
+        ))
+
         self.WebServerLaunchConfiguration = self.template.add_resource(autoscaling.LaunchConfiguration(
             "WebServerLaunchConfiguration",
             Metadata=metadata,
-            UserData=Base64(Join("", [
-                "#!/bin/bash -x\n",
-                "apt-get update\n",
-                "apt-get install python-pip nfs-common -y \n",
-                "mkdir -p /var/www/html/\n",
-                "EC2_AZ=$(curl -s http://169.254.169.254/latest/meta-data/placement/availability-zone)\n",
-                "echo \"$EC2_AZ.", Ref(self.FileSystemID), ".efs.", Ref(
-                    "AWS::Region"), ".amazonaws.com:/ /var/www/html/ nfs4 nfsvers=4.1,rsize=1048576,wsize=1048576,hard,timeo=600,retrans=2 0 0\" >> /etc/fstab\n"
-                "mount -a\n",
-                "pip install https://s3.amazonaws.com/cloudformation-examples/aws-cfn-bootstrap-latest.tar.gz\n",
-
-                # "exec > /tmp/userdata.log 2>&1\n",
-                "/usr/local/bin/cfn-init -v  --stack ", Ref("AWS::StackName"),
-                "         --resource WebServerLaunchConfiguration ",
-                "         --configsets wordpress_install ",
-                "         --region ", Ref("AWS::Region"),
-                "\n",
-                "/bin/mv /var/www/html/wordpress/* /var/www/html/\n",
-                "/bin/rm -f /var/www/html/index.html\n",
-                "/bin/rm -rf /var/www/html/wordpress/\n",
-                "chown www-data:www-data /var/www/html/* -R\n",
-                "/usr/sbin/service apache2 restart\n",
-                "/usr/bin/curl -O https://raw.githubusercontent.com/wp-cli/builds/gh-pages/phar/wp-cli.phar\n",
-                "/bin/chmod +x wp-cli.phar\n",
-                "/bin/mv wp-cli.phar /usr/local/bin/wp\n",
-                "cd /var/www/html/\n",
-                "if ! $(sudo -u www-data /usr/local/bin/wp core is-installed); then\n",
-                "sudo -u www-data /usr/local/bin/wp core install ",
-                "--url='", Ref(self.Hostname), ".", Ref(self.Domain), "' ",
-                "--title='Cloudreach Meetup - ", Ref(
-                    self.Environment), "' ",
-                "--admin_user='root' ",
-                "--admin_password='wordpress' ",
-                "--admin_email='meetup@cloudreach.com'\n",
-                "fi\n",
-
-                "/usr/local/bin/cfn-signal -e $? --stack ", Ref(
-                    "AWS::StackName"), "   -r \"Webserver setup complete\" '", Ref(self.WaitHandle), "'\n"
-
-            ]
-            )),
-            ImageId=FindInMap("AWSRegion2AMI", Ref("AWS::Region"), "AMI"),
-            KeyName=Ref(self.KeyName),
-            SecurityGroups=[Ref(self.WebSecurityGroup)],
-            InstanceType=Ref(self.InstanceType),
+            UserData=self.user_data().to_base64(),
+            ImageId=self.ImageId,
+            KeyName=ref(self.KeyName),
+            SecurityGroups=[ref(self.WebSecurityGroup)],
+            InstanceType=ref(self.InstanceType),
+            IamInstanceProfile=ref(self.WebServerProfile),
             AssociatePublicIpAddress=True,
         ))
 
+        scheduled = {}
+        if self.schedule:
+            # Stack updates leave the sizes set by the scheduled actions
+            scheduled["UpdatePolicy"] = policies.UpdatePolicy(
+                AutoScalingScheduledAction=policies.AutoScalingScheduledAction(
+                    IgnoreUnmodifiedGroupSizeProperties=True,
+                ),
+            )
+            scheduled["LifecycleHookSpecificationList"] = [
+                autoscaling.LifecycleHookSpecification(
+                    LifecycleHookName=WARM_BOOT_HOOK,
+                    LifecycleTransition="autoscaling:EC2_INSTANCE_LAUNCHING",
+                    HeartbeatTimeout=900,
+                    DefaultResult="CONTINUE",
+                ),
+            ]
+
         self.WebServerAutoScalingGroup = self.template.add_resource(autoscaling.AutoScalingGroup(
             "WebServerAutoScalingGroup",
-            MinSize=Ref(self.WebServerCapacity),
-            DesiredCapacity=Ref(self.WebServerCapacity),
-            MaxSize=Ref(self.WebServerCapacity),
-            VPCZoneIdentifier=[Ref(self.Subnet1), Ref(self.Subnet2)],
-            AvailabilityZones=[Ref(self.AvailabilityZone1),
-                               Ref(self.AvailabilityZone2)],
-            Tags=autoscaling.Tags(
-                Name=Join("-", [Ref(self.Project), "web", "asg"]),
-                Environment=Ref(self.Environment),
-                Project=Ref(self.Project),
-            ),
-            LoadBalancerNames=[Ref(self.ElasticLoadBalancer)],
-            LaunchConfigurationName=Ref(self.WebServerLaunchConfiguration),
+            MinSize=If("IsStandby", "0", ref(self.WebServerCapacity)),
+            DesiredCapacity=If("IsStandby", "0", ref(self.WebServerCapacity)),
+            MaxSize=If("IsStandby", "0", If(
+                "FixedCapacity", ref(self.WebServerCapacity),
+                ref(self.WebServerMaxCapacity))),
+            VPCZoneIdentifier=[ref(self.Subnet1), ref(self.Subnet2)],
+            AvailabilityZones=[ref(self.AvailabilityZone1),
+                               ref(self.AvailabilityZone2)],
+            Tags=standard_tags("web", "asg", tags_class=autoscaling.Tags),
+            LoadBalancerNames=[ref(self.ElasticLoadBalancer)],
+            LaunchConfigurationName=ref(self.WebServerLaunchConfiguration),
+            **scheduled
+        ))
+
+        # The worker installs from the web servers' metadata but stays out
+        # of the load balancer
+        self.CronWorkerLaunchConfiguration = self.template.add_resource(autoscaling.LaunchConfiguration(
+            "CronWorkerLaunchConfiguration",
+            Condition="UseCronWorker",
+            UserData=self.user_data(worker=True).to_base64(),
+            ImageId=self.CronWorkerImageId,
+            KeyName=ref(self.KeyName),
+            SecurityGroups=[ref(self.WebSecurityGroup)],
+            InstanceType=ref(self.CronWorkerInstanceType),
+            IamInstanceProfile=ref(self.WebServerProfile),
+            AssociatePublicIpAddress=True,
+        ))
+
+        self.CronWorkerAutoScalingGroup = self.template.add_resource(autoscaling.AutoScalingGroup(
+            "CronWorkerAutoScalingGroup",
+            Condition="UseCronWorker",
+            MinSize="1",
+            DesiredCapacity="1",
+            MaxSize="1",
+            VPCZoneIdentifier=[ref(self.Subnet1), ref(self.Subnet2)],
+            AvailabilityZones=[ref(self.AvailabilityZone1),
+                               ref(self.AvailabilityZone2)],
+            Tags=standard_tags("cron", "asg", tags_class=autoscaling.Tags),
+            LaunchConfigurationName=ref(self.CronWorkerLaunchConfiguration),
         ))
 
         self.WebServerScaleUpPolicy = self.template.add_resource(autoscaling.ScalingPolicy(
             "WebServerScaleUpPolicy",
             ScalingAdjustment="1",
             Cooldown="60",
-            AutoScalingGroupName=Ref(self.WebServerAutoScalingGroup),
+            AutoScalingGroupName=ref(self.WebServerAutoScalingGroup),
             AdjustmentType="ChangeInCapacity",
         ))
 
@@ -353,7 +902,7 @@ class WordpressASG(CloudformationAbstractBaseClass):
             "WebServerScaleDownPolicy",
             ScalingAdjustment="-1",
             Cooldown="60",
-            AutoScalingGroupName=Ref(self.WebServerAutoScalingGroup),
+            AutoScalingGroupName=ref(self.WebServerAutoScalingGroup),
             AdjustmentType="ChangeInCapacity",
         ))
 
@@ -363,10 +912,10 @@ class WordpressASG(CloudformationAbstractBaseClass):
             Dimensions=[
                 cloudwatch.MetricDimension(
                     Name="AutoScalingGroupName",
-                    Value=Ref(self.WebServerAutoScalingGroup)
+                    Value=ref(self.WebServerAutoScalingGroup)
                 ),
             ],
-            AlarmActions=[Ref(self.WebServerScaleDownPolicy)],
+            AlarmActions=[ref(self.WebServerScaleDownPolicy)],
             AlarmDescription="Scale-down if CPU < 70% for 1 minute",
             Namespace="AWS/EC2",
             Period="60",
@@ -382,10 +931,10 @@ class WordpressASG(CloudformationAbstractBaseClass):
             Dimensions=[
                 cloudwatch.MetricDimension(
                     Name="AutoScalingGroupName",
-                    Value=Ref("WebServerAutoScalingGroup")
+                    Value=ref("WebServerAutoScalingGroup")
                 ),
             ],
-            AlarmActions=[Ref(self.WebServerScaleUpPolicy)],
+            AlarmActions=[ref(self.WebServerScaleUpPolicy)],
             AlarmDescription="Scale-up if CPU > 50% for 1 minute",
             Namespace="AWS/EC2",
             Period="60",
@@ -395,18 +944,328 @@ class WordpressASG(CloudformationAbstractBaseClass):
             MetricName="CPUUtilization",
         ))
 
+        if self.schedule:
+            self.add_schedule()
+
+    def add_warm_boot(self, config):
+        """
+        Files and commands of the warm boot path: ``enter-service``
+        completes the WARM_BOOT_HOOK lifecycle action, and on every boot
+        after the first ``resume-warmup`` waits for Wordpress to answer,
+        warms the opcache, enters service and publishes the time since boot
+        as the resume metric.
+        """
+        config["files"].update({
+            "/usr/local/bin/enter-service": {
+                "content": Join("", [
+                    "#!/bin/bash\n",
+                    "INSTANCE_ID=$(curl -s http://169.254.169.254/latest/meta-data/instance-id)\n",
+                    "ASG_NAME=$(aws autoscaling describe-auto-scaling-instances"
+                    " --instance-ids $INSTANCE_ID --region ", ref("AWS::Region"),
+                    " --query 'AutoScalingInstances[0].AutoScalingGroupName'"
+                    " --output text)\n",
+                    "aws autoscaling complete-lifecycle-action"
+                    " --lifecycle-hook-name ", WARM_BOOT_HOOK,
+                    " --auto-scaling-group-name $ASG_NAME",
+                    " --instance-id $INSTANCE_ID",
+                    " --lifecycle-action-result CONTINUE",
+                    " --region ", ref("AWS::Region"), "\n",
+                ]),
+                "mode": "000500",
+                "owner": "root",
+                "group": "root"
+            },
+            "/usr/local/bin/resume-warmup": {
+                "content": Join("", [
+                    "#!/bin/bash\n",
+                    "[ -f ", INSTALLED_MARKER, " ] || exit 0\n",
+                    "for i in $(seq 300); do\n",
+                    "  curl -sf -o /dev/null http://localhost/wp-login.php && break\n",
+                    "  sleep 1\n",
+                    "done\n",
+                    "for page in / /wp-login.php /feed/; do\n",
+                    "  curl -s -o /dev/null http://localhost$page\n",
+                    "done\n",
+                    "/usr/local/bin/enter-service\n",
+                    "aws cloudwatch put-metric-data --namespace ",
+                    schedule.RESUME_NAMESPACE,
+                    " --metric-name ", schedule.RESUME_METRIC,
+                    " --dimensions StackName=", ref("AWS::StackName"),
+                    " --unit Seconds --value $(cut -d' ' -f1 /proc/uptime)",
+                    " --region ", ref("AWS::Region"), "\n",
+                ]),
+                "mode": "000500",
+                "owner": "root",
+                "group": "root"
+            },
+            "/etc/cron.d/resume-warmup": {
+                "content": "@reboot root /usr/local/bin/resume-warmup\n",
+                "mode": "000644",
+                "owner": "root",
+                "group": "root"
+            },
+        })
+        config["commands"]["03_mark_installed"] = {
+            "command": "mkdir -p $(dirname {0}) && touch {0}".format(
+                INSTALLED_MARKER)
+        }
+
+    def add_schedule(self):
+        """
+        Out of hours the group scales in to a warm pool of stopped
+        instances, which keep their root volume (packages, credentials
+        cache) and mount the code from EFS again when they start.
+        """
+        t = self.template
+
+        t.add_resource(autoscaling.WarmPool(
+            "WebServerWarmPool",
+            AutoScalingGroupName=ref(self.WebServerAutoScalingGroup),
+            PoolState="Stopped",
+            MinSize=0,
+            MaxGroupPreparedCapacity=ref(self.WebServerCapacity),
+            InstanceReusePolicy=autoscaling.InstanceReusePolicy(
+                ReuseOnScaleIn=True,
+            ),
+        ))
+
+        t.add_resource(autoscaling.ScheduledAction(
+            "WebServerScheduledStop",
+            AutoScalingGroupName=ref(self.WebServerAutoScalingGroup),
+            Recurrence=self.schedule["stop"],
+            MinSize=0,
+            MaxSize=0,
+            DesiredCapacity=0,
+        ))
+
+        t.add_resource(autoscaling.ScheduledAction(
+            "WebServerScheduledStart",
+            Condition="IsActive",
+            AutoScalingGroupName=ref(self.WebServerAutoScalingGroup),
+            Recurrence=self.schedule["start"],
+            MinSize=ref(self.WebServerCapacity),
+            MaxSize=If("FixedCapacity", ref(self.WebServerCapacity),
+                       ref(self.WebServerMaxCapacity)),
+            DesiredCapacity=ref(self.WebServerCapacity),
+        ))
+
+        for action, size in [("Stop", "0"), ("Start", "1")]:
+            t.add_resource(autoscaling.ScheduledAction(
+                "CronWorkerScheduled" + action,
+                Condition="UseCronWorker",
+                AutoScalingGroupName=ref(self.CronWorkerAutoScalingGroup),
+                Recurrence=self.schedule[action.lower()],
+                MinSize=size,
+                MaxSize=size,
+                DesiredCapacity=size,
+            ))
+
+        t.add_resource(cloudwatch.Alarm(
+            "ResumeTimeAlarm",
+            EvaluationPeriods="1",
+            Dimensions=[
+                cloudwatch.MetricDimension(
+                    Name="StackName",
+                    Value=ref("AWS::StackName")
+                ),
+            ],
+            AlarmDescription="Resume from the warm pool took over {} "
+                             "seconds".format(
+                                 self.schedule["resume_target_seconds"]),
+            Namespace=schedule.RESUME_NAMESPACE,
+            Period="300",
+            ComparisonOperator="GreaterThanThreshold",
+            Statistic="Maximum",
+            Threshold=str(self.schedule["resume_target_seconds"]),
+            MetricName=schedule.RESUME_METRIC,
+            TreatMissingData="notBreaching",
+        ))
+
+    def configure_search_script(self):
+        """
+        Install and activate SEARCH_PLUGIN and index the site once. Runs
+        after wp-cli is installed; the install is shared on EFS, so instances
+        take turns under a lock. EP_HOST, SearchEndpoint for the plugin, is
+        defined by create-wp-config, which rewrites wp-config.php on every
+        instance.
+        """
+        return Join("", [
+            "#!/bin/bash\n",
+            "set -e\n",
+            "ENDPOINT='", ref(self.SearchEndpoint), "'\n",
+            "[ -n \"$ENDPOINT\" ] || exit 0\n",
+            "WP='sudo -u www-data /usr/local/bin/wp --path=/var/www/html'\n",
+            "exec 9> /var/www/html/.search-setup.lock\n",
+            "flock 9\n",
+            "$WP plugin is-installed ", SEARCH_PLUGIN,
+            " || $WP plugin install ", SEARCH_PLUGIN, "\n",
+            "$WP plugin is-active ", SEARCH_PLUGIN,
+            " || $WP plugin activate ", SEARCH_PLUGIN, "\n",
+            "if ! $WP option get ep_last_sync > /dev/null 2>&1; then\n",
+            "  $WP elasticpress sync --setup --yes\n",
+            "fi\n",
+        ])
+
+    def rehome_script(self):
+        """
+        Point a site restored from another environment's database at this
+        environment's hostname: rewrite the old home URL everywhere in the
+        database, once, under a lock on EFS. Nothing to do on a fresh site.
+        """
+        return Join("", [
+            "#!/bin/bash\n",
+            "set -e\n",
+            "NEW='", Join(".", [ref(self.Hostname), ref(self.Domain)]), "'\n",
+            "WP='sudo -u www-data /usr/local/bin/wp --path=/var/www/html'\n",
+            "exec 9> /var/www/html/.rehome.lock\n",
+            "flock 9\n",
+            "OLD=$($WP option get home | sed -e 's|^[a-z]*://||' -e 's|/.*||')\n",
+            "[ -n \"$OLD\" ] && [ \"$OLD\" != \"$NEW\" ] || exit 0\n",
+            "$WP search-replace \"//$OLD\" \"//$NEW\" --all-tables"
+            " --skip-columns=guid --report-changed-only\n",
+            "$WP cache flush\n",
+        ])
+
+    def sync_media_script(self):
+        """
+        Copy new uploaded images to MediaBucket and their variants back next
+        to them. One instance at a time, under a lock on EFS.
+        """
+        includes = "".join(" --include '*.{}'".format(any_case(extension))
+                           for extension in IMAGE_EXTENSIONS)
+        return Join("", [
+            "#!/bin/bash\n",
+            "BUCKET='", ref(self.MediaBucket), "'\n",
+            "[ -n \"$BUCKET\" ] && [ -d ", UPLOADS_DIR, " ] || exit 0\n",
+            "exec 9> /var/www/html/.sync-media.lock\n",
+            "flock -n 9 || exit 0\n",
+            "export AWS_DEFAULT_REGION=", ref("AWS::Region"), "\n",
+            "aws s3 sync --only-show-errors ", UPLOADS_DIR,
+            " s3://$BUCKET/", MEDIA_UPLOAD_PREFIX, " --exclude '*'",
+            includes, "\n",
+            "aws s3 sync --only-show-errors s3://$BUCKET/",
+            MEDIA_VARIANT_PREFIX, " ", UPLOADS_DIR, "\n",
+        ])
+
+    def refresh_credentials_script(self):
+        """
+        Cache the DB credentials secret under CREDENTIALS_DIR. Secrets
+        Manager is only asked again when the cached password stops working
+        or is over an hour old, so neither requests nor a rotation put load
+        on it, and the template never changes with it. The secret rotates
+        between two users, so a cached password outlives the rotation.
+        When the database denies the secret's own password, the user does
+        not exist yet or is a snapshot's (a new or cloned database): it is
+        created again with the master credentials, under a lock on EFS.
+        """
+        return Join("", [
+            "#!/bin/bash\n",
+            "set -e\n",
+            "DIR=", CREDENTIALS_DIR, "\n",
+            "SECRET_ARN=", ref(self.DBSecretArn), "\n",
+            "MASTER_SECRET_ARN=", ref(self.DBMasterSecretArn), "\n",
+            "if [ -f $DIR/my.cnf ] && [ -z \"$(find $DIR/my.cnf -mmin +60)\" ] &&"
+            " mysql --defaults-extra-file=$DIR/my.cnf -e 'SELECT 1' > /dev/null 2>&1; then\n",
+            "  exit 0\n",
+            "fi\n",
+            "SECRET=$(aws secretsmanager get-secret-value --secret-id $SECRET_ARN"
+            " --region $(echo $SECRET_ARN | cut -d: -f4)"
+            " --query SecretString --output text)\n",
+            "DB_USER=$(echo \"$SECRET\" | python3 -c 'import json, sys; print(json.load(sys.stdin)[\"username\"])')\n",
+            "DB_PASSWORD=$(echo \"$SECRET\" | python3 -c 'import json, sys; print(json.load(sys.stdin)[\"password\"])')\n",
+            "umask 027\n",
+            "mkdir -p $DIR\n",
+            "printf '[client]\\nhost=%s\\nuser=%s\\npassword=\"%s\"\\n' ",
+            ref(self.RDSEndpoint), " \"$DB_USER\" \"$DB_PASSWORD\" > $DIR/my.cnf.new\n",
+            "if mysql --defaults-extra-file=$DIR/my.cnf.new -e 'SELECT 1' 2>&1 > /dev/null |"
+            " grep -q 'ERROR 1045'; then\n",
+            "  exec 9> /var/www/html/.db-user.lock\n",
+            "  flock 9\n",
+            "fi\n",
+            # Checked again under the lock: another instance may have just
+            # created the user
+            "if mysql --defaults-extra-file=$DIR/my.cnf.new -e 'SELECT 1' 2>&1 > /dev/null |"
+            " grep -q 'ERROR 1045'; then\n",
+            "  MASTER=$(aws secretsmanager get-secret-value --secret-id $MASTER_SECRET_ARN"
+            " --region $(echo $MASTER_SECRET_ARN | cut -d: -f4)"
+            " --query SecretString --output text)\n",
+            "  printf '[client]\\nhost=%s\\nuser=%s\\npassword=\"%s\"\\n' ",
+            ref(self.RDSEndpoint),
+            " \"$(echo \"$MASTER\" | python3 -c 'import json, sys; print(json.load(sys.stdin)[\"username\"])')\"",
+            " \"$(echo \"$MASTER\" | python3 -c 'import json, sys; print(json.load(sys.stdin)[\"password\"])')\"",
+            " > $DIR/master.cnf\n",
+            # CREATE USER IF NOT EXISTS and ALTER USER need MySQL 5.7
+            "  if [ \"$(mysql --defaults-extra-file=$DIR/master.cnf -NB -e",
+            " \"SELECT COUNT(*) FROM mysql.user WHERE User = '$DB_USER' AND Host = '%'\")\" != 0 ]; then\n",
+            "    mysql --defaults-extra-file=$DIR/master.cnf -e \"DROP USER '$DB_USER'@'%'\"\n",
+            "  fi\n",
+            "  mysql --defaults-extra-file=$DIR/master.cnf <<EOF\n",
+            "CREATE USER '$DB_USER'@'%' IDENTIFIED BY '$DB_PASSWORD';\n",
+            "GRANT ALL PRIVILEGES ON \\`", ref(self.DBName), "\\`.* TO '$DB_USER'@'%';\n",
+            "EOF\n",
+            "  rm -f $DIR/master.cnf\n",
+            "fi\n",
+            "printf \"<?php\\ndefine('DB_USER', '%s');\\ndefine('DB_PASSWORD', '%s');\\n\"",
+            " \"$DB_USER\" \"$DB_PASSWORD\" > $DIR/db-credentials.php.new\n",
+            "chgrp www-data $DIR $DIR/db-credentials.php.new\n",
+            "mv $DIR/my.cnf.new $DIR/my.cnf\n",
+            "mv $DIR/db-credentials.php.new $DIR/db-credentials.php\n",
+            "if [ -x /usr/local/bin/sync-proxysql-users ]; then\n",
+            "  /usr/local/bin/sync-proxysql-users $DIR/my.cnf\n",
+            "fi\n",
+        ])
+
+    def user_data(self, worker=False):
+        minify = self.sceptre_user_data.get("minify_user_data", False)
+        user_data = bootstrap.UserData(minify=minify, timed=True).add(
+            bootstrap.efs_mount(),
+            bootstrap.cfn_bootstrap(),
+            bootstrap.cfn_init(
+                "WebServerLaunchConfiguration", "wordpress_install"),
+            bootstrap.wp_cli(),
+            bootstrap.wordpress_deploy(),
+        )
+        if worker:
+            user_data.add(bootstrap.run(
+                "cron_worker", "touch " + CRON_WORKER_MARKER))
+        else:
+            user_data.add(
+                bootstrap.run("rehome", "/usr/local/bin/rehome-wordpress"),
+                bootstrap.cfn_signal("Webserver setup complete"),
+                bootstrap.run("configure_search",
+                              "/usr/local/bin/configure-search"),
+            )
+        if self.schedule and not worker:
+            user_data.add(bootstrap.run("enter_service",
+                                        "/usr/local/bin/enter-service"))
+        return user_data.set(
+            FILE_SYSTEM_ID=ref(self.FileSystemID),
+            AWS_REGION=ref("AWS::Region"),
+            STACK_NAME=ref("AWS::StackName"),
+            WP_URL=Join(".", [ref(self.Hostname), ref(self.Domain)]),
+            WP_TITLE=Join("", [
+                "Cloudreach Meetup - ", ref(self.Environment)]),
+            WAIT_HANDLE=ref(self.WaitHandle),
+        )
+
     def add_outputs(self):
 
         self.out = self.template.add_output([
             Output("FQDN", Value=Join(
-                ".", [Ref(self.Hostname), Ref(self.Domain)])),
-            Output("WebSecurityGroup", Value=Ref(self.WebSecurityGroup)),
-            Output("ElbSecurityGroup", Value=Ref(self.ElbSecurityGroup)),
+                ".", [ref(self.Hostname), ref(self.Domain)])),
+            Output("WebSecurityGroup", Value=ref(self.WebSecurityGroup)),
+            Output("ElbSecurityGroup", Value=ref(self.ElbSecurityGroup)),
+            Output("ElbDNSName", Value=GetAtt(
+                self.ElasticLoadBalancer, "DNSName")),
+            Output("AccessLogs", Value=Join("", [
+                "s3://", ref(self.AccessLogBucket), "/", ACCESS_LOG_PREFIX,
+                "/"])),
         ])
 
 
 def sceptre_handler(sceptre_user_data):
-    return WordpressASG(sceptre_user_data).template.to_json()
+    return serialize(
+        WordpressASG(sceptre_user_data).template, sceptre_user_data)
 
 if __name__ == '__main__':
     print (sceptre_handler())
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Rendered templates as a stack with given parameters would see them.
+"""
+
+import json
+
+from tools import lint, render
+
+NO_VALUE = {"Ref": "AWS::NoValue"}
+
+
+def template(template_path, sceptre_user_data=None):
+    return json.loads(render.render(template_path, sceptre_user_data))
+
+
+def condition(body, name, parameters):
+    """ Truth of condition ``name``, None if it depends on more than them """
+    return lint.evaluate({"Condition": name}, body, parameters)
+
+
+def choose(value, body, parameters):
+    """ ``value`` with every Fn::If that can be decided decided """
+    if isinstance(value, dict) and list(value) == ["Fn::If"]:
+        name, true, false = value["Fn::If"]
+        truth = condition(body, name, parameters)
+        if truth is not None:
+            return choose(true if truth else false, body, parameters)
+    if isinstance(value, dict):
+        return dict((key, choose(item, body, parameters))
+                    for key, item in value.items())
+    if isinstance(value, list):
+        return [choose(item, body, parameters) for item in value]
+    return value
+
+
+def resources(body, parameters):
+    """ Resources the stack may create, with their Fn::Ifs decided """
+    return dict(
+        (name, choose(resource, body, parameters))
+        for name, resource in body["Resources"].items()
+        if "Condition" not in resource
+        or condition(body, resource["Condition"], parameters) is not False)
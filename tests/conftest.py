@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The tools are imported as ``tools.<name>`` and the templates, like sceptre
+# loads them, as top-level modules
+for path in (ROOT_DIR, os.path.join(ROOT_DIR, "templates")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import pytest
+
+import architectures
+from tools import amis, render
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "amis.json")
+
+
+@pytest.fixture
+def fixture():
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("group", render.environments())
+def test_stacks_resolve_to_fixture(group, fixture):
+    resolver = amis.AmiResolver(amis.fixture_fetch(fixture))
+    rows = list(amis.stack_amis(group, resolver))
+    assert rows
+    for name, region, instance_type, arch, ami in rows:
+        assert arch == architectures.architecture(instance_type)
+        assert ami == fixture[region][arch], name
+    # One lookup per region, however many stacks are in it
+    assert resolver.calls == len(set(region for _, region, _, _, _ in rows))
+
+
+def test_template_mapping_and_parameters():
+    body = render.render_stack("prod/wordpress")
+    mapping = body["Mappings"]["AWSInstanceType2Arch"]
+    assert sorted(mapping) == list(architectures.instance_types())
+    for instance_type, entry in mapping.items():
+        assert entry["Arch"] == architectures.architecture(instance_type)
+    defaults = dict(
+        (body["Parameters"][name]["Default"], name)
+        for name in ("ImageIdAmd64", "ImageIdArm64"))
+    assert sorted(defaults) == sorted(amis.image_parameters())
+
+
+def test_cache_expires(tmp_path, fixture):
+    now = [1000.0]
+    cache_file = str(tmp_path / "amis.json")
+    resolver = amis.AmiResolver(amis.fixture_fetch(fixture), cache_file,
+                                max_age=60, clock=lambda: now[0])
+    resolver.resolve("us-east-1", architectures.ARM64)
+    resolver.resolve("us-east-1", architectures.AMD64)
+    assert resolver.calls == 1
+
+    reloaded = amis.AmiResolver(amis.fixture_fetch({}), cache_file,
+                                max_age=60, clock=lambda: now[0])
+    assert reloaded.resolve("us-east-1", architectures.AMD64) == \
+        fixture["us-east-1"][architectures.AMD64]
+    assert reloaded.calls == 0
+
+    now[0] += 61
+    with pytest.raises(KeyError):
+        reloaded.resolve("us-east-1", architectures.AMD64)
+
+
+def test_cron_worker_image_follows_its_own_instance_type():
+    from cfn import condition, resources
+
+    body = render.render_stack("prod/wordpress")
+    parameters = {"InstanceType": "m6g.large", "CronWorker": "true",
+                  "Standby": "false"}
+    assert body["Parameters"]["CronWorkerInstanceType"]["Default"] == \
+        "t3.micro"
+    assert condition(body, "UseArm64", parameters) is True
+    assert condition(body, "CronWorkerUseArm64", parameters) is False
+    launched = resources(body, parameters)
+    assert launched["WebServerLaunchConfiguration"]["Properties"][
+        "ImageId"] == {"Ref": "ImageIdArm64"}
+    assert launched["CronWorkerLaunchConfiguration"]["Properties"][
+        "ImageId"] == {"Ref": "ImageIdAmd64"}
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from tools import batch, render
+
+
+def test_stack_output_parameters_round_trip(tmp_path):
+    environment = {
+        "name": "dev",
+        "stacks": {"dev/security-groups": render.stack_config(
+            "dev/security-groups")},
+    }
+    assert list(batch.render_environments([environment], str(tmp_path))) == [
+        "dev/security-groups"]
+    with open(str(tmp_path / "dev" / "security-groups.parameters.json")) as f:
+        parameters = json.load(f)
+    assert parameters["VpcId"] == "!cached_stack_output dev/vpc.yaml::VpcId"
+
+    # The tag reads back as the placeholder it was written from
+    tag, _, argument = parameters["VpcId"].partition(" ")
+    loaded = render.ConfigLoader("{} {}".format(tag, argument)).get_data()
+    assert loaded == render.StackOutput("dev/vpc", "VpcId")
+
+
+def test_resolver_and_list_parameters():
+    parameters = batch.parameters_json({
+        "Plain": "value",
+        "Secret": render.Resolver("!ssm", "/wordpress/key"),
+        "Subnets": [render.StackOutput("dev/vpc", "Subnet1"), "subnet-1"],
+    })
+    assert parameters == {
+        "Plain": "value",
+        "Secret": "!ssm /wordpress/key",
+        "Subnets": ["!cached_stack_output dev/vpc.yaml::Subnet1", "subnet-1"],
+    }
+
+
+def test_clone_renames_stack_outputs():
+    environment = {"name": "dev", "stacks": {"dev/efs": {"parameters": {
+        "VpcId": render.StackOutput("dev/vpc", "VpcId")}}}}
+    cloned = batch.clone(environment, "dev-1")
+    assert cloned["stacks"]["dev-1/efs"]["parameters"]["VpcId"] == \
+        render.StackOutput("dev-1/vpc", "VpcId")
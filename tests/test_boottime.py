@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+
+from tools import boottime
+
+BOOT = [
+    "Cloud-init v. 23.4 running 'modules:final'\n",
+    "+ phase_start\n",
+    "BOOT_PHASE name=apt start=100.0 end=145.5 status=0\n",
+    "BOOT_PHASE name=cfn_init start=146.0 end=236.0 status=0\n",
+    "BOOT_PHASE name=cfn_signal start=236.0 end=237.0 status=0\n",
+]
+
+
+def write(path, lines, compress=False):
+    opener = gzip.open if compress else open
+    with opener(str(path), "wt") as f:
+        f.writelines(lines)
+
+
+def test_parse():
+    assert boottime.parse(BOOT[2]) == boottime.Phase("apt", 100.0, 145.5, 0)
+    assert boottime.parse("BOOT_PHASE name=apt start=1 end=2\n").status == 0
+    for line in ["", "+ phase_start", "BOOT_PHASE name=apt start=1",
+                 "BOOT_PHASE name=apt start=x end=2 status=0",
+                 "echo BOOT_PHASE name=apt start=1 end=2 status=0"]:
+        assert boottime.parse(line) is None
+
+
+def test_durations():
+    assert boottime.durations(BOOT) == [
+        ("apt", 45.5, 0), ("cfn_init", 90.0, 0), ("cfn_signal", 1.0, 0),
+        ("total", 137.0, 0)]
+    assert boottime.durations(BOOT[:2]) == []
+
+
+def test_summarize_orders_phases_and_counts_failures():
+    summaries = boottime.summarize({
+        "i-b": [("apt", 50.0, 0), ("cfn_init", 80.0, 1), ("total", 130.0, 1)],
+        "i-a": [("apt", 30.0, 0), ("total", 31.0, 0)],
+    })
+    assert [s.phase for s in summaries] == ["apt", "cfn_init", "total"]
+    total = summaries[-1]
+    assert (total.instances, total.median, total.worst,
+            total.worst_instance, total.failures) == (2, 80.5, 130.0, "i-b", 1)
+    assert summaries[1] == boottime.Summary("cfn_init", 1, 80.0, 80.0,
+                                            "i-b", 1)
+
+
+def test_report_reads_plain_gz_and_directories(tmp_path, capsys):
+    write(tmp_path / "i-1.log", BOOT)
+    write(tmp_path / "i-2.log.gz", [
+        line.replace("end=145.5", "end=160.5") for line in BOOT],
+        compress=True)
+    write(tmp_path / "notes.txt", ["nothing to see\n"])
+    assert boottime.main(["report", str(tmp_path), "--format", "json"]) == 0
+    summaries = json.loads(capsys.readouterr().out)
+    apt = summaries[0]
+    assert (apt["phase"], apt["instances"], apt["median"], apt["worst"],
+            apt["worst_instance"]) == ("apt", 2, 53.0, 60.5, "i-2")
+    assert summaries[-1]["phase"] == "total"
+
+
+def test_report_without_phases(tmp_path, capsys):
+    write(tmp_path / "i-1.log", BOOT[:2])
+    assert boottime.main(["report", str(tmp_path)]) == 1
+    assert "no BOOT_PHASE lines" in capsys.readouterr().err
+
+
+def test_sample_then_report(tmp_path, capsys):
+    directory = str(tmp_path / "boot")
+    assert boottime.main(["sample", directory, "--instances", "5"]) == 0
+    assert boottime.main(["report", directory]) == 0
+    out = capsys.readouterr().out.splitlines()
+    phases = [line.split()[0] for line in out[2:]]
+    assert phases == [name for name, _, _ in boottime.SAMPLE_PHASES] + [
+        "total"]
+    assert all(line.split()[1] == "5" for line in out[2:])
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import ast
+
+from cfn import NO_VALUE, resources, template
+
+RECOVERY_POINT = ("arn:aws:backup:us-east-1:123456789012:recovery-point:"
+                  "0b5c8a4e-1a2b-4c3d-8e9f-0a1b2c3d4e5f")
+
+
+def test_rds_empty():
+    body = template("rds.py")
+    database = resources(body, {})["MySQLDatabase"]["Properties"]
+    assert database["DBSnapshotIdentifier"] == NO_VALUE
+    assert database["MasterUsername"] == {"Ref": "DBUser"}
+    assert database["DBName"] == {"Ref": "DBName"}
+
+
+def test_rds_from_snapshot():
+    body = template("rds.py")
+    database = resources(body, {"DatabaseSnapshot": "prod-clone"})[
+        "MySQLDatabase"]["Properties"]
+    assert database["DBSnapshotIdentifier"] == {"Ref": "DatabaseSnapshot"}
+    assert database["MasterUsername"] == NO_VALUE
+    assert database["DBName"] == NO_VALUE
+
+
+def test_rds_replica_ignores_snapshot():
+    body = template("rds.py")
+    created = resources(body, {
+        "DatabaseSnapshot": "prod-clone",
+        "SourceDBInstanceArn": "arn:aws:rds:us-east-1:123456789012:db:prod"})
+    assert "MySQLDatabase" not in created
+    assert "MySQLReplica" in created
+
+
+def test_efs_empty():
+    body = template("efs.py")
+    created = resources(body, {})
+    assert "FileSystem" in created
+    assert not [name for name in created if name.startswith("Restore")]
+    mount = created["MountTarget1"]["Properties"]
+    assert mount["FileSystemId"] == {"Ref": "FileSystem"}
+
+
+def test_efs_from_backup():
+    body = template("efs.py")
+    created = resources(body, {"BackupRecoveryPoint": RECOVERY_POINT,
+                               "ThroughputMode": "elastic"})
+    assert "FileSystem" not in created
+    for name in ("RestoreFunction", "RestoreStateMachine",
+                 "RestoreStartPolicy", "RestoredFileSystem"):
+        assert name in created
+    mount = created["MountTarget1"]["Properties"]
+    assert mount["FileSystemId"] == {
+        "Fn::GetAtt": ["RestoredFileSystem", "FileSystemId"]}
+    restored = created["RestoredFileSystem"]["Properties"]
+    assert restored["ThroughputMode"] == {"Ref": "ThroughputMode"}
+    assert {"Key": "Environment", "Value": {"Ref": "Environment"}} in \
+        restored["Tags"]
+    assert created["RestoreFunction"]["Properties"]["Timeout"] < 900
+
+
+def test_efs_restore_code():
+    body = template("efs.py")
+    code = body["Resources"]["RestoreFunction"]["Properties"]["Code"][
+        "ZipFile"]
+    ast.parse(code)
+    # CloudFormation's limit on inline function code
+    assert len(code) <= 4096
+    assert "Encrypted" not in code
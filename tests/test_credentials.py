@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from cfn import resources
+from tools import render
+
+
+def rds(stack, parameters=None):
+    body = render.render_stack(stack)
+    return body, resources(body, parameters or {})
+
+
+def test_wordpress_secret_rotates_between_two_users():
+    _, primary = rds("prod/rds")
+    rotation = primary["AppDBSecretRotation"]["Properties"]
+    assert rotation["HostedRotationLambda"]["RotationType"] == \
+        "MySQLMultiUser"
+    assert rotation["HostedRotationLambda"]["MasterSecretArn"] == \
+        {"Ref": "DBSecret"}
+    assert rotation["SecretId"] == {"Ref": "AppDBSecretAttachment"}
+    assert rotation["RotateImmediatelyOnUpdate"] is False
+    # Only the master password is changed in place
+    assert primary["DBSecretRotation"]["Properties"]["HostedRotationLambda"][
+        "RotationType"] == "MySQLSingleUser"
+
+
+def test_secrets_replicated_to_the_standby_region():
+    body, primary = rds("prod/rds", {"ReplicaRegion": "us-west-2",
+                                     "SourceDBInstanceArn": ""})
+    for name in ("DBSecret", "AppDBSecret"):
+        assert primary[name]["Properties"]["ReplicaRegions"] == [
+            {"Region": {"Ref": "ReplicaRegion"}}]
+    replica_arn = json.dumps(body["Outputs"]["DBSecretReplicaArn"]["Value"])
+    assert '{"Ref": "ReplicaRegion"}' in replica_arn
+    assert '{"Ref": "AppDBSecret"}' in replica_arn
+
+    config = render.stack_config("prod/us-west-2/rds")["parameters"]
+    assert "DBSecretReplicaArn" in str(config["SourceDBSecretArn"])
+    assert "DBMasterSecretReplicaArn" in str(
+        config["SourceDBMasterSecretArn"])
+    _, standby = rds("prod/us-west-2/rds", {
+        "SourceDBInstanceArn": "arn:aws:rds:eu-west-1:1:db:x"})
+    assert "DBSecret" not in standby and "AppDBSecret" not in standby
+
+
+def test_web_servers_create_their_user_with_the_master_secret():
+    body = render.render_stack("prod/wordpress")
+    init = body["Resources"]["WebServerLaunchConfiguration"]["Metadata"][
+        "AWS::CloudFormation::Init"]
+    script = json.dumps(init["install_wordpress"]["files"][
+        "/usr/local/bin/refresh-db-credentials"])
+    assert '{"Ref": "DBMasterSecretArn"}' in script
+    assert "ERROR 1045" in script
+    assert "CREATE USER '$DB_USER'@'%'" in script
+    role = json.dumps(body["Resources"]["WebServerRole"])
+    assert '{"Ref": "DBMasterSecretArn"}' in role
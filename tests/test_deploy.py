@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import io
+import json
+import os
+import re
+
+import boto3
+import pytest
+from moto import mock_aws
+from moto.cloudformation.models import cloudformation_backends
+from moto.core import DEFAULT_ACCOUNT_ID
+
+from tools import deploy, render
+
+TEMPLATES = {
+    "topic.json": {
+        "Resources": {"Topic": {"Type": "AWS::SNS::Topic"}},
+        "Outputs": {"TopicName": {
+            "Value": {"Fn::GetAtt": ["Topic", "TopicName"]}}},
+    },
+    "queue.json": {
+        "Parameters": {"TopicName": {"Type": "String"}},
+        "Resources": {"Queue": {"Type": "AWS::SQS::Queue"}},
+        "Outputs": {"TopicName": {"Value": {"Ref": "TopicName"}}},
+    },
+}
+
+CONFIGS = {
+    "config.yaml": "project_code: test\nregion: us-west-2\n"
+                   "template_bucket_name: test-templates\n",
+    "dev/topic.yaml": "template_path: topic.json\n",
+    "dev/queue.yaml": "template_path: queue.json\nparameters:\n"
+                      "  TopicName: !stack_output dev/topic.yaml::TopicName\n",
+}
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    for path, text in CONFIGS.items():
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(text)
+    monkeypatch.setattr(render, "CONFIG_DIR", str(tmp_path))
+    monkeypatch.setattr(render, "render", lambda path, user_data=None:
+                        json.dumps(TEMPLATES[path]))
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        monkeypatch.setenv(name, "testing")
+    with mock_aws():
+        yield
+
+
+def deploy_group():
+    clients = {}
+
+    def client(region):
+        return clients.setdefault(region, deploy.Client(region))
+    out = io.StringIO()
+    orchestrator = deploy.Orchestrator("dev", client, min_poll=0.01,
+                                       max_poll=0.05, out=out)
+    failures = asyncio.run(orchestrator.run())
+    return orchestrator, failures, out.getvalue()
+
+
+def stack(name):
+    return boto3.client("cloudformation", region_name="us-west-2") \
+        .describe_stacks(StackName=name)["Stacks"][0]
+
+
+def test_deploys_in_dependency_order(project):
+    orchestrator, failures, _ = deploy_group()
+    assert failures == {}
+    assert orchestrator.critical_path() == ["dev/topic", "dev/queue"]
+    queue = stack("test-dev-queue")
+    assert queue["StackStatus"] == "CREATE_COMPLETE"
+    assert queue["Parameters"] == [{
+        "ParameterKey": "TopicName",
+        "ParameterValue": orchestrator.outputs["dev/topic"]["TopicName"]}]
+
+
+def test_second_deploy_updates(project):
+    deploy_group()
+    created_id = stack("test-dev-topic")["StackId"]
+    _, failures, log = deploy_group()
+    assert failures == {}
+    assert stack("test-dev-topic")["StackId"] == created_id
+    assert "dev/topic                    UPDATE_COMPLETE" in log
+
+
+def test_recreates_failed_create(project):
+    deploy_group()
+    failed_id = stack("test-dev-topic")["StackId"]
+    backend = cloudformation_backends[DEFAULT_ACCOUNT_ID]["us-west-2"]
+    backend.stacks[failed_id].status = deploy.FAILED_CREATE
+    orchestrator, failures, log = deploy_group()
+    assert failures == {}
+    assert "deleting, left in ROLLBACK_COMPLETE" in log
+    topic = stack("test-dev-topic")
+    assert topic["StackId"] != failed_id
+    assert topic["StackStatus"] == "CREATE_COMPLETE"
+
+
+def test_large_template_goes_through_regional_s3(project, monkeypatch):
+    s3 = boto3.client("s3", region_name="us-west-2")
+    s3.create_bucket(Bucket="test-templates", CreateBucketConfiguration={
+        "LocationConstraint": "us-west-2"})
+    monkeypatch.setattr(deploy, "TEMPLATE_BODY_LIMIT", 10)
+    client = deploy.Client("us-west-2")
+    created = []
+    create_stack = client.cloudformation.create_stack
+    monkeypatch.setattr(client.cloudformation, "create_stack",
+                        lambda **kwargs: created.append(kwargs) or
+                        create_stack(**kwargs))
+    client.launch("test-dev-topic", json.dumps(TEMPLATES["topic.json"]), {},
+                  "test-templates")
+    url = created[0]["TemplateURL"]
+    assert url.startswith(
+        "https://test-templates.s3.us-west-2.amazonaws.com/test-dev-topic/")
+    assert "TemplateBody" not in created[0]
+    assert stack("test-dev-topic")["StackStatus"] == "CREATE_COMPLETE"
+
+
+def test_pipfile_python_runs_deploy():
+    with open(os.path.join(render.ROOT_DIR, "Pipfile")) as f:
+        version = re.search(r'^python_version = "([\d.]+)"$', f.read(),
+                            re.MULTILINE).group(1)
+    assert tuple(map(int, version.split("."))) >= deploy.MIN_PYTHON
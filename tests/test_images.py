@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import fnmatch
+import io
+import json
+import os
+import re
+
+from cfn import resources, template
+from tools import images, render
+
+transform = images.transform
+
+NAMES = ["a.jpg", "B.JPG", "c.Jpeg", "d.png", "e.gif", "notes.txt", "jpg",
+         "archive.jpg.zip"]
+IMAGES = ["B.JPG", "a.jpg", "c.Jpeg", "d.png", "e.gif"]
+
+
+def test_extensions_case_insensitive(tmp_path):
+    for name in NAMES:
+        (tmp_path / name).write_bytes(b"")
+    assert [os.path.basename(path) for path in images.images(
+        str(tmp_path))] == IMAGES
+
+
+def test_function_picks_images_out_of_uploads(monkeypatch):
+    body = template("media.py")
+    (config,) = body["Resources"]["MediaBucket"]["Properties"][
+        "NotificationConfiguration"]["LambdaConfigurations"]
+    assert [rule["Name"] for rule in config["Filter"]["S3Key"]["Rules"]] == \
+        ["prefix"]
+
+    class S3(object):
+        read = []
+
+        def get_object(self, Bucket, Key):
+            self.read.append(Key)
+            return {"Body": io.BytesIO(b"")}
+
+    monkeypatch.setattr(transform, "_s3", S3())
+    monkeypatch.setattr(transform, "transform", lambda data: {})
+    transform.handler({"Records": [
+        {"s3": {"bucket": {"name": "b"}, "object": {"key": "uploads/" + n}}}
+        for n in NAMES]}, None)
+    assert sorted(S3.read) == ["uploads/" + name for name in IMAGES]
+
+
+def test_sync_matches_the_same_files():
+    script = json.dumps(render.render_stack("dev/wordpress"))
+    patterns = re.findall(r"--include '([^']+)'", script)
+    assert sorted(name for name in NAMES if any(
+        fnmatch.fnmatchcase(name, pattern) for pattern in patterns)) == IMAGES
+
+
+def test_media_files_only_with_a_bucket():
+    body = render.render_stack("dev/wordpress")
+    for bucket, config_set in [
+            ("", ["install_wordpress"]),
+            ("media-bucket", ["install_wordpress", "media"])]:
+        init = resources(body, {"MediaBucket": bucket, "ProxySQL": "false"})[
+            "WebServerLaunchConfiguration"]["Metadata"][
+                "AWS::CloudFormation::Init"]
+        assert init["configSets"]["wordpress_install"] == config_set
+    assert "/etc/cron.d/sync-media" not in init["install_wordpress"]["files"]
+    assert "/etc/cron.d/sync-media" in init["media"]["files"]
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from tools import importtime
+
+
+@pytest.fixture(scope="module")
+def core():
+    return importtime.core_modules()
+
+
+@pytest.mark.parametrize("module", list(importtime.template_modules()))
+def test_template_imports_within_budget(module, core):
+    best, eager = importtime.measure(module, core, repeat=3)
+    assert eager == [], "imports resource modules eagerly"
+    assert best <= importtime.DEFAULT_BUDGET_MS
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+from cfn import NO_VALUE, resources, template
+
+LOCUSTFILE = os.path.join(os.path.dirname(__file__), "..", "loadtest",
+                          "locustfile.py")
+
+
+def generator(parameters):
+    return resources(template("loadtest.py"), parameters)
+
+
+def user_data(parameters):
+    return json.dumps(generator(parameters)["GeneratorLaunchConfiguration"][
+        "Properties"]["UserData"])
+
+
+def test_no_ssh_by_default():
+    group = generator({"SshCidr": ""})["GeneratorSecurityGroup"]
+    assert group["Properties"]["SecurityGroupIngress"] == NO_VALUE
+
+
+def test_ssh_from_given_network():
+    group = generator({"SshCidr": "203.0.113.0/24"})["GeneratorSecurityGroup"]
+    (rule,) = group["Properties"]["SecurityGroupIngress"]
+    assert rule["CidrIp"] == {"Ref": "SshCidr"}
+    assert "0.0.0.0/0" not in json.dumps(template("loadtest.py"))
+
+
+def test_generators_scale_to_zero():
+    group = generator({})["GeneratorAutoScalingGroup"]["Properties"]
+    assert group["MinSize"] == "0"
+    data = user_data({})
+    assert "terminate-instance-in-auto-scaling-group" in data
+    assert "--should-decrement-desired-capacity" in data
+    assert data.index("locust -f") < data.index(
+        "terminate-instance-in-auto-scaling-group")
+
+
+def test_login_credentials_not_embedded():
+    with open(LOCUSTFILE) as f:
+        locustfile = f.read()
+    assert '"wordpress"' not in locustfile
+    assert 'os.environ.get("WP_PASSWORD")' in locustfile
+    policies = generator({"LoginSecretArn": ""})["GeneratorRole"][
+        "Properties"]["Policies"]
+    assert "secretsmanager" not in json.dumps(policies)
+    assert "secretsmanager" in json.dumps(generator({
+        "LoginSecretArn": "arn:aws:secretsmanager:eu-west-1:1:secret:x"})[
+            "GeneratorRole"]["Properties"]["Policies"])
+
+
+def test_results_outlive_the_stack():
+    bucket = generator({})["ResultsBucket"]
+    assert bucket["DeletionPolicy"] == "Retain"
+    (rule,) = bucket["Properties"]["LifecycleConfiguration"]["Rules"]
+    assert rule["Status"] == "Enabled"
+    assert rule["ExpirationInDays"] == {"Ref": "ResultsRetention"}
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import proxysql
+from cfn import choose, resources
+from tools import render
+
+
+def cfn_init(parameters):
+    body = render.render_stack("dev/wordpress")
+    launch_config = resources(body, parameters)[
+        "WebServerLaunchConfiguration"]
+    return choose(launch_config["Metadata"], body, parameters)[
+        "AWS::CloudFormation::Init"]
+
+
+def proxysql_files(init):
+    return [path for config in init.values() if isinstance(config, dict)
+            for path in config.get("files", {}) if "proxysql" in path]
+
+
+def test_off():
+    init = cfn_init({"ProxySQL": "false"})
+    assert init["configSets"]["wordpress_install"] == ["install_wordpress"]
+    assert proxysql_files({"install_wordpress": init["install_wordpress"]}) \
+        == []
+    create = json.dumps(init["install_wordpress"]["files"][
+        "/tmp/create-wp-config"])
+    assert '{"Ref": "RDSEndpoint"}' in create
+    assert "127.0.0.1:{}".format(proxysql.LISTEN_PORT) not in create
+
+
+def test_on():
+    init = cfn_init({"ProxySQL": "true"})
+    assert init["configSets"]["wordpress_install"] == [
+        "install_wordpress", "proxysql"]
+    assert sorted(init["proxysql"]["files"]) == sorted([
+        proxysql.CONFIG_TEMPLATE,
+        "/etc/cron.d/proxysql-metrics",
+        "/usr/local/bin/install-proxysql",
+        "/usr/local/bin/proxysql-metrics",
+        "/usr/local/bin/sync-proxysql-users",
+    ])
+    create = json.dumps(init["install_wordpress"]["files"][
+        "/tmp/create-wp-config"])
+    assert "127.0.0.1:{}".format(proxysql.LISTEN_PORT) in create
+
+
+def test_no_fixed_admin_password():
+    init = cfn_init({"ProxySQL": "true"})
+    text = json.dumps(init)
+    assert "admin:admin" not in text
+    assert "-padmin" not in text
+    config = "".join(proxysql.config("db", "5000", "20"))
+    assert 'admin_credentials="admin:{}"'.format(
+        proxysql.ADMIN_PASSWORD) in config
+    assert proxysql.ADMIN_PASSWORD in proxysql.INSTALL_SCRIPT
+    assert proxysql.ADMIN_CNF in proxysql.USERS_SCRIPT
+
+
+def test_query_rules_render():
+    config = "".join(proxysql.config("db", "5000", "20"))
+    assert config.count("match_digest=") == len(proxysql.QUERY_RULES)
+    assert "max_connections=20" in config
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from cfn import choose, resources
+from tools import render
+
+
+def install_wordpress(parameters):
+    body = render.render_stack("dev/wordpress")
+    launch_config = resources(body, parameters)[
+        "WebServerLaunchConfiguration"]
+    return choose(launch_config["Metadata"], body, parameters)[
+        "AWS::CloudFormation::Init"]["install_wordpress"]
+
+
+def test_ep_host_in_wp_config():
+    files = install_wordpress({"SearchEndpoint": "vpc-x.es.amazonaws.com"})[
+        "files"]
+    create = json.dumps(files["/tmp/create-wp-config"])
+    assert "define('EP_HOST', 'https://" in create
+    assert '{"Ref": "SearchEndpoint"}' in create
+    # Not set after the fact, where the next create-wp-config would drop it
+    configure = json.dumps(files["/usr/local/bin/configure-search"])
+    assert "EP_HOST" not in configure
+
+
+def test_no_ep_host_without_search():
+    files = install_wordpress({"SearchEndpoint": ""})["files"]
+    assert "EP_HOST" not in json.dumps(files["/tmp/create-wp-config"])
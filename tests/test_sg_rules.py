@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import ipaddress
+import json
+import random
+
+import pytest
+
+import security_groups
+import sg_rules
+from cfn import resources, template
+from tools import aggregate as benchmark
+
+
+def addresses(cidrs):
+    return set(address for cidr in cidrs
+               for address in ipaddress.ip_network(cidr))
+
+
+def test_aggregate_covers_exactly_the_input():
+    rng = random.Random(0)
+    for _ in range(50):
+        cidrs = [str(ipaddress.ip_network(
+            (0x0a000000 + rng.randrange(1 << 12), rng.randint(22, 32)),
+            strict=False)) for _ in range(rng.randint(1, 20))]
+        out = sg_rules.aggregate(cidrs)
+        assert addresses(out) == addresses(cidrs)
+        # Nothing left to merge: no overlaps, no adjacent halves
+        assert sg_rules.aggregate(out) == out
+        assert len(out) <= len(set(cidrs))
+
+
+def test_aggregate_families():
+    assert sg_rules.aggregate(
+        ["2001:db8::/33", "2001:db8:8000::/33", "10.0.0.0/8"]) == [
+            "10.0.0.0/8", "2001:db8::/32"]
+    assert sg_rules.aggregate([]) == []
+    with pytest.raises(ValueError):
+        sg_rules.aggregate(["10.0.0.1/24"])
+
+
+def test_aggregate_benchmark_lists():
+    # The lists tools.aggregate times: every input is covered by one
+    # prefix of the result, which is much shorter
+    cidrs = benchmark.random_cidrs(10000)
+    out = sg_rules.aggregate(cidrs)
+    assert sg_rules.aggregate(out) == out
+    assert len(out) < len(cidrs) / 2
+    networks = set(ipaddress.ip_network(cidr) for cidr in out)
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr)
+        assert any(network.supernet(new_prefix=prefix) in networks
+                   for prefix in range(network.prefixlen + 1))
+
+
+def test_benchmark_tool(capsys):
+    assert benchmark.main(["--sizes", "100", "--repeat", "1"]) == 0
+    assert capsys.readouterr().out.splitlines()[1].split()[0] == "100"
+
+
+def test_port_ranges():
+    assert sg_rules.port_ranges(22) == [(22, 22)]
+    assert sg_rules.port_ranges(["1024-2048", "2000-3000", 3001, 80]) == [
+        (80, 80), (1024, 3001)]
+
+
+def test_compile_merges_and_dedupes():
+    rules = sg_rules.compile_rules({
+        "elb": {"ingress": []},
+        "web": {"ingress": [
+            {"ports": [80, 81], "from": "elb"},
+            {"ports": 80, "from": "elb"},
+            {"ports": 22, "cidrs": ["10.0.0.0/24", "10.0.1.0/24"]},
+        ]},
+    })
+    assert rules["web"] == [
+        sg_rules.Rule("tcp", 80, 81, sg_rules.GROUP, "elb"),
+        sg_rules.Rule("tcp", 22, 22, sg_rules.CIDR, "10.0.0.0/23"),
+    ]
+
+
+def test_compile_prefix_lists_count_their_entries():
+    cidrs = ["10.{}.0.0/16".format(n) for n in range(0, 40, 2)] + \
+        ["2001:db8:{:x}::/48".format(n) for n in range(0, 40, 2)]
+    spec = {"web": {"ingress": [
+        {"ports": 443, "cidrs": cidrs, "prefix_list": True}]}}
+    rules = sg_rules.compile_rules(spec)["web"]
+    assert [rule.kind for rule in rules] == [sg_rules.PREFIX_LIST] * 2
+    assert [len(rule.source) for rule in rules] == [20, 20]
+    assert sum(map(sg_rules.weight, rules)) == 40
+    with pytest.raises(ValueError, match="40 ingress rules"):
+        sg_rules.compile_rules(spec, limit=39)
+
+
+def test_compile_limit():
+    spec = {"web": {"ingress": [
+        {"ports": list(range(1000, 1200, 2)), "cidrs": ["10.0.0.0/8"]}]}}
+    with pytest.raises(ValueError, match="100 ingress rules, over the limit"):
+        sg_rules.compile_rules(spec)
+
+
+@pytest.mark.parametrize("spec, message", [
+    ({"Web": {"ingress": []}}, "lower case"),
+    ({"web": {"ingress": [{"ports": 80, "from": "elb"}]}}, "unknown group"),
+    ({"web": {"ingress": [{"ports": 80}]}}, "needs 'from' or 'cidrs'"),
+])
+def test_compile_errors(spec, message):
+    with pytest.raises(ValueError, match=message):
+        sg_rules.compile_rules(spec)
+
+
+def test_default_rules_compile():
+    rules = sg_rules.compile_rules(security_groups.DEFAULT_RULES)
+    assert sorted(rules) == sorted(security_groups.DEFAULT_RULES)
+    assert sg_rules.Rule("tcp", 3306, 3306, sg_rules.GROUP, "web") in \
+        rules["rds"]
+
+
+def test_ssh_closed_by_default():
+    body = template("security_groups.py")
+    assert "0.0.0.0/0" not in json.dumps(
+        body["Resources"]["WebSecurityGroup"])
+    closed = resources(body, {"SshCidr": ""})
+    assert "WebIngressSsh" not in closed
+    opened = resources(body, {"SshCidr": "10.0.0.0/16"})["WebIngressSsh"]
+    assert opened["Properties"]["CidrIp"] == {"Ref": "SshCidr"}
+    assert opened["Properties"]["FromPort"] == 22
@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+"""
+Rank the URLs behind ElbWeb by backend latency from its access logs.
+
+Usage::
+
+    python -m tools.accesslogs analyze s3://<AccessLogs output>/AWSLogs/
+    python -m tools.accesslogs analyze build/logs --sort p99 --top 30
+    python -m tools.accesslogs analyze build/logs -j 8 --format json
+    python -m tools.accesslogs generate build/logs --files 16 --lines 500000
+
+``analyze`` reads every ``.log`` and ``.log.gz`` file of a local directory
+or an S3 prefix. Each file goes to a worker process (``--jobs``, one per CPU
+by default), which streams it line by line through ``read_lines``, ``parse``
+and ``Report.add`` and returns its report. The reports are merged as the
+workers finish. Nothing holds more than one line of a file. Per path, the
+backend latencies go into a ``Histogram`` with logarithmic buckets. The
+histogram's size depends on the range of latencies, not on their number.
+Paths are normalized first (``normalize``): numeric segments become ``{id}``,
+static files are grouped by directory and extension, and query strings keep
+only their keys. A report keeps at most ``--max-paths`` paths and counts the
+rest under ``(other)``.
+
+Both the classic load balancer format and the application load balancer
+format (a leading request type) are understood. The logs carry no cookies or
+response headers, so "cacheable" is a guess from the request alone
+(``cacheable``): a GET or HEAD with a cacheable status that is not an admin,
+login, cron or XML-RPC request.
+
+``generate`` writes seeded synthetic logs in the classic format, to try the
+analyzer or time it on a laptop-sized day of traffic.
+"""
+
+import argparse
+import functools
+import gzip
+import json
+import math
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+LINE = re.compile(
+    rb'^(?:[a-z0-9]+ )?(?P<time>\S+) \S+ \S+ \S+ '
+    rb'(?P<request_time>\S+) (?P<backend_time>\S+) \S+ '
+    rb'(?P<status>\S+) \S+ \d+ (?P<sent>\d+) '
+    rb'"(?P<method>\S+) (?P<url>\S+) [^"]*"')
+URL = re.compile(r"^[a-z]+://[^/]*")
+NUMERIC = re.compile(r"/\d+(?=/|$)")
+
+STATIC_EXTENSIONS = frozenset([
+    "avif", "css", "eot", "gif", "ico", "jpeg", "jpg", "js", "map", "mp4",
+    "pdf", "png", "svg", "ttf", "txt", "webp", "woff", "woff2", "xml", "zip"])
+CACHEABLE_STATUS = frozenset([200, 203, 204, 206, 300, 301, 404, 410])
+UNCACHEABLE_PREFIXES = (
+    "/wp-admin", "/wp-login.php", "/wp-cron.php", "/xmlrpc.php",
+    "/wp-json/wp/v2/users")
+UNCACHEABLE_QUERY_KEYS = frozenset(["preview", "nonce", "_wpnonce", "s"])
+
+OTHER = "(other)"
+DEFAULT_MAX_PATHS = 10000
+SORT_KEYS = ["total", "p99", "p95", "p50", "count", "bytes"]
+# Most requests repeat a URL seen shortly before; a bounded cache saves
+# normalizing it again
+NORMALIZE_CACHE = 65536
+
+
+class Histogram(object):
+
+    """
+    Counts of positive values in logarithmic buckets.
+
+    A bucket spans a factor of ``1 + precision``, so a percentile is within
+    ``precision`` of the true value. Merging two histograms adds their
+    counts.
+
+    >>> h = Histogram()
+    >>> for ms in range(1, 1001):
+    ...     h.add(ms / 1000.0)
+    >>> round(h.percentile(50), 2), round(h.percentile(99), 2)
+    (0.5, 0.99)
+    """
+
+    __slots__ = ["counts", "zeros", "total"]
+
+    MINIMUM = 1e-6
+    PRECISION = 0.01
+    _LOG_BASE = math.log1p(PRECISION)
+
+    def __init__(self):
+        self.counts = {}
+        self.zeros = 0
+        self.total = 0
+
+    def add(self, value):
+        self.total += 1
+        if value < self.MINIMUM:
+            self.zeros += 1
+            return
+        bucket = int(math.log(value / self.MINIMUM) / self._LOG_BASE)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.zeros += other.zeros
+        self.total += other.total
+
+    def percentile(self, percent):
+        """ Value below which ``percent`` of the values fall """
+        if not self.total:
+            return None
+        rank = math.ceil(self.total * percent / 100.0)
+        seen = self.zeros
+        if seen >= rank:
+            return 0.0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                # Middle of the bucket
+                return self.MINIMUM * math.exp(
+                    (bucket + 0.5) * self._LOG_BASE)
+        return None
+
+
+class PathStats(object):
+
+    """ Requests, bytes and backend latency of one normalized path """
+
+    __slots__ = ["requests", "errors", "unanswered", "cacheable", "bytes",
+                 "seconds", "latency"]
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.unanswered = 0
+        self.cacheable = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.latency = Histogram()
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.errors += other.errors
+        self.unanswered += other.unanswered
+        self.cacheable += other.cacheable
+        self.bytes += other.bytes
+        self.seconds += other.seconds
+        self.latency.merge(other.latency)
+
+    def row(self, path):
+        p50, p95, p99 = (self.latency.percentile(p) for p in (50, 95, 99))
+        return {
+            "path": path,
+            "requests": self.requests,
+            "p50_ms": None if p50 is None else round(p50 * 1000, 1),
+            "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+            "p99_ms": None if p99 is None else round(p99 * 1000, 1),
+            "backend_seconds": round(self.seconds, 3),
+            "bytes": self.bytes,
+            "cacheable": round(float(self.cacheable) / self.requests, 3),
+            "errors": self.errors,
+            "unanswered": self.unanswered,
+        }
+
+
+class Report(object):
+
+    """ ``PathStats`` per normalized path, at most ``max_paths`` of them """
+
+    def __init__(self, max_paths=DEFAULT_MAX_PATHS):
+        self.max_paths = max_paths
+        self.paths = {}
+        self.lines = 0
+        self.malformed = 0
+        self.files = 0
+
+    def stats(self, path):
+        stats = self.paths.get(path)
+        if stats is None:
+            if len(self.paths) >= self.max_paths and path != OTHER:
+                return self.stats(OTHER)
+            stats = self.paths[path] = PathStats()
+        return stats
+
+    def add(self, record):
+        path, method, status, backend_time, sent, cacheable = record
+        stats = self.stats(path)
+        stats.requests += 1
+        stats.bytes += sent
+        if status >= 500:
+            stats.errors += 1
+        if cacheable:
+            stats.cacheable += 1
+        if backend_time < 0:
+            # No backend answered (the ELB timed out or had none in service)
+            stats.unanswered += 1
+        else:
+            stats.seconds += backend_time
+            stats.latency.add(backend_time)
+
+    def merge(self, other):
+        self.lines += other.lines
+        self.malformed += other.malformed
+        self.files += other.files
+        for path, stats in other.paths.items():
+            self.stats(path).merge(stats)
+        self.fold()
+
+    def fold(self):
+        """ Fold the least requested paths into OTHER to respect max_paths """
+        if len(self.paths) <= self.max_paths:
+            return
+        ranked = sorted((p for p in self.paths if p != OTHER),
+                        key=lambda p: self.paths[p].requests, reverse=True)
+        other = self.paths.pop(OTHER, None) or PathStats()
+        for path in ranked[self.max_paths - 1:]:
+            other.merge(self.paths.pop(path))
+        self.paths[OTHER] = other
+
+    def rows(self, sort="total", top=None):
+        key = {
+            "total": "backend_seconds", "count": "requests",
+            "bytes": "bytes", "p50": "p50_ms", "p95": "p95_ms",
+            "p99": "p99_ms"}[sort]
+        rows = [stats.row(path) for path, stats in self.paths.items()]
+        rows.sort(key=lambda row: row[key] or 0, reverse=True)
+        return rows[:top] if top else rows
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE)
+def normalize(url):
+    """
+    Path of ``url`` with ids, static files and query values collapsed
+
+    >>> normalize("http://example.com:80/2024/05/hello-world/?p=12&amp=1")
+    '/{id}/{id}/hello-world/?amp&p'
+    >>> normalize("https://example.com:443/wp-content/uploads/2024/05/a.JPG")
+    '/wp-content/uploads/*.jpg'
+    """
+    path = URL.sub("", url) or "/"
+    path, _, query = path.partition("?")
+    name = path.rsplit("/", 1)[-1]
+    extension = name.rpartition(".")[2].lower() if "." in name else ""
+    if extension in STATIC_EXTENSIONS:
+        top = "/".join(path.split("/")[:3])
+        return "{}/*.{}".format(top, extension)
+    path = NUMERIC.sub("/{id}", path)
+    if query:
+        keys = sorted(set(part.partition("=")[0]
+                          for part in query.split("&") if part))
+        path += "?" + "&".join(keys)
+    return path
+
+
+def cacheable(method, path, status):
+    """ Whether a shared cache could have answered this request """
+    if method not in ("GET", "HEAD") or status not in CACHEABLE_STATUS:
+        return False
+    if path.startswith(UNCACHEABLE_PREFIXES):
+        return False
+    query = path.partition("?")[2]
+    return not UNCACHEABLE_QUERY_KEYS.intersection(query.split("&"))
+
+
+def read_lines(source):
+    """ Lines (bytes) of a local or ``s3://`` log file, gzipped or not """
+    if source.startswith("s3://"):
+        bucket, _, key = source[5:].partition("/")
+        body = s3_client().get_object(Bucket=bucket, Key=key)["Body"]
+        if key.endswith(".gz"):
+            stream = gzip.GzipFile(fileobj=body)
+            try:
+                for line in stream:
+                    yield line
+            finally:
+                stream.close()
+        else:
+            for line in body.iter_lines():
+                yield line
+        return
+    opener = gzip.open if source.endswith(".gz") else open
+    with opener(source, "rb") as stream:
+        for line in stream:
+            yield line
+
+
+def parse(lines, report):
+    """ Records ``(path, method, status, backend_time, sent, cacheable)`` """
+    for line in lines:
+        report.lines += 1
+        match = LINE.match(line)
+        if match is None:
+            report.malformed += 1
+            continue
+        method, url, status, backend_time, sent = match.group(
+            "method", "url", "status", "backend_time", "sent")
+        method = method.decode("ascii", "replace")
+        path = normalize(url.decode("utf-8", "replace"))
+        status = int(status) if status.isdigit() else 0
+        yield (path, method, status, float(backend_time), int(sent),
+               cacheable(method, path, status))
+
+
+def analyze_file(source, max_paths=DEFAULT_MAX_PATHS):
+    """ Report of one log file; runs in a worker process """
+    report = Report(max_paths)
+    report.files = 1
+    for record in parse(read_lines(source), report):
+        report.add(record)
+    report.fold()
+    return report
+
+
+_s3 = None
+
+
+def s3_client():
+    """ One S3 client per process """
+    global _s3
+    if _s3 is None:
+        import boto3
+        _s3 = boto3.session.Session().client("s3")
+    return _s3
+
+
+def is_log(name):
+    return name.endswith(".log") or name.endswith(".log.gz")
+
+
+def sources(location):
+    """ Log files under a local directory or an ``s3://bucket/prefix`` """
+    if location.startswith("s3://"):
+        bucket, _, prefix = location[5:].partition("/")
+        pages = s3_client().get_paginator("list_objects_v2").paginate(
+            Bucket=bucket, Prefix=prefix)
+        objects = [o for page in pages for o in page.get("Contents", [])
+                   if is_log(o["Key"])]
+        objects.sort(key=lambda o: o["Size"], reverse=True)
+        return ["s3://{}/{}".format(bucket, o["Key"]) for o in objects]
+    if os.path.isfile(location):
+        return [location]
+    files = [os.path.join(directory, name)
+             for directory, _, names in os.walk(location)
+             for name in names if is_log(name)]
+    # Largest first, so the last file to finish is a small one
+    files.sort(key=os.path.getsize, reverse=True)
+    return files
+
+
+def analyze(args):
+    files = sources(args.location)
+    if not files:
+        print("no log files under {}".format(args.location), file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    report = Report(args.max_paths)
+    if args.jobs == 1:
+        for source in files:
+            report.merge(analyze_file(source, args.max_paths))
+    else:
+        with ProcessPoolExecutor(args.jobs) as executor:
+            futures = [executor.submit(analyze_file, source, args.max_paths)
+                       for source in files]
+            for future in as_completed(futures):
+                report.merge(future.result())
+    seconds = time.perf_counter() - start
+
+    rows = report.rows(args.sort, args.top)
+    if args.format == "json":
+        print(json.dumps({
+            "files": report.files, "lines": report.lines,
+            "malformed": report.malformed, "paths": rows}, indent=2))
+    else:
+        print("{:<50} {:>9} {:>8} {:>8} {:>8} {:>10} {:>9} {:>6} {:>6}".format(
+            "path", "requests", "p50 ms", "p95 ms", "p99 ms", "backend s",
+            "MB", "cache", "5xx"))
+        for row in rows:
+            print("{:<50} {:>9} {:>8} {:>8} {:>8} {:>10.1f} {:>9.1f} "
+                  "{:>5.0f}% {:>6}".format(
+                      row["path"][:50], row["requests"],
+                      "-" if row["p50_ms"] is None else row["p50_ms"],
+                      "-" if row["p95_ms"] is None else row["p95_ms"],
+                      "-" if row["p99_ms"] is None else row["p99_ms"],
+                      row["backend_seconds"], row["bytes"] / 1e6,
+                      row["cacheable"] * 100, row["errors"]))
+    print("{} lines ({} malformed) in {} files, {} paths, {:.1f}s "
+          "({:.0f} lines/s)".format(
+              report.lines, report.malformed, report.files,
+              len(report.paths), seconds, report.lines / seconds),
+          file=sys.stderr)
+    return 0
+
+
+# Synthetic traffic for ``generate``: (path, weight, median backend seconds,
+# response bytes, method)
+TRAFFIC = [
+    ("/", 20, 0.120, 48000, "GET"),
+    ("/{year}/{month}/post-{n}/", 25, 0.180, 62000, "GET"),
+    ("/?p={n}", 5, 0.170, 61000, "GET"),
+    ("/?s=term{n}", 3, 0.650, 40000, "GET"),
+    ("/wp-content/uploads/{year}/{month}/image-{n}.jpg", 30, 0.002, 180000,
+     "GET"),
+    ("/wp-content/themes/twentytwenty/style.css", 8, 0.001, 30000, "GET"),
+    ("/wp-login.php", 4, 0.250, 5000, "POST"),
+    ("/xmlrpc.php", 3, 0.300, 400, "POST"),
+    ("/wp-admin/admin-ajax.php", 2, 0.400, 800, "POST"),
+]
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    if not os.path.isdir(args.directory):
+        os.makedirs(args.directory)
+    weights = [weight for _, weight, _, _, _ in TRAFFIC]
+    day = datetime(2026, 1, 1)
+    for index in range(args.files):
+        name = "elb_{:04d}.log".format(index)
+        path = os.path.join(args.directory, name)
+        if args.gzip:
+            path += ".gz"
+        opener = gzip.open if args.gzip else open
+        with opener(path, "wt") as f:
+            for line in range(args.lines):
+                template, _, median, size, method = rng.choices(
+                    TRAFFIC, weights)[0]
+                url = template.format(
+                    year=rng.randint(2015, 2026),
+                    month="{:02d}".format(rng.randint(1, 12)),
+                    n=rng.randint(1, 500))
+                backend = rng.lognormvariate(math.log(median), 0.6)
+                status = 200
+                if rng.random() < 0.002:
+                    backend, status = -1, 504
+                elif rng.random() < 0.005:
+                    status = 500
+                timestamp = day + timedelta(
+                    seconds=86400.0 * (index * args.lines + line)
+                    / (args.files * args.lines))
+                f.write(
+                    '{}Z wordpress-elb 203.0.113.{}:{} 10.0.1.{}:80 0.000041 '
+                    '{:.6f} 0.000020 {} {} 0 {} "{} http://www.example.com:80'
+                    '{} HTTP/1.1" "Mozilla/5.0" - -\n'.format(
+                        timestamp.isoformat(), rng.randint(1, 254),
+                        rng.randint(1024, 65535), rng.randint(1, 254),
+                        backend, status, "-" if backend < 0 else status,
+                        int(size * rng.uniform(0.8, 1.2)), method, url))
+        print(path)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    analyze_parser = commands.add_parser("analyze")
+    analyze_parser.add_argument("location",
+                                help="directory, file or s3://bucket/prefix")
+    analyze_parser.add_argument("-j", "--jobs", type=int,
+                                default=os.cpu_count() or 1,
+                                help="read files in this many processes")
+    analyze_parser.add_argument("--sort", choices=SORT_KEYS, default="total",
+                                help="rank paths by total backend time, a "
+                                     "percentile, requests or bytes")
+    analyze_parser.add_argument("--top", type=int, default=25)
+    analyze_parser.add_argument("--max-paths", type=int,
+                                default=DEFAULT_MAX_PATHS)
+    analyze_parser.add_argument("--format", choices=["text", "json"],
+                                default="text")
+    analyze_parser.set_defaults(func=analyze)
+
+    generate_parser = commands.add_parser("generate")
+    generate_parser.add_argument("directory")
+    generate_parser.add_argument("--files", type=int, default=8)
+    generate_parser.add_argument("--lines", type=int, default=100000)
+    generate_parser.add_argument("--gzip", action="store_true")
+    generate_parser.add_argument("--seed", type=int, default=0)
+    generate_parser.set_defaults(func=generate)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
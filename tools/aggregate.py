@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the CIDR aggregation used by the security group rule compiler.
+
+Usage::
+
+    python -m tools.aggregate --sizes 1000 10000 100000
+    python -m tools.aggregate --file office-ranges.txt
+
+Random IPv4 lists (seeded, so runs are comparable) are built around /24
+blocks with overlapping and adjacent entries, which is what allow lists
+copied together from several sources tend to look like. Each list is collapsed with
+``sg_rules.aggregate`` and the prefixes in and out and the best time over
+``--repeat`` runs are printed. ``--file`` aggregates a list of CIDRs, one per
+line, and prints the result instead.
+"""
+
+import argparse
+import ipaddress
+import random
+import sys
+import timeit
+
+from tools import render
+
+
+def random_cidrs(size, seed=0):
+    """
+    ``size`` CIDRs around random /24 blocks: the block itself with a /26 and
+    a /32 inside it, its two /25 halves, or the block and its neighbour
+    """
+    rng = random.Random(seed)
+    cidrs = []
+    while len(cidrs) < size:
+        block = ipaddress.ip_network((rng.randrange(1 << 24) << 8, 24))
+        shape = rng.randrange(3)
+        if shape == 0:
+            cidrs.extend([
+                block,
+                rng.choice(list(block.subnets(new_prefix=26))),
+                ipaddress.ip_network(block[rng.randrange(256)]),
+            ])
+        elif shape == 1:
+            cidrs.extend(block.subnets(new_prefix=25))
+        else:
+            cidrs.extend([block, ipaddress.ip_network(
+                (int(block.network_address) ^ 256, 24))])
+    rng.shuffle(cidrs)
+    return [str(cidr) for cidr in cidrs[:size]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--file")
+    args = parser.parse_args(argv)
+
+    sg_rules = render.load_template_module("sg_rules.py")
+    if args.file:
+        with open(args.file) as f:
+            cidrs = [line.strip() for line in f if line.strip()]
+        for cidr in sg_rules.aggregate(cidrs):
+            print(cidr)
+        return 0
+
+    print("{:>8} {:>8} {:>10}".format("in", "out", "ms"))
+    for size in args.sizes:
+        cidrs = random_cidrs(size)
+        out = sg_rules.aggregate(cidrs)
+        best = min(timeit.repeat(
+            lambda: sg_rules.aggregate(cidrs), number=1, repeat=args.repeat))
+        print("{:>8} {:>8} {:>10.1f}".format(size, len(out), best * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the memory allocated while rendering templates between two trees.
+
+Usage::
+
+    python -m tools.allocations measure dev
+    python -m tools.allocations compare dev --base HEAD~1 --repeat 20
+
+``measure`` renders every stack of a group in one process under
+``tracemalloc`` (each template module is imported first, so import cost is
+left out) and prints, per stack as JSON, the peak traced memory of the first
+render, the mean peak of ``--repeat`` further renders and the memory still
+held afterwards (module-level caches such as the factories in
+``templates/base.py``). ``compare`` runs ``measure`` on a git ref and on the
+working tree, each in a fresh interpreter, and prints both side by side.
+"""
+
+import argparse
+import json
+import sys
+import tracemalloc
+
+from tools import render
+
+KEYS = ["first", "steady", "retained"]
+
+
+def render_peak(module, user_data):
+    """ Peak traced memory (bytes) of one render, above the starting point """
+    tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    module.sceptre_handler(user_data)
+    return tracemalloc.get_traced_memory()[1] - start
+
+
+def measure(group, repeat):
+    stacks = []
+    for name in render.stacks(group):
+        config = render.stack_config(name)
+        module = render.load_template_module(config["template_path"])
+        stacks.append((name, module, config.get("sceptre_user_data")))
+
+    results = {}
+    tracemalloc.start()
+    for name, module, user_data in stacks:
+        start = tracemalloc.get_traced_memory()[0]
+        first = render_peak(module, user_data)
+        steady = sum(render_peak(module, user_data)
+                     for _ in range(repeat)) / float(repeat)
+        results[name] = {
+            "first": first,
+            "steady": int(steady),
+            "retained": tracemalloc.get_traced_memory()[0] - start,
+        }
+    tracemalloc.stop()
+    return results
+
+
+def kib(size):
+    return "{:.1f}".format(size / 1024.0)
+
+
+def change(before, after):
+    if not before:
+        return ""
+    return "{:+.0f}%".format(100.0 * (after - before) / before)
+
+
+def compare(args):
+    measure_args = ["measure", args.group, "--repeat", str(args.repeat)]
+    with render.checkout(args.base) as directory:
+        before = json.loads(render.run_tool(
+            directory, "tools.allocations", *measure_args))
+    after = json.loads(render.run_tool(
+        render.ROOT_DIR, "tools.allocations", *measure_args))
+
+    print("{:<24} {:>25} {:>25} {:>25}".format(
+        "KiB (before/after)", *KEYS))
+    totals = dict((key, [0, 0]) for key in KEYS)
+    for name in sorted(set(before) | set(after)):
+        line = "{:<24}".format(name)
+        for key in KEYS:
+            old = before.get(name, {}).get(key, 0)
+            new = after.get(name, {}).get(key, 0)
+            totals[key][0] += old
+            totals[key][1] += new
+            line += " {:>9} {:>9} {:>5}".format(
+                kib(old), kib(new), change(old, new))
+        print(line)
+    line = "{:<24}".format("total")
+    for key in KEYS:
+        old, new = totals[key]
+        line += " {:>9} {:>9} {:>5}".format(
+            kib(old), kib(new), change(old, new))
+    print(line)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    measure_parser = commands.add_parser("measure")
+    measure_parser.add_argument("group")
+    measure_parser.add_argument("--repeat", type=int, default=10)
+    measure_parser.set_defaults(func=lambda args: print(json.dumps(
+        measure(args.group, args.repeat), indent=2, sort_keys=True)))
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("group")
+    compare_parser.add_argument("--base", default="HEAD",
+                                help="git ref to compare against (default "
+                                     "HEAD)")
+    compare_parser.add_argument("--repeat", type=int, default=10)
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
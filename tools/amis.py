@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Show the Ubuntu AMI each stack of a group launches.
+
+Usage::
+
+    python -m tools.amis dev
+    python -m tools.amis prod --fixture amis.json
+    python -m tools.amis prod --max-age 0      # ignore the cache
+
+The architecture of a stack follows from its ``InstanceType`` (see
+``templates/architectures.py``) and the AMI from Canonical's public SSM
+parameter for that architecture in the stack's region, which is the lookup
+CloudFormation makes when it deploys the stack. Parameters are fetched with
+one ``aws ssm get-parameters`` call per region and kept in
+``build/cache/amis.json`` for ``--max-age`` seconds, so repeated runs make
+no calls at all. ``--fixture`` answers from a JSON file of
+``{region: {architecture: ami}}`` instead of SSM, to work offline.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from tools import render
+
+DEFAULT_CACHE_FILE = os.path.join(render.ROOT_DIR, "build", "cache",
+                                  "amis.json")
+DEFAULT_MAX_AGE = 24 * 3600
+
+
+def image_parameters():
+    """ ``{SSM parameter: architecture}`` of the Ubuntu AMIs """
+    architectures = render.load_template_module("architectures.py")
+    return dict((architectures.image_parameter(arch), arch)
+                for arch in (architectures.AMD64, architectures.ARM64))
+
+
+def ssm_fetch(region, names):
+    """ ``{name: value}`` of SSM parameters ``names`` in ``region`` """
+    output = subprocess.check_output([
+        "aws", "ssm", "get-parameters", "--region", region,
+        "--names"] + list(names) + ["--output", "json"])
+    return dict((parameter["Name"], parameter["Value"])
+                for parameter in json.loads(output)["Parameters"])
+
+
+def fixture_fetch(fixture):
+    """ A fetch function answering from ``{region: {architecture: ami}}`` """
+    by_parameter = image_parameters()
+
+    def fetch(region, names):
+        amis = fixture.get(region, {})
+        return dict((name, amis[by_parameter[name]]) for name in names
+                    if by_parameter.get(name) in amis)
+    return fetch
+
+
+class AmiResolver(object):
+
+    """
+    Resolves (region, architecture) to an AMI id through ``fetch``, caching
+    every answer in memory and, with ``cache_file``, on disk for
+    ``max_age`` seconds.
+    """
+
+    def __init__(self, fetch, cache_file=None, max_age=DEFAULT_MAX_AGE,
+                 clock=time.time):
+        self.fetch = fetch
+        self.cache_file = cache_file
+        self.max_age = max_age
+        self.clock = clock
+        self.calls = 0
+        self.cache = {}
+        if cache_file and os.path.isfile(cache_file):
+            with open(cache_file) as f:
+                self.cache = json.load(f)
+
+    def _fresh(self, region):
+        entry = self.cache.get(region)
+        return entry is not None and \
+            self.clock() - entry["fetched"] <= self.max_age
+
+    def _load(self, region):
+        names = image_parameters()
+        self.calls += 1
+        values = self.fetch(region, sorted(names))
+        self.cache[region] = {
+            "fetched": self.clock(),
+            "amis": dict((names[name], value)
+                         for name, value in values.items()),
+        }
+        if self.cache_file:
+            if not os.path.isdir(os.path.dirname(self.cache_file)):
+                os.makedirs(os.path.dirname(self.cache_file))
+            with open(self.cache_file, "w") as f:
+                json.dump(self.cache, f, indent=2, sort_keys=True)
+
+    def resolve(self, region, arch):
+        if not self._fresh(region):
+            self._load(region)
+        amis = self.cache[region]["amis"]
+        if arch not in amis:
+            raise KeyError("no {} AMI in {}".format(arch, region))
+        return amis[arch]
+
+
+def stack_amis(group, resolver):
+    """ (stack, region, instance type, architecture, AMI) of ``group`` """
+    architectures = render.load_template_module("architectures.py")
+    for name in render.stacks(group):
+        config = render.stack_config(name)
+        instance_type = config["parameters"].get("InstanceType")
+        if not isinstance(instance_type, str):
+            continue
+        arch = architectures.architecture(instance_type)
+        yield (name, config["region"], instance_type, arch,
+               resolver.resolve(config["region"], arch))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("group")
+    parser.add_argument("--fixture",
+                        help="JSON file of {region: {architecture: ami}}")
+    parser.add_argument("--cache-file", default=DEFAULT_CACHE_FILE)
+    parser.add_argument("--max-age", type=int, default=DEFAULT_MAX_AGE,
+                        help="seconds a cached region stays valid")
+    args = parser.parse_args(argv)
+
+    if args.fixture:
+        with open(args.fixture) as f:
+            resolver = AmiResolver(fixture_fetch(json.load(f)))
+    else:
+        resolver = AmiResolver(ssm_fetch, args.cache_file, args.max_age)
+    for row in stack_amis(args.group, resolver):
+        print("{:<28} {:<12} {:<12} {:<6} {}".format(*row))
+    print("{} region lookup(s)".format(resolver.calls), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
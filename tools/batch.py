@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Render many environments in one process.
+
+Usage::
+
+    python -m tools.batch render dev prod -o build/batch
+    python -m tools.batch benchmark --counts 1 10 100
+
+Template bodies only depend on the template module and sceptre_user_data;
+everything else that differs between environments lives in the stack
+parameters. ``render_environments`` therefore builds each distinct
+(template, user data) body once (``render.render`` memoizes them) and per
+stack only writes the body and the stack's own parameters, as
+``<output>/<stack>.json`` and ``<output>/<stack>.parameters.json``. Files are
+written as each stack is rendered rather than collected first.
+
+``benchmark`` clones an environment (``dev`` by default) N times with
+renamed stacks and reports templates written per second, with and without
+sharing the rendered bodies.
+"""
+
+import argparse
+import copy
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from tools import render
+
+DEFAULT_OUTPUT_DIR = os.path.join(render.ROOT_DIR, "build", "batch")
+
+
+def environment_config(group):
+    """ Stack configs of ``group`` keyed by stack name """
+    return {
+        "name": group,
+        "stacks": dict((name, render.stack_config(name))
+                       for name in render.stacks(group)),
+    }
+
+
+def _rename(value, old, new):
+    if isinstance(value, render.StackOutput) and \
+            value.stack.startswith(old + "/"):
+        return value._replace(stack=new + value.stack[len(old):])
+    return value
+
+
+def clone(environment, name):
+    """ Copy of ``environment`` named ``name``, its stack outputs included """
+    old = environment["name"]
+    stacks = {}
+    for stack, config in environment["stacks"].items():
+        config = copy.deepcopy(config)
+        config["parameters"] = dict(
+            (key, _rename(value, old, name))
+            for key, value in config["parameters"].items())
+        stacks[name + stack[len(old):]] = config
+    return {"name": name, "stacks": stacks}
+
+
+def _resolver_json(value):
+    """ Resolver placeholders as the tags sceptre reads them from """
+    if isinstance(value, render.StackOutput):
+        return "!cached_stack_output {}.yaml::{}".format(
+            value.stack, value.output)
+    if isinstance(value, render.Resolver):
+        return "{} {}".format(value.tag, value.argument)
+    if isinstance(value, list):
+        return [_resolver_json(item) for item in value]
+    return value
+
+
+def parameters_json(parameters):
+    """
+    Stack parameters with resolver placeholders turned into their tags.
+    ``json.dump`` would write the namedtuples as arrays rather than call a
+    ``default`` for them, so they are converted first.
+    """
+    return dict((key, _resolver_json(value))
+                for key, value in parameters.items())
+
+
+def render_environments(environments, output_dir, share=True):
+    """
+    Render every stack of ``environments`` into ``output_dir``, yielding
+    each stack name once its files are written. With ``share=False`` every
+    stack is built from scratch, for comparison.
+    """
+    for environment in environments:
+        for name in sorted(environment["stacks"]):
+            config = environment["stacks"][name]
+            user_data = config.get("sceptre_user_data")
+            if share:
+                body = render.render(config["template_path"], user_data)
+            else:
+                module = render.load_template_module(config["template_path"])
+                body = module.sceptre_handler(user_data)
+            path = os.path.join(output_dir, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path + ".json", "w") as f:
+                f.write(body)
+            with open(path + ".parameters.json", "w") as f:
+                json.dump(parameters_json(config["parameters"]), f,
+                          indent=2, sort_keys=True)
+            yield name
+
+
+def throughput(environments, share):
+    """ Templates per second rendering ``environments`` to a scratch dir """
+    render._rendered.clear()
+    output_dir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        count = sum(1 for _ in render_environments(
+            environments, output_dir, share))
+        return count, count / (time.perf_counter() - start)
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def render_command(args):
+    environments = [environment_config(group)
+                    for group in args.environments or render.environments()]
+    for name in render_environments(environments, args.output_dir):
+        print(os.path.join(args.output_dir, name) + ".json")
+    return 0
+
+
+def benchmark(args):
+    base = environment_config(args.environment)
+    # Render once untimed so that template modules and the troposphere
+    # modules they import lazily are already loaded
+    for config in base["stacks"].values():
+        render.load_template_module(config["template_path"]).sceptre_handler(
+            config.get("sceptre_user_data"))
+    print("{:>6} {:>10} {:>14} {:>14}".format(
+        "envs", "templates", "shared/s", "unshared/s"))
+    for count in args.counts:
+        environments = [clone(base, "{}-{}".format(args.environment, i))
+                        for i in range(count)]
+        templates, shared = throughput(environments, True)
+        _, unshared = throughput(environments, False)
+        print("{:>6} {:>10} {:>14.1f} {:>14.1f}".format(
+            count, templates, shared, unshared))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    render_parser = commands.add_parser("render")
+    render_parser.add_argument("environments", nargs="*")
+    render_parser.add_argument("-o", "--output-dir",
+                               default=DEFAULT_OUTPUT_DIR)
+    render_parser.set_defaults(func=render_command)
+
+    benchmark_parser = commands.add_parser("benchmark")
+    benchmark_parser.add_argument("--environment", default="dev")
+    benchmark_parser.add_argument("--counts", type=int, nargs="+",
+                                  default=[1, 10, 100])
+    benchmark_parser.set_defaults(func=benchmark)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
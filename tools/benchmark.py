@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Run the load-test scenarios against a local stand-in and track the results.
+
+Usage::
+
+    python -m tools.benchmark run --label baseline
+    python -m tools.benchmark run --label opcache --users 100 -t 5m
+    python -m tools.benchmark report
+
+``run`` drives ``loadtest/locustfile.py`` headless against ``--host``
+(the HAProxy of ``tools.compose`` by default) and appends the aggregated
+throughput and latency to the results file. ``report`` prints every run
+with its change against the first run.
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from tools import render
+
+DEFAULT_RESULTS = os.path.join(
+    render.ROOT_DIR, "build", "benchmarks", "results.jsonl")
+LOCUSTFILE = os.path.join(render.ROOT_DIR, "loadtest", "locustfile.py")
+
+COLUMNS = [
+    ("rps", "Requests/s"),
+    ("failures", "Failures/s"),
+    ("p50", "50%"),
+    ("p95", "95%"),
+    ("p99", "99%"),
+]
+
+
+def aggregated_row(path):
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            if row["Name"] == "Aggregated":
+                return row
+    raise ValueError("no Aggregated row in {}".format(path))
+
+
+def run(args):
+    prefix = os.path.join(tempfile.mkdtemp(), "benchmark")
+    subprocess.check_call([
+        "locust", "-f", LOCUSTFILE, "--headless",
+        "--host", args.host,
+        "-u", str(args.users),
+        "-r", str(args.spawn_rate),
+        "-t", args.run_time,
+        "--csv", prefix,
+    ])
+    row = aggregated_row(prefix + "_stats.csv")
+    result = dict((key, float(row[column] or 0)) for key, column in COLUMNS)
+    result.update(label=args.label, time=int(time.time()),
+                  users=args.users, run_time=args.run_time)
+
+    if not os.path.isdir(os.path.dirname(args.results)):
+        os.makedirs(os.path.dirname(args.results))
+    with open(args.results, "a") as f:
+        f.write(json.dumps(result, sort_keys=True) + "\n")
+    report(args)
+
+
+def change(value, baseline):
+    if not baseline:
+        return ""
+    return "({:+.0f}%)".format(100.0 * (value - baseline) / baseline)
+
+
+def report(args):
+    with open(args.results) as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    if not results:
+        return
+    baseline = results[0]
+    header = ["label", "users"] + [key for key, _ in COLUMNS]
+    print("  ".join("{:>16}".format(h) for h in header))
+    for result in results:
+        cells = [result["label"], str(result["users"])] + [
+            "{:.1f} {}".format(result[key], change(result[key], baseline[key]))
+            for key, _ in COLUMNS]
+        print("  ".join("{:>16}".format(c) for c in cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--results", default=DEFAULT_RESULTS)
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--label", required=True)
+    run_parser.add_argument("--host", default="http://localhost")
+    run_parser.add_argument("-u", "--users", type=int, default=50)
+    run_parser.add_argument("-r", "--spawn-rate", type=int, default=5)
+    run_parser.add_argument("-t", "--run-time", default="2m")
+    run_parser.set_defaults(func=run)
+
+    report_parser = commands.add_parser("report")
+    report_parser.set_defaults(func=report)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
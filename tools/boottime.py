@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Median and worst-case time of each web server boot phase.
+
+Usage::
+
+    python -m tools.boottime report build/boot/*.log
+    python -m tools.boottime report build/boot --format json
+    python -m tools.boottime metrics prod/wordpress --days 14
+    python -m tools.boottime sample build/boot --instances 20
+
+The web servers' UserData is timed (``templates/bootstrap.py``): every phase
+prints a ``BOOT_PHASE`` line to the console (``cloud-init-output.log``) and
+to ``/var/log/boot-phases.log``, and pushes its duration to CloudWatch.
+
+``report`` reads these lines from log files (plain or ``.gz``, or every
+file of a directory), one file per instance, e.g. collected with
+``aws ec2 get-console-output``. Other lines are skipped, so whole console
+logs will do. ``metrics`` asks CloudWatch for the same figures over the
+last ``--days`` for one wordpress stack. ``sample`` writes seeded synthetic
+logs in the same format, to try ``report`` on.
+
+Phases are listed in boot order, with ``total`` (first start to last end)
+last. Slow phases are the ones worth moving into the AMI.
+"""
+
+import argparse
+import collections
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+from datetime import datetime, timedelta, timezone
+
+from tools import render
+
+MARKER = "BOOT_PHASE"
+TOTAL = "total"
+
+Phase = collections.namedtuple("Phase", ["name", "start", "end", "status"])
+Summary = collections.namedtuple(
+    "Summary", ["phase", "instances", "median", "worst", "worst_instance",
+                "failures"])
+
+# Seconds (median, spread) of each phase of a typical boot, for ``sample``
+SAMPLE_PHASES = [
+    ("apt", 45, 15), ("efs_mount", 3, 2), ("cfn_bootstrap", 20, 6),
+    ("cfn_init", 90, 30), ("wp_cli", 2, 1), ("wordpress_deploy", 8, 3),
+    ("rehome", 2, 1), ("cfn_signal", 1, 0.5), ("configure_search", 1, 0.5),
+]
+
+
+def parse(line):
+    """
+    The phase of a ``BOOT_PHASE`` line, or None for any other line
+
+    >>> parse("BOOT_PHASE name=apt start=100.5 end=130.25 status=0")
+    Phase(name='apt', start=100.5, end=130.25, status=0)
+    >>> parse("+ echo 'BOOT_PHASE name=apt start=100.5'") is None
+    True
+    """
+    fields = line.split()
+    if not fields or fields[0] != MARKER:
+        return None
+    values = dict(field.partition("=")[::2] for field in fields[1:])
+    try:
+        return Phase(values["name"], float(values["start"]),
+                     float(values["end"]), int(values.get("status", 0)))
+    except (KeyError, ValueError):
+        return None
+
+
+def durations(lines):
+    """
+    ``[(phase, seconds, status)]`` of one boot in order, with the total
+
+    >>> durations([
+    ...     "BOOT_PHASE name=apt start=100 end=130 status=0",
+    ...     "Setting up apache2 ...",
+    ...     "BOOT_PHASE name=cfn_init start=131 end=221.5 status=1",
+    ... ])
+    [('apt', 30.0, 0), ('cfn_init', 90.5, 1), ('total', 121.5, 1)]
+    """
+    phases = [phase for phase in map(parse, lines) if phase]
+    if not phases:
+        return []
+    result = [(p.name, p.end - p.start, p.status) for p in phases]
+    status = max(p.status for p in phases)
+    return result + [(TOTAL, phases[-1].end - phases[0].start, status)]
+
+
+def summarize(boots):
+    """
+    Summary of each phase over ``{instance: durations}``, in boot order
+
+    >>> for s in summarize({
+    ...         "i-1": [("apt", 30.0, 0), ("total", 60.0, 0)],
+    ...         "i-2": [("apt", 50.0, 0), ("total", 90.0, 0)],
+    ...         "i-3": [("apt", 40.0, 2), ("total", 70.0, 2)]}):
+    ...     print(s.phase, s.instances, s.median, s.worst, s.worst_instance,
+    ...           s.failures)
+    apt 3 40.0 50.0 i-2 1
+    total 3 70.0 90.0 i-2 1
+    """
+    seconds = collections.OrderedDict()
+    for instance, phases in sorted(boots.items()):
+        for name, duration, status in phases:
+            seconds.setdefault(name, []).append((duration, instance, status))
+    if TOTAL in seconds:
+        seconds.move_to_end(TOTAL)
+    summaries = []
+    for name, samples in seconds.items():
+        worst, worst_instance, _ = max(samples)
+        summaries.append(Summary(
+            name, len(samples),
+            statistics.median(duration for duration, _, _ in samples),
+            worst, worst_instance,
+            sum(1 for _, _, status in samples if status)))
+    return summaries
+
+
+def read_lines(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", errors="replace") as f:
+        for line in f:
+            yield line
+
+
+def log_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in sorted(os.walk(path)):
+                for name in sorted(names):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def instance_of(path):
+    """ Instance a log file is of: its name without extensions """
+    return os.path.basename(path).split(".")[0]
+
+
+def print_summaries(summaries, fmt):
+    if fmt == "json":
+        print(json.dumps([s._asdict() for s in summaries], indent=2))
+        return
+    print("{:<20} {:>9} {:>9} {:>9} {:>8}  {}".format(
+        "phase", "instances", "median", "worst", "failed", "worst instance"))
+    for s in summaries:
+        print("{:<20} {:>9} {:>8.1f}s {:>8.1f}s {:>8}  {}".format(
+            s.phase, s.instances, s.median, s.worst,
+            "" if s.failures is None else s.failures, s.worst_instance or ""))
+
+
+def report(args):
+    boots = {}
+    for path in log_files(args.paths):
+        phases = durations(read_lines(path))
+        if phases:
+            boots[instance_of(path)] = phases
+    if not boots:
+        print("no {} lines in {}".format(MARKER, " ".join(args.paths)),
+              file=sys.stderr)
+        return 1
+    print_summaries(summarize(boots), args.format)
+    return 0
+
+
+def metrics(args):
+    from tools import deploy
+    import boto3
+
+    name = render.stack_name(args.stack)
+    config = render.stack_config(name)
+    bootstrap = render.load_template_module("bootstrap.py")
+    cloudwatch = boto3.session.Session(
+        region_name=config.get("region")).client("cloudwatch")
+    stack = deploy.stack_name(config, name)
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=args.days)
+
+    phases = [
+        dimension["Value"]
+        for page in cloudwatch.get_paginator("list_metrics").paginate(
+            Namespace=bootstrap.PHASE_NAMESPACE,
+            MetricName=bootstrap.PHASE_METRIC,
+            Dimensions=[{"Name": "StackName", "Value": stack}])
+        for metric in page["Metrics"]
+        for dimension in metric["Dimensions"] if dimension["Name"] == "Phase"]
+    order = [phase for phase, _, _ in SAMPLE_PHASES] + [TOTAL]
+    phases.sort(key=lambda p: (order.index(p) if p in order else len(order),
+                               p))
+
+    summaries = []
+    for phase in phases:
+        # Statistics and ExtendedStatistics cannot be asked for together
+        query = dict(
+            Namespace=bootstrap.PHASE_NAMESPACE,
+            MetricName=bootstrap.PHASE_METRIC,
+            Dimensions=[{"Name": "StackName", "Value": stack},
+                        {"Name": "Phase", "Value": phase}],
+            StartTime=start, EndTime=end, Period=args.days * 86400)
+        counts = cloudwatch.get_metric_statistics(
+            Statistics=["SampleCount"], **query)["Datapoints"]
+        percentiles = cloudwatch.get_metric_statistics(
+            ExtendedStatistics=["p50", "p100"], **query)["Datapoints"]
+        if counts and percentiles:
+            extended = percentiles[0]["ExtendedStatistics"]
+            summaries.append(Summary(
+                phase, int(counts[0]["SampleCount"]), extended["p50"],
+                extended["p100"], None, None))
+    if not summaries:
+        print("no {} metrics for {} in the last {} days".format(
+            bootstrap.PHASE_METRIC, stack, args.days), file=sys.stderr)
+        return 1
+    print_summaries(summaries, args.format)
+    return 0
+
+
+def sample(args):
+    rng = random.Random(args.seed)
+    os.makedirs(args.directory, exist_ok=True)
+    clock = 1760000000.0
+    for n in range(args.instances):
+        clock += rng.uniform(60, 3600)
+        lines = []
+        start = clock
+        for name, median, spread in SAMPLE_PHASES:
+            seconds = max(0.05, rng.lognormvariate(0, 0.3) * median +
+                          rng.uniform(-spread, spread))
+            lines.append(
+                "{} name={} start={:.3f} end={:.3f} status={}\n".format(
+                    MARKER, name, start, start + seconds,
+                    1 if rng.random() < 0.02 else 0))
+            lines.append("+ phase_start\n")
+            start += seconds + 0.01
+        path = os.path.join(args.directory, "i-{:017x}.log".format(
+            rng.getrandbits(68)))
+        with open(path, "w") as f:
+            f.writelines(lines)
+    print("wrote {} logs to {}".format(args.instances, args.directory))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    report_parser = commands.add_parser("report")
+    report_parser.add_argument("paths", nargs="+",
+                               help="log files or directories of them")
+    report_parser.add_argument("--format", choices=["text", "json"],
+                               default="text")
+    report_parser.set_defaults(func=report)
+
+    metrics_parser = commands.add_parser("metrics")
+    metrics_parser.add_argument("stack", help="wordpress stack, e.g. "
+                                "prod/wordpress")
+    metrics_parser.add_argument("--days", type=int, default=7)
+    metrics_parser.add_argument("--format", choices=["text", "json"],
+                                default="text")
+    metrics_parser.set_defaults(func=metrics)
+
+    sample_parser = commands.add_parser("sample")
+    sample_parser.add_argument("directory")
+    sample_parser.add_argument("--instances", type=int, default=20)
+    sample_parser.add_argument("--seed", type=int, default=0)
+    sample_parser.set_defaults(func=sample)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
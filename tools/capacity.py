@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+Size the web tier, database and EFS of an environment for a target load.
+
+Usage::
+
+    python -m tools.capacity plan --rps 150 --hit-ratio 0.8
+    python -m tools.capacity plan --rps 50 100 200 400 --hit-ratio 0.6 0.9
+    python -m tools.capacity plan --rps 150 --costs costs.json --write prod
+
+The model works on the requests that miss the cache, ``rps * (1 -
+hit_ratio)``. It uses the per-request costs of an uncached request:
+
+- ``web_cpu_ms``: web server CPU time
+- ``latency_ms``: time a PHP worker is busy
+- ``php_worker_mib``: memory of a PHP worker
+- ``db_cpu_ms``: database CPU time
+- ``efs_kib``: bytes read from EFS
+
+By default ``web_cpu_ms`` and ``latency_ms`` come from a ``tools.benchmark``
+run (``--label``, the latest by default). The run is assumed to have kept
+``--vcpus`` web CPUs busy. ``--costs`` is a JSON object that overrides any of
+the costs, and DEFAULT_COSTS fills in the rest.
+
+Every instance type the wordpress stack accepts is tried with 1 to 20
+instances, for every ``--rps`` and ``--hit-ratio`` combination, as NumPy
+arrays:
+
+- ``WebServerCapacity`` is the cheapest count that keeps CPU under
+  ``--utilization`` at the target rate. It is at least ``--min-capacity``,
+  and there must be PHP workers enough for the concurrent requests.
+- ``WebServerMaxCapacity`` is the count needed at ``--peak`` times the rate.
+- Burstable types are capped at their baseline when credits are standard
+  (t2). Otherwise the surplus credits above baseline are priced in.
+- ``DBInstanceClass`` is the cheapest class that carries the peak query CPU,
+  and whose default ``max_connections`` covers every PHP worker of
+  ``WebServerMaxCapacity`` instances.
+- EFS stays ``bursting`` while the peak read rate fits the baseline of
+  ``--efs-gib``. Beyond that it is ``provisioned`` for the peak plus
+  headroom.
+
+Prices are approximate us-east-1 on-demand list prices (``--prices``
+overrides them with ``{type: dollars per hour}``). They rank the options;
+they are not a bill. ``--write`` sets the recommended parameters in place in
+``config/<env>/{wordpress,rds,efs}.yaml``, and needs exactly one scenario.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from tools import benchmark, render
+
+# Per uncached request; see the module docstring
+DEFAULT_COSTS = {
+    "web_cpu_ms": 60.0,
+    "latency_ms": 250.0,
+    "php_worker_mib": 48.0,
+    "db_cpu_ms": 6.0,
+    "efs_kib": 96.0,
+}
+# Memory of an instance that is not available to PHP workers
+RESERVED_MIB = 512
+# RDS MySQL default max_connections is DBInstanceClassMemory / 12582880
+DB_BYTES_PER_CONNECTION = 12582880
+# Surplus CPU credits of unlimited burstable instances, $ per vCPU-hour
+SURPLUS_CREDIT_PRICE = {"t3": 0.05, "t3a": 0.05, "t4g": 0.04}
+# EFS bursting baseline per GiB stored, and the floor every file system gets
+EFS_BASELINE_MIBS_PER_GIB = 50.0 / 1024
+EFS_MIN_BASELINE_MIBS = 1.0
+MAX_CAPACITY = 20
+
+# (vCPUs, GiB) per size, per family kind
+BURSTABLE = {
+    "micro": (2, 1), "small": (2, 2), "medium": (2, 4), "large": (2, 8),
+    "xlarge": (4, 16), "2xlarge": (8, 32)}
+GENERAL = {"large": (2, 8), "xlarge": (4, 16), "2xlarge": (8, 32),
+           "4xlarge": (16, 64)}
+COMPUTE = {"large": (2, 4), "xlarge": (4, 8), "2xlarge": (8, 16),
+           "4xlarge": (16, 32)}
+MEMORY = {"large": (2, 16), "xlarge": (4, 32), "2xlarge": (8, 64),
+          "4xlarge": (16, 128)}
+# t2 micro and small have a single vCPU
+T2_VCPUS = {"micro": 1, "small": 1}
+# Baseline share of each vCPU of burstable sizes
+BASELINE = {"micro": 0.1, "small": 0.2, "medium": 0.2, "large": 0.3,
+            "xlarge": 0.4, "2xlarge": 0.4}
+T2_BASELINE = {"micro": 0.1, "small": 0.2, "medium": 0.2, "large": 0.3,
+               "xlarge": 0.225, "2xlarge": 0.17}
+# Price of the large size, $ per hour; sizes scale it by vCPU-equivalents
+LARGE_PRICE = {
+    "t2": 0.0928, "t3": 0.0832, "t3a": 0.0752, "t4g": 0.0672,
+    "m5": 0.096, "c5": 0.085, "m6g": 0.077, "m7g": 0.0816, "c6g": 0.068,
+    "c7g": 0.0725,
+    "db.t2": 0.136, "db.t3": 0.136, "db.t4g": 0.129, "db.m5": 0.171,
+    "db.r5": 0.25, "db.m6g": 0.152, "db.m7g": 0.168, "db.r6g": 0.225,
+    "db.r7g": 0.239,
+}
+SIZE_PRICE_FACTOR = {"micro": 0.125, "small": 0.25, "medium": 0.5,
+                     "large": 1, "xlarge": 2, "2xlarge": 4, "4xlarge": 8}
+
+
+def catalog(types, prices=None):
+    """
+    Arrays of vCPUs, GiB, price, baseline share and credit price of
+    ``types`` (a baseline of 1 is not burstable)
+
+    >>> c = catalog(["t3.micro", "m5.large", "db.r5.large"])
+    >>> c["vcpus"].tolist(), c["gib"].tolist(), c["baseline"].tolist()
+    ([2.0, 2.0, 2.0], [1.0, 8.0, 16.0], [0.1, 1.0, 1.0])
+    """
+    rows = []
+    for instance_type in types:
+        family, size = instance_type.rsplit(".", 1)
+        kind = family.split(".")[-1]
+        if kind.startswith("t"):
+            vcpus, gib = BURSTABLE[size]
+            baseline = (T2_BASELINE if kind == "t2" else BASELINE)[size]
+            if kind == "t2":
+                vcpus = T2_VCPUS.get(size, vcpus)
+        else:
+            vcpus, gib = {"m": GENERAL, "c": COMPUTE, "r": MEMORY}[
+                kind[0]][size]
+            baseline = 1.0
+        price = LARGE_PRICE[family] * SIZE_PRICE_FACTOR[size]
+        if prices and instance_type in prices:
+            price = prices[instance_type]
+        rows.append((vcpus, gib, price, baseline,
+                     SURPLUS_CREDIT_PRICE.get(kind, 0.0)))
+    columns = np.array(rows, dtype=float).T
+    return dict(zip(["vcpus", "gib", "price", "baseline", "credit"], columns))
+
+
+def web_plan(uncached, peak, costs, web, utilization, min_capacity):
+    """
+    Cheapest instance type and counts per scenario.
+
+    ``uncached`` has one rate per scenario; every type and count is
+    evaluated at once as (scenarios, types, counts) arrays. Returns, per
+    scenario, the index into the catalog ``web`` of the chosen type, the
+    counts at the rate and at the peak, the hourly price at the rate and
+    the PHP workers per instance.
+    """
+    counts = np.arange(1, MAX_CAPACITY + 1, dtype=float)
+    rate = uncached[:, None, None]
+    # CPU each instance needs at the rate, as a share of its vCPUs
+    busy = rate * costs["web_cpu_ms"] / 1000.0 / counts[None, None, :] \
+        / web["vcpus"][None, :, None]
+    workers = np.floor(
+        (web["gib"] * 1024 - RESERVED_MIB) / costs["php_worker_mib"])
+    concurrent = rate * costs["latency_ms"] / 1000.0 / counts[None, None, :]
+    # Standard credits (no credit price) cannot go over the baseline
+    ceiling = np.where(web["credit"] > 0, utilization,
+                       np.minimum(utilization, web["baseline"]))
+    fits = (busy <= ceiling[None, :, None]) & \
+        (concurrent <= workers[None, :, None]) & \
+        (counts[None, None, :] >= min_capacity)
+    surplus = np.maximum(busy - web["baseline"][None, :, None], 0) \
+        * web["vcpus"][None, :, None] * web["credit"][None, :, None]
+    hourly = counts[None, None, :] * (web["price"][None, :, None] + surplus)
+    hourly = np.where(fits, hourly, np.inf)
+    peak_fits = (busy * peak <= ceiling[None, :, None]) & \
+        (concurrent * peak <= workers[None, :, None]) & \
+        (counts[None, None, :] >= min_capacity)
+
+    # Cheapest count per (scenario, type), and the first count that holds
+    # the peak; a type fits a scenario only if both exist
+    capacity = hourly.argmin(axis=2) + 1
+    max_capacity = np.where(
+        peak_fits.any(axis=2),
+        np.maximum(peak_fits.argmax(axis=2) + 1, capacity), 0)
+    cost = hourly.min(axis=2)
+    cost = np.where(max_capacity > 0, cost, np.inf)
+    choice = cost.argmin(axis=1)
+    scenarios = np.arange(len(uncached))
+    return (choice, capacity[scenarios, choice],
+            max_capacity[scenarios, choice], cost[scenarios, choice],
+            workers[choice])
+
+
+def db_plan(uncached, peak, costs, db, utilization, connections, multi_az):
+    """ Index into the catalog ``db`` of the cheapest fitting class """
+    busy = (uncached * peak)[:, None] * costs["db_cpu_ms"] / 1000.0 \
+        / db["vcpus"][None, :]
+    max_connections = db["gib"] * 1024 ** 3 / DB_BYTES_PER_CONNECTION
+    fits = (busy <= utilization) & \
+        (connections[:, None] <= max_connections[None, :])
+    surplus = np.maximum(busy - db["baseline"][None, :], 0) \
+        * db["vcpus"][None, :] * db["credit"][None, :]
+    hourly = (db["price"][None, :] + surplus) * (2 if multi_az else 1)
+    hourly = np.where(fits, hourly, np.inf)
+    choice = hourly.argmin(axis=1)
+    return choice, hourly[np.arange(len(uncached)), choice]
+
+
+def efs_plan(uncached, peak, costs, storage_gib, headroom):
+    """ (mode, provisioned MiB/s or None, peak MiB/s) per scenario """
+    read = uncached * peak * costs["efs_kib"] / 1024.0
+    baseline = max(EFS_MIN_BASELINE_MIBS,
+                   storage_gib * EFS_BASELINE_MIBS_PER_GIB)
+    return [("bursting", None, mibs) if mibs <= baseline else
+            ("provisioned", int(math.ceil(mibs / headroom)), mibs)
+            for mibs in read.tolist()]
+
+
+def load_costs(args):
+    costs = dict(DEFAULT_COSTS)
+    if os.path.exists(args.results):
+        with open(args.results) as f:
+            runs = [json.loads(line) for line in f if line.strip()]
+        if args.label:
+            runs = [run for run in runs if run["label"] == args.label]
+        if runs and runs[-1]["rps"] > 0:
+            run = runs[-1]
+            costs["web_cpu_ms"] = 1000.0 * args.vcpus / run["rps"]
+            costs["latency_ms"] = run["p50"]
+        elif args.label:
+            raise ValueError("no benchmark run labelled {!r} in {}".format(
+                args.label, args.results))
+    if args.costs:
+        with open(args.costs) as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(DEFAULT_COSTS)
+        if unknown:
+            raise ValueError("unknown costs: {}".format(
+                ", ".join(sorted(unknown))))
+        costs.update(overrides)
+    return costs
+
+
+def plan(args):
+    architectures = render.load_template_module("architectures.py")
+    prices = None
+    if args.prices:
+        with open(args.prices) as f:
+            prices = json.load(f)
+    web_types = list(architectures.instance_types())
+    db_types = list(architectures.instance_types(db=True))
+    web, db = catalog(web_types, prices), catalog(db_types, prices)
+    costs = load_costs(args)
+
+    start = time.perf_counter()
+    scenarios = list(itertools.product(args.rps, args.hit_ratio))
+    rps = np.array([rate for rate, _ in scenarios], dtype=float)
+    hit = np.array([ratio for _, ratio in scenarios], dtype=float)
+    uncached = rps * (1 - hit)
+    choice, capacity, max_capacity, web_cost, workers = web_plan(
+        uncached, args.peak, costs, web, args.utilization,
+        args.min_capacity)
+    db_choice, db_cost = db_plan(
+        uncached, args.peak, costs, db, args.utilization,
+        max_capacity * workers, args.multi_az)
+    efs = efs_plan(uncached, args.peak, costs, args.efs_gib,
+                   args.utilization)
+    seconds = time.perf_counter() - start
+
+    plans = []
+    for i, (rate, ratio) in enumerate(scenarios):
+        if not np.isfinite(web_cost[i]) or not np.isfinite(db_cost[i]):
+            plans.append({"rps": rate, "hit_ratio": ratio})
+            continue
+        mode, provisioned, mibs = efs[i]
+        plans.append({
+            "rps": rate,
+            "hit_ratio": ratio,
+            "InstanceType": web_types[choice[i]],
+            "WebServerCapacity": int(capacity[i]),
+            "WebServerMaxCapacity": int(max_capacity[i]),
+            "DBInstanceClass": db_types[db_choice[i]],
+            "ThroughputMode": mode,
+            "ProvisionedThroughput": provisioned,
+            "efs_mibs": round(mibs, 2),
+            "hourly": round(float(web_cost[i] + db_cost[i]), 3),
+        })
+
+    configurations = len(scenarios) * (
+        len(web_types) * MAX_CAPACITY + len(db_types))
+    if args.format == "json":
+        print(json.dumps({"costs": costs, "plans": plans}, indent=2))
+    else:
+        print("costs per uncached request: " + ", ".join(
+            "{}={:g}".format(key, value)
+            for key, value in sorted(costs.items())))
+        print("{:>7} {:>5} {:<11} {:>4} {:>4} {:<14} {:<16} {:>8}".format(
+            "rps", "hit", "instance", "min", "max", "db class", "efs",
+            "$/hour"))
+        for p in plans:
+            if "InstanceType" not in p:
+                print("{:>7g} {:>5g} no configuration fits".format(
+                    p["rps"], p["hit_ratio"]))
+                continue
+            efs_text = p["ThroughputMode"] if p["ProvisionedThroughput"] \
+                is None else "provisioned {}".format(
+                    p["ProvisionedThroughput"])
+            print("{:>7g} {:>5g} {:<11} {:>4} {:>4} {:<14} {:<16} "
+                  "{:>8.3f}".format(
+                      p["rps"], p["hit_ratio"], p["InstanceType"],
+                      p["WebServerCapacity"], p["WebServerMaxCapacity"],
+                      p["DBInstanceClass"], efs_text, p["hourly"]))
+    print("{} configurations in {:.1f} ms".format(
+        configurations, seconds * 1000), file=sys.stderr)
+
+    if args.write:
+        if len(plans) != 1 or "InstanceType" not in plans[0]:
+            print("--write needs exactly one scenario that fits",
+                  file=sys.stderr)
+            return 1
+        for path in write_overlay(args.write, plans[0]):
+            print("wrote {}".format(path), file=sys.stderr)
+    return 0
+
+
+# Parameters written by --write, per stack config
+OVERLAY = {
+    "wordpress.yaml": [
+        "InstanceType", "WebServerCapacity", "WebServerMaxCapacity"],
+    "rds.yaml": ["DBInstanceClass"],
+    "efs.yaml": ["ThroughputMode", "ProvisionedThroughput"],
+}
+
+
+def set_parameters(text, values):
+    """
+    Set ``values`` in the ``parameters`` block of a stack config, keeping
+    everything else as it is
+
+    >>> print(set_parameters("parameters:\\n  A: x\\n  B: y\\n\\nz: 1\\n",
+    ...                      {"B": 2, "C": "t3.large"}), end="")
+    parameters:
+      A: x
+      B: "2"
+      C: t3.large
+    <BLANKLINE>
+    z: 1
+    """
+    lines = text.splitlines(True)
+    start = next(i for i, line in enumerate(lines)
+                 if line.rstrip() == "parameters:") + 1
+    end = start
+    while end < len(lines) and lines[end].startswith("  "):
+        end += 1
+    for key, value in values.items():
+        value = str(value)
+        if value.isdigit():
+            value = json.dumps(value)
+        line = "  {}: {}\n".format(key, value)
+        pattern = re.compile(r"^  {}:".format(re.escape(key)))
+        for i in range(start, end):
+            if pattern.match(lines[i]):
+                lines[i] = line
+                break
+        else:
+            lines.insert(end, line)
+            end += 1
+    return "".join(lines)
+
+
+def write_overlay(group, plan):
+    """ Set the planned parameters in the stack configs of ``group`` """
+    written = []
+    for name, keys in sorted(OVERLAY.items()):
+        path = os.path.join(render.CONFIG_DIR, group, name)
+        values = dict((key, plan[key]) for key in keys
+                      if plan[key] is not None)
+        if not os.path.exists(path) or not values:
+            continue
+        with open(path) as f:
+            text = f.read()
+        with open(path, "w") as f:
+            f.write(set_parameters(text, values))
+        written.append(path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    plan_parser = commands.add_parser("plan")
+    plan_parser.add_argument("--rps", type=float, nargs="+", required=True,
+                             help="target requests per second")
+    plan_parser.add_argument("--hit-ratio", type=float, nargs="+",
+                             default=[0.0],
+                             help="share of requests answered by a cache")
+    plan_parser.add_argument("--peak", type=float, default=2.0,
+                             help="peak rate as a multiple of the target")
+    plan_parser.add_argument("--utilization", type=float, default=0.6,
+                             help="highest CPU share to plan for")
+    plan_parser.add_argument("--min-capacity", type=int, default=2,
+                             help="fewest web servers (one per AZ)")
+    plan_parser.add_argument("--multi-az", action="store_true",
+                             help="price the database as Multi-AZ")
+    plan_parser.add_argument("--efs-gib", type=float, default=10.0,
+                             help="data stored on EFS")
+    plan_parser.add_argument("--results", default=benchmark.DEFAULT_RESULTS,
+                             help="tools.benchmark results file")
+    plan_parser.add_argument("--label",
+                             help="benchmark run to take costs from")
+    plan_parser.add_argument("--vcpus", type=float, default=1.0,
+                             help="web CPUs the benchmark run kept busy")
+    plan_parser.add_argument("--costs", help="JSON object of costs")
+    plan_parser.add_argument("--prices",
+                             help="JSON object of $/hour per type")
+    plan_parser.add_argument("--format", choices=["text", "json"],
+                             default="text")
+    plan_parser.add_argument("--write", metavar="ENV",
+                             help="set the plan in config/ENV")
+    plan_parser.set_defaults(func=plan)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Work out which stacks an update actually needs to touch.
+
+Usage::
+
+    python -m tools.changes fingerprint prod > prod.json
+    python -m tools.changes diff prod --base origin/master --dry-run
+    python -m tools.changes diff prod --base-file prod.json
+
+A stack's fingerprint hashes its rendered template (which covers the
+template module and every shared module it imports) and its config. ``diff``
+fingerprints the working tree and a base (a git ref exported to a temporary
+directory, or a saved fingerprint file), then adds every stack depending on a
+changed one through ``!stack_output``. With ``--dry-run`` it prints a JSON
+report; otherwise it runs ``sceptre launch`` on each stack in dependency
+order.
+"""
+
+import argparse
+import hashlib
+import json
+import subprocess
+import sys
+
+from tools import render
+
+# Config keys that change what sceptre deploys; the rest (template bucket,
+# custom stack group keys such as ``regions``) do not
+STACK_KEYS = [
+    "dependencies", "iam_role", "notifications", "on_failure", "parameters",
+    "profile", "project_code", "region", "role_arn", "sceptre_user_data",
+    "stack_name", "stack_tags", "template_path",
+]
+
+
+def digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def fingerprint(name):
+    config = render.stack_config(name)
+    template = render.render(
+        config["template_path"], config.get("sceptre_user_data"))
+    return {
+        "template": digest(template),
+        "config": digest(json.dumps(
+            dict((key, config[key]) for key in STACK_KEYS if key in config),
+            sort_keys=True)),
+        "dependencies": render.dependencies(config),
+    }
+
+
+def fingerprints(group):
+    return dict((name, fingerprint(name)) for name in render.stacks(group))
+
+
+def base_fingerprints(group, ref):
+    """ Fingerprints of ``group`` as of git ``ref`` """
+    with render.checkout(ref) as directory:
+        return json.loads(render.run_tool(
+            directory, "tools.changes", "fingerprint", group))
+
+
+def reasons(base, head):
+    """ Why each stack differs between two sets of fingerprints """
+    changed = {}
+    for name in sorted(set(base) | set(head)):
+        if name not in base:
+            changed[name] = ["new"]
+        elif name not in head:
+            changed[name] = ["removed"]
+        else:
+            keys = [key for key in ["template", "config"]
+                    if base[name][key] != head[name][key]]
+            if keys:
+                changed[name] = keys
+    return changed
+
+
+def dependents(head, names):
+    """ Every stack downstream of ``names`` """
+    found = set()
+    pending = list(names)
+    while pending:
+        current = pending.pop()
+        for name, stack in head.items():
+            if current in stack["dependencies"] and name not in found:
+                found.add(name)
+                pending.append(name)
+    return found - set(names)
+
+
+def dependency_order(head, names):
+    """ ``names`` sorted so that every stack follows its dependencies """
+    ordered = []
+
+    def visit(name, path):
+        if name in ordered or name not in head:
+            return
+        if name in path:
+            raise ValueError("dependency cycle: " + " -> ".join(
+                path + [name]))
+        for dependency in head[name]["dependencies"]:
+            visit(dependency, path + [name])
+        ordered.append(name)
+
+    for name in sorted(head):
+        visit(name, [])
+    return [name for name in ordered if name in names]
+
+
+def plan(base, head):
+    changed = reasons(base, head)
+    present = [name for name, why in changed.items() if why != ["removed"]]
+    downstream = dependents(head, present)
+    return {
+        "changed": changed,
+        "dependents": sorted(downstream),
+        "removed": sorted(name for name, why in changed.items()
+                          if why == ["removed"]),
+        "update": dependency_order(head, set(present) | downstream),
+    }
+
+
+def diff(args):
+    head = fingerprints(args.group)
+    if args.base_file:
+        with open(args.base_file) as f:
+            base = json.load(f)
+    else:
+        base = base_fingerprints(args.group, args.base)
+    report = plan(base, head)
+    if args.dry_run:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return 0
+    for name in report["update"]:
+        subprocess.check_call(["sceptre", "launch", "-y", name + ".yaml"],
+                              cwd=render.ROOT_DIR)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    fingerprint_parser = commands.add_parser("fingerprint")
+    fingerprint_parser.add_argument("group")
+    fingerprint_parser.set_defaults(func=lambda args: print(json.dumps(
+        fingerprints(args.group), indent=2, sort_keys=True)))
+
+    diff_parser = commands.add_parser("diff")
+    diff_parser.add_argument("group")
+    base = diff_parser.add_mutually_exclusive_group()
+    base.add_argument("--base", default="HEAD",
+                      help="git ref to compare against (default HEAD)")
+    base.add_argument("--base-file",
+                      help="fingerprints saved by the fingerprint command")
+    diff_parser.add_argument("--dry-run", action="store_true")
+    diff_parser.set_defaults(func=diff)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+Generate a docker-compose stand-in for an environment's web tier.
+
+Usage::
+
+    python -m tools.compose dev
+    python -m tools.compose prod --capacity 2 -o build/compose/prod-2
+
+Reads the rendered wordpress, rds and efs stacks with their config and
+writes a compose project mirroring the topology: MySQL with the RDS engine
+version and parameter group values, an NFS server standing in for EFS,
+``WebServerCapacity`` web containers running the same UserData and
+cfn-init metadata, and HAProxy standing in for ``ElbWeb`` with the same
+listeners and health check. Instance classes map to container CPU and
+memory limits so relative sizing carries over.
+"""
+
+import argparse
+import email
+import gzip
+import json
+import os
+import re
+import sys
+
+import yaml
+
+from tools import lint, render
+
+DEFAULT_OUTPUT_DIR = os.path.join(render.ROOT_DIR, "build", "compose")
+
+# vCPUs and memory of the instance classes used in config/
+INSTANCE_RESOURCES = {
+    "t2.micro": (1, "1g"),
+    "t2.small": (1, "2g"),
+    "t2.medium": (2, "4g"),
+    "t2.large": (2, "8g"),
+    "t2.xlarge": (4, "16g"),
+    "db.t2.micro": (1, "1g"),
+    "db.t2.small": (1, "2g"),
+    "db.t2.medium": (2, "4g"),
+    "db.t2.large": (2, "8g"),
+}
+# t3 and t4g (Graviton) sizes have 2 vCPUs up to large
+for _family in ("t3", "t4g", "db.t3", "db.t4g"):
+    INSTANCE_RESOURCES.update({
+        _family + ".micro": (2, "1g"),
+        _family + ".small": (2, "2g"),
+        _family + ".medium": (2, "4g"),
+        _family + ".large": (2, "8g"),
+        _family + ".xlarge": (4, "16g"),
+    })
+
+# Stack outputs that name AWS endpoints, replaced by compose services
+LOCAL_OUTPUTS = {
+    "MySQLAddress": "db",
+    "FileSystemID": "efs",
+}
+
+# Stand-in for the Secrets Manager secret of the DB credentials
+LOCAL_DB_PASSWORD = "wordpress-local"
+SECRET_FETCH = re.compile(
+    r"\$\(aws secretsmanager get-secret-value .*\)$", re.MULTILINE)
+LOCAL_SECRET_FILE = "/opt/local/db-secret.json"
+
+EFS_HOST = re.compile(r'[^\s"]*\.efs\.[\w${}-]+\.amazonaws\.com')
+CONFIG_SETS = re.compile(r"--configsets\s+(\S+)")
+
+USERDATA_REWRITES = [
+    (re.compile(r"^pip3? install .*aws-cfn-bootstrap.*$"),
+     "# cfn-bootstrap is not needed locally"),
+    (re.compile(r"^\S*cfn-init .*$"), "/opt/local/cfn-init.sh"),
+    (re.compile(r"^\S*cfn-signal .*$"), 'echo "cfn-signal: $?"'),
+    (re.compile(r"^\S*enter-service$"), "# no lifecycle hook locally"),
+    (re.compile(r"^\S*configure-search$"), "# no search domain locally"),
+]
+
+
+def flatten(node, values):
+    """
+    Collapse Ref/Join/Base64/Sub/If into a string using ``values``, which
+    holds conditions as ``Condition:<name>``
+    """
+    if isinstance(node, (str, int, float)):
+        return str(node)
+    if isinstance(node, list):
+        return [flatten(item, values) for item in node]
+    (function, argument), = node.items()
+    if function == "Ref":
+        return values.get(argument, "local-" + argument)
+    if function == "Fn::Join":
+        return argument[0].join(flatten(argument[1], values))
+    if function == "Fn::Base64":
+        return flatten(argument, values)
+    if function == "Fn::GetAtt":
+        return values.get(".".join(argument), "local-" + argument[0])
+    if function == "Fn::If":
+        name, true, false = argument
+        condition = values.get("Condition:" + name)
+        if condition is None:
+            raise ValueError("cannot evaluate condition {} locally".format(
+                name))
+        return flatten(true if condition else false, values)
+    if function == "Fn::Sub":
+        return re.sub(r"\$\{([^}]+)\}",
+                      lambda m: values.get(m.group(1), m.group(0)), argument)
+    raise ValueError("cannot flatten {} locally".format(function))
+
+
+def local_values(name, config, template):
+    """ Parameter and pseudo-parameter values for stack ``name`` """
+    values = dict(
+        (key, definition["Default"])
+        for key, definition in template.get("Parameters", {}).items()
+        if "Default" in definition)
+    for key, value in config["parameters"].items():
+        if isinstance(value, render.StackOutput):
+            if value.output in LOCAL_OUTPUTS:
+                value = LOCAL_OUTPUTS[value.output]
+            else:
+                value = render.stack_config(value.stack)["parameters"].get(
+                    value.output, "local-" + value.output)
+        values[key] = str(value)
+    values["AWS::Region"] = config.get("region", "local")
+    values["AWS::StackName"] = "-".join(
+        [config.get("project_code", "local"), name.replace("/", "-")])
+    parameters = dict((key, value) for key, value in values.items()
+                      if "::" not in key)
+    for key, condition in template.get("Conditions", {}).items():
+        values["Condition:" + key] = lint.evaluate(
+            condition, template, parameters)
+    return values
+
+
+def cfn_init_script(metadata, config_sets, values):
+    """ Shell equivalent of running cfn-init for ``config_sets`` """
+    init = metadata["AWS::CloudFormation::Init"]
+    lines = ["#!/bin/bash -x"]
+    for config_set in config_sets:
+        for config_name in flatten(init["configSets"][config_set], values):
+            config = init[config_name]
+            apt = config.get("packages", {}).get("apt", {})
+            if apt:
+                lines.append("apt-get install -y " + " ".join(sorted(apt)))
+            for directory, url in sorted(config.get("sources", {}).items()):
+                lines.append("mkdir -p {0} && curl -sL {1} | tar xz -C {0}"
+                             .format(directory, flatten(url, values)))
+            for path, spec in sorted(config.get("files", {}).items()):
+                content = SECRET_FETCH.sub(
+                    "$(cat {})".format(LOCAL_SECRET_FILE),
+                    flatten(spec["content"], values))
+                lines.append("mkdir -p $(dirname {})".format(path))
+                lines.append("cat > {} <<'CFN_INIT_EOF'".format(path))
+                lines.append(content.rstrip("\n"))
+                lines.append("CFN_INIT_EOF")
+                lines.append("chmod {} {}".format(
+                    spec.get("mode", "000644")[-3:], path))
+                lines.append("chown {}:{} {}".format(
+                    spec.get("owner", "root"), spec.get("group", "root"),
+                    path))
+            for _, command in sorted(config.get("commands", {}).items()):
+                script = flatten(command["command"], values)
+                if "test" in command:
+                    script = "if {}; then {}; fi".format(
+                        flatten(command["test"], values), script)
+                lines.append("(cd {} && {})".format(
+                    command.get("cwd", "/"), script))
+    return "\n".join(lines) + "\n"
+
+
+def shell_script(user_data):
+    """ Single shell script equivalent to a (multipart) UserData """
+    message = email.message_from_string(user_data)
+    if not message.is_multipart():
+        return user_data
+    scripts = []
+    for part in message.get_payload():
+        payload = part.get_payload(decode=True)
+        if part.get_content_type() == "application/x-gzip":
+            payload = gzip.decompress(payload)
+        scripts.append(payload.decode("utf-8"))
+    return "\n".join(scripts)
+
+
+def bootstrap_script(user_data):
+    """ UserData with AWS-only steps swapped for local equivalents """
+    lines = []
+    script = EFS_HOST.sub("efs", shell_script(user_data))
+    for line in script.splitlines():
+        for pattern, replacement in USERDATA_REWRITES:
+            if pattern.match(line.strip()):
+                line = replacement
+                break
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def haproxy_config(load_balancer, web_services):
+    check = load_balancer["HealthCheck"]
+    path = check["Target"].split(":", 1)[1].lstrip("0123456789") or "/"
+    lines = [
+        "global",
+        "    maxconn 4096",
+        "",
+        "defaults",
+        "    mode http",
+        "    timeout connect 5s",
+        "    timeout client {}s".format(check["Timeout"]),
+        "    timeout server 60s",
+        "",
+    ]
+    for listener in load_balancer["Listeners"]:
+        lines.extend([
+            "frontend elb_{}".format(listener["LoadBalancerPort"]),
+            "    bind *:{}".format(listener["LoadBalancerPort"]),
+            "    default_backend web_{}".format(listener["InstancePort"]),
+            "",
+            "backend web_{}".format(listener["InstancePort"]),
+            "    balance roundrobin",
+            "    option httpchk GET {}".format(path),
+            "    default-server inter {}s rise {} fall {}".format(
+                check["Interval"], check["HealthyThreshold"],
+                check["UnhealthyThreshold"]),
+        ])
+        for service in web_services:
+            lines.append("    server {0} {0}:{1} check".format(
+                service, listener["InstancePort"]))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def limits(instance_type):
+    if instance_type not in INSTANCE_RESOURCES:
+        return {}
+    cpus, memory = INSTANCE_RESOURCES[instance_type]
+    return {"cpus": cpus, "mem_limit": memory}
+
+
+def resource(template, resource_type):
+    return next(
+        r for r in template["Resources"].values() if r["Type"] == resource_type)
+
+
+def generate(environment, output_dir, capacity=None):
+    stacks = {}
+    for stack in ["wordpress", "rds", "efs"]:
+        name = "/".join([environment, stack])
+        config = render.stack_config(name)
+        template = render.render_stack(name)
+        stacks[stack] = (config, template,
+                         local_values(name, config, template))
+
+    _, wordpress, web_values = stacks["wordpress"]
+    _, rds, db_values = stacks["rds"]
+    _, _, efs_values = stacks["efs"]
+
+    # The cron worker's launch configuration is left out; cron does not run
+    # in the stand-in
+    launch_config = wordpress["Resources"]["WebServerLaunchConfiguration"]
+    user_data = flatten(launch_config["Properties"]["UserData"], web_values)
+    config_sets = CONFIG_SETS.search(user_data).group(1).split(",")
+    metadata = launch_config["Metadata"]
+    load_balancer = resource(
+        wordpress, "AWS::ElasticLoadBalancing::LoadBalancer")["Properties"]
+
+    capacity = int(capacity or web_values["WebServerCapacity"])
+    web_services = ["web{}".format(i + 1) for i in range(capacity)]
+
+    db_flags = []
+    for _, group in sorted(rds["Resources"].items()):
+        if group["Type"] == "AWS::RDS::DBParameterGroup":
+            for key, value in sorted(
+                    group["Properties"].get("Parameters", {}).items()):
+                db_flags.append("--{}={}".format(
+                    key, flatten(value, db_values)))
+
+    services = {
+        "db": dict({
+            "image": "mysql:{}".format(db_values["DatabaseEngineVersion"]),
+            "command": db_flags,
+            "environment": {
+                "MYSQL_DATABASE": db_values["DBName"],
+                "MYSQL_USER": db_values["DBUser"],
+                "MYSQL_PASSWORD": LOCAL_DB_PASSWORD,
+                "MYSQL_ROOT_PASSWORD": LOCAL_DB_PASSWORD,
+            },
+        }, **limits(db_values["DBInstanceClass"])),
+        "efs": {
+            "image": "itsthenetwork/nfs-server-alpine:12",
+            "privileged": True,
+            "environment": {"SHARED_DIRECTORY": "/exports"},
+            "labels": {
+                "PerformanceMode": efs_values["PerformanceMode"]},
+        },
+        "elb": {
+            "image": "haproxy:1.8",
+            "depends_on": web_services,
+            "volumes": [
+                "./haproxy.cfg:/usr/local/etc/haproxy/haproxy.cfg:ro"],
+            "ports": ["{0}:{0}".format(listener["LoadBalancerPort"])
+                      for listener in load_balancer["Listeners"]],
+        },
+    }
+    architectures = render.load_template_module("architectures.py")
+    for service in web_services:
+        services[service] = dict({
+            "build": "./web",
+            "platform": "linux/" + architectures.architecture(
+                web_values["InstanceType"]),
+            "privileged": True,
+            "depends_on": ["db", "efs"],
+        }, **limits(web_values["InstanceType"]))
+
+    files = {
+        "docker-compose.yml": yaml.safe_dump(
+            {"version": "2.4", "services": services},
+            default_flow_style=False),
+        "haproxy.cfg": haproxy_config(load_balancer, web_services),
+        "web/Dockerfile": "\n".join([
+            "FROM ubuntu:" + render.load_template_module(
+                "constants.py").UBUNTU_RELEASE,
+            "RUN apt-get update && apt-get install -y curl sudo python3",
+            "COPY bootstrap.sh cfn-init.sh db-secret.json /opt/local/",
+            "RUN chmod +x /opt/local/*.sh",
+            'CMD /opt/local/bootstrap.sh && exec tail -F /var/log/apache2/*.log',
+            "",
+        ]),
+        "web/bootstrap.sh": bootstrap_script(user_data),
+        "web/cfn-init.sh": cfn_init_script(metadata, config_sets, web_values),
+        "web/db-secret.json": json.dumps({
+            "username": db_values["DBUser"],
+            "password": LOCAL_DB_PASSWORD,
+        }),
+    }
+    for path, content in files.items():
+        path = os.path.join(output_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(content)
+    return sorted(files)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("environment")
+    parser.add_argument("-o", "--output-dir")
+    parser.add_argument("--capacity", type=int,
+                        help="web containers (default WebServerCapacity)")
+    args = parser.parse_args(argv)
+
+    output_dir = args.output_dir or os.path.join(
+        DEFAULT_OUTPUT_DIR, args.environment)
+    for path in generate(args.environment, output_dir, args.capacity):
+        print(os.path.join(output_dir, path))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+Deploy a stack group, launching independent stacks concurrently.
+
+Usage::
+
+    python -m tools.deploy dev
+    python -m tools.deploy prod --endpoint-url http://localhost:5000
+    python -m tools.deploy dev --simulate 0.5
+
+The dependency graph comes from the ``!cached_stack_output`` parameters of
+``config/<group>`` (``render.dependencies``). Every stack is started as soon
+as the stacks it depends on are complete, so ``efs`` and ``rds`` launch
+together once ``security-groups`` is done and ``role`` goes alongside
+``vpc``. Each stack is created, or updated if it exists. A stack left in
+ROLLBACK_COMPLETE by a failed create cannot be updated, so it is deleted
+and created again. Its events are
+polled with a backoff that starts at ``--min-poll`` seconds and grows to
+``--max-poll`` while nothing happens, and they are printed as they arrive.
+CloudFormation calls go through one client per region, shared by all
+stacks, on one thread pool. Stacks that depend on a failed stack are
+skipped.
+
+When every stack is done, the time each took is printed along with the
+critical path: the chain of stacks, each waiting on its slowest
+dependency, that set the total time.
+
+``--endpoint-url`` points the clients at a local CloudFormation such as
+moto's server. ``--simulate N`` uses an in-process stand-in where each stack
+takes N seconds per resource, to try the scheduling without AWS.
+
+Needs Python 3.7 or later (``asyncio.run``); the Pipfile asks for 3.9.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tools import render
+
+# For asyncio.run and asyncio.get_running_loop
+MIN_PYTHON = (3, 7)
+
+# Largest TemplateBody CloudFormation accepts; bigger ones go through S3
+TEMPLATE_BODY_LIMIT = 51200
+CAPABILITIES = [
+    "CAPABILITY_IAM", "CAPABILITY_NAMED_IAM", "CAPABILITY_AUTO_EXPAND"]
+SUCCEEDED = ["CREATE_COMPLETE", "UPDATE_COMPLETE", "IMPORT_COMPLETE"]
+# Left by a failed create; the stack can only be deleted
+FAILED_CREATE = "ROLLBACK_COMPLETE"
+NO_UPDATES = "No updates are to be performed"
+
+
+class DeployError(Exception):
+    pass
+
+
+def stack_name(config, name):
+    """ CloudFormation name of stack ``name``, as sceptre names it """
+    return "-".join([config["project_code"], name.replace("/", "-")])
+
+
+def finished(status):
+    return status.endswith("_COMPLETE") or status.endswith("_FAILED")
+
+
+class Backoff(object):
+
+    """ Poll interval that grows while nothing changes """
+
+    def __init__(self, minimum, maximum, factor=1.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.delay = minimum
+
+    def next(self, progressed):
+        if progressed:
+            self.delay = self.minimum
+        else:
+            self.delay = min(self.delay * self.factor, self.maximum)
+        return self.delay
+
+
+class Client(object):
+
+    """ CloudFormation (and S3 for large templates) in one region """
+
+    def __init__(self, region, endpoint_url=None):
+        import boto3
+        session = boto3.session.Session(region_name=region)
+        self.cloudformation = session.client(
+            "cloudformation", endpoint_url=endpoint_url)
+        self.s3 = session.client("s3", endpoint_url=endpoint_url)
+
+    def describe(self, name):
+        """ The stack ``name``, or None if it does not exist """
+        from botocore.exceptions import ClientError
+        try:
+            return self.cloudformation.describe_stacks(
+                StackName=name)["Stacks"][0]
+        except ClientError as e:
+            if "does not exist" in e.response["Error"]["Message"]:
+                return None
+            raise
+
+    def events(self, name):
+        """ Events of stack ``name``, newest first """
+        return self.cloudformation.describe_stack_events(
+            StackName=name)["StackEvents"]
+
+    def launch(self, name, body, parameters, bucket=None):
+        """
+        Create or update stack ``name``; False when an update has nothing
+        to change
+        """
+        from botocore.exceptions import ClientError
+        kwargs = {
+            "StackName": name,
+            "Parameters": [{"ParameterKey": key, "ParameterValue": value}
+                           for key, value in sorted(parameters.items())],
+            "Capabilities": CAPABILITIES,
+        }
+        if len(body.encode("utf-8")) > TEMPLATE_BODY_LIMIT and bucket:
+            key = "{}/{}.json".format(name, int(time.time()))
+            self.s3.put_object(Bucket=bucket, Key=key, Body=body)
+            # The global endpoint redirects for buckets outside us-east-1,
+            # which CloudFormation does not follow
+            kwargs["TemplateURL"] = "https://{}.s3.{}.amazonaws.com/{}".format(
+                bucket, self.s3.meta.region_name, key)
+        else:
+            kwargs["TemplateBody"] = body
+        if self.describe(name) is None:
+            self.cloudformation.create_stack(**kwargs)
+            return True
+        try:
+            self.cloudformation.update_stack(**kwargs)
+        except ClientError as e:
+            if NO_UPDATES in e.response["Error"]["Message"]:
+                return False
+            raise
+        return True
+
+    def delete(self, name):
+        """ Delete stack ``name`` and wait until it is gone """
+        stack_id = self.describe(name)["StackId"]
+        self.cloudformation.delete_stack(StackName=stack_id)
+        self.cloudformation.get_waiter("stack_delete_complete").wait(
+            StackName=stack_id, WaiterConfig={"Delay": 5, "MaxAttempts": 360})
+
+
+class SimulatedClient(object):
+
+    """
+    In-process stand-in for ``Client``: a launched stack reports one
+    resource complete every ``seconds_per_resource`` and finishes with the
+    outputs its template declares
+    """
+
+    def __init__(self, seconds_per_resource):
+        self.seconds_per_resource = seconds_per_resource
+        self.stacks = {}
+        self._lock = threading.Lock()
+
+    def _state(self, name):
+        stack = self.stacks[name]
+        elapsed = time.time() - stack["started"]
+        done = min(int(elapsed / self.seconds_per_resource),
+                   len(stack["resources"]))
+        return stack, done
+
+    def describe(self, name):
+        with self._lock:
+            if name not in self.stacks:
+                return None
+            stack, done = self._state(name)
+            complete = done == len(stack["resources"])
+            return {
+                "StackName": name,
+                "StackStatus": "CREATE_COMPLETE" if complete
+                else "CREATE_IN_PROGRESS",
+                "Outputs": [
+                    {"OutputKey": key, "OutputValue": "{}:{}".format(name, key)}
+                    for key in stack["outputs"]] if complete else [],
+            }
+
+    def events(self, name):
+        with self._lock:
+            stack, done = self._state(name)
+            events = [{
+                "EventId": "{}-{}".format(name, i),
+                "Timestamp": datetime.datetime.fromtimestamp(
+                    stack["started"] + (i + 1) * self.seconds_per_resource),
+                "LogicalResourceId": resource,
+                "ResourceStatus": "CREATE_COMPLETE",
+            } for i, resource in enumerate(stack["resources"][:done])]
+            if done == len(stack["resources"]):
+                events.append({
+                    "EventId": name + "-done",
+                    "Timestamp": datetime.datetime.now(),
+                    "LogicalResourceId": name,
+                    "ResourceStatus": "CREATE_COMPLETE",
+                })
+            return list(reversed(events))
+
+    def delete(self, name):
+        with self._lock:
+            del self.stacks[name]
+
+    def launch(self, name, body, parameters, bucket=None):
+        template = json.loads(body)
+        with self._lock:
+            self.stacks[name] = {
+                "started": time.time(),
+                "resources": sorted(template.get("Resources", {})),
+                "outputs": sorted(template.get("Outputs", {})),
+            }
+        return True
+
+
+class Orchestrator(object):
+
+    def __init__(self, group, clients, min_poll=2.0, max_poll=30.0,
+                 out=sys.stdout):
+        self.group = group
+        self.clients = clients
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.out = out
+        self.configs = dict((name, render.stack_config(name))
+                            for name in render.stacks(group))
+        self.outputs = {}
+        self.times = {}
+        self.executor = ThreadPoolExecutor(max(4, len(self.configs)))
+        self.start = None
+
+    def log(self, name, message):
+        print("{:>7.1f}s {:<28} {}".format(
+            time.time() - self.start, name, message), file=self.out)
+
+    async def call(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, function, *args)
+
+    def client(self, name):
+        return self.clients(self.configs[name]["region"]) \
+            if name in self.configs else None
+
+    async def stack_outputs(self, name):
+        """ Outputs of stack ``name``, deployed in this run or before """
+        if name not in self.outputs:
+            config = self.configs.get(name) or render.stack_config(name)
+            stack = await self.call(
+                self.clients(config["region"]).describe,
+                stack_name(config, name))
+            if stack is None:
+                raise DeployError("{} does not exist".format(name))
+            self.outputs[name] = dict(
+                (output["OutputKey"], output["OutputValue"])
+                for output in stack.get("Outputs", []))
+        return self.outputs[name]
+
+    async def parameters(self, name):
+        values = {}
+        for key, value in self.configs[name]["parameters"].items():
+            if isinstance(value, render.StackOutput):
+                outputs = await self.stack_outputs(value.stack)
+                if value.output not in outputs:
+                    raise DeployError("{} has no output {}".format(
+                        value.stack, value.output))
+                value = outputs[value.output]
+            elif isinstance(value, render.Resolver):
+                raise DeployError("{}: {} is not supported".format(
+                    key, value.tag))
+            elif isinstance(value, list):
+                value = ",".join(str(item) for item in value)
+            values[key] = str(value)
+        return values
+
+    async def wait(self, name, cfn_name, seen):
+        """
+        Stream the events of ``cfn_name`` not in ``seen`` until it settles
+        """
+        client = self.client(name)
+        backoff = Backoff(self.min_poll, self.max_poll)
+        progressed = True
+        while True:
+            await asyncio.sleep(backoff.next(progressed))
+            events = [event for event in await self.call(
+                client.events, cfn_name) if event["EventId"] not in seen]
+            for event in reversed(events):
+                seen.add(event["EventId"])
+                self.log(name, "{} {} {}".format(
+                    event["LogicalResourceId"], event["ResourceStatus"],
+                    event.get("ResourceStatusReason", "")).rstrip())
+            progressed = bool(events)
+            stack = await self.call(client.describe, cfn_name)
+            if finished(stack["StackStatus"]):
+                return stack
+
+    async def deploy_stack(self, name, tasks):
+        dependencies = [d for d in render.dependencies(self.configs[name])
+                        if d in tasks]
+        results = await asyncio.gather(
+            *[tasks[d] for d in dependencies], return_exceptions=True)
+        failed = [d for d, result in zip(dependencies, results)
+                  if isinstance(result, BaseException)]
+        if failed:
+            self.log(name, "skipped, {} failed".format(", ".join(failed)))
+            raise DeployError("{} skipped".format(name))
+
+        config = self.configs[name]
+        cfn_name = stack_name(config, name)
+        started = time.time()
+        parameters = await self.parameters(name)
+        body = render.render(config["template_path"],
+                             config.get("sceptre_user_data"))
+        client = self.client(name)
+        self.log(name, "launching " + cfn_name)
+        seen = set()
+        existing = await self.call(client.describe, cfn_name)
+        if existing and existing["StackStatus"] == FAILED_CREATE:
+            self.log(name, "deleting, left in " + FAILED_CREATE)
+            await self.call(client.delete, cfn_name)
+        elif existing:
+            seen.update(event["EventId"] for event in await self.call(
+                client.events, cfn_name))
+        changed = await self.call(client.launch, cfn_name, body, parameters,
+                                  config.get("template_bucket_name"))
+        if changed:
+            stack = await self.wait(name, cfn_name, seen)
+        else:
+            stack = await self.call(client.describe, cfn_name)
+            self.log(name, "no changes")
+        self.times[name] = (started, time.time(), dependencies)
+        self.log(name, stack["StackStatus"])
+        if stack["StackStatus"] not in SUCCEEDED:
+            raise DeployError("{} is {}".format(name, stack["StackStatus"]))
+        self.outputs[name] = dict(
+            (output["OutputKey"], output["OutputValue"])
+            for output in stack.get("Outputs", []))
+
+    async def run(self):
+        self.start = time.time()
+        tasks = {}
+        for name in sorted(self.configs):
+            tasks[name] = asyncio.ensure_future(
+                self.deploy_stack(name, tasks))
+        results = await asyncio.gather(*tasks.values(),
+                                       return_exceptions=True)
+        self.executor.shutdown()
+        return dict((name, result) for name, result in
+                    zip(tasks, results) if isinstance(result, BaseException))
+
+    def critical_path(self):
+        """ Stacks that set the total time, first to last """
+        if not self.times:
+            return []
+        path = [max(self.times, key=lambda name: self.times[name][1])]
+        while True:
+            dependencies = [d for d in self.times[path[-1]][2]
+                            if d in self.times]
+            if not dependencies:
+                return list(reversed(path))
+            path.append(max(dependencies, key=lambda d: self.times[d][1]))
+
+    def report(self):
+        print("\n{:<28} {:>9} {:>9}".format("stack", "start", "seconds"),
+              file=self.out)
+        for name, (started, ended, _) in sorted(
+                self.times.items(), key=lambda item: item[1][0]):
+            print("{:<28} {:>8.1f}s {:>8.1f}s".format(
+                name, started - self.start, ended - started), file=self.out)
+        path = self.critical_path()
+        if path:
+            print("\ncritical path: {} ({:.1f}s of {:.1f}s)".format(
+                " -> ".join(path),
+                sum(self.times[n][1] - self.times[n][0] for n in path),
+                max(t[1] for t in self.times.values()) - self.start),
+                file=self.out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("group")
+    parser.add_argument("--endpoint-url",
+                        help="CloudFormation/S3 endpoint, e.g. a moto server")
+    parser.add_argument("--simulate", type=float, metavar="SECONDS",
+                        help="use an in-process stand-in taking SECONDS per "
+                             "resource")
+    parser.add_argument("--min-poll", type=float, default=2.0)
+    parser.add_argument("--max-poll", type=float, default=30.0)
+    args = parser.parse_args(argv)
+
+    if args.simulate is not None:
+        simulated = SimulatedClient(args.simulate)
+        clients = lambda region: simulated  # noqa: E731
+        min_poll = min(args.min_poll, args.simulate)
+    else:
+        pool = {}
+
+        def clients(region):
+            if region not in pool:
+                pool[region] = Client(region, args.endpoint_url)
+            return pool[region]
+        min_poll = args.min_poll
+
+    orchestrator = Orchestrator(args.group, clients, min_poll, args.max_poll)
+    failures = asyncio.run(orchestrator.run())
+    orchestrator.report()
+    for name, error in sorted(failures.items()):
+        print("{}: {}".format(name, error), file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Run the media stack's image transform on a directory of sample images.
+
+Usage::
+
+    python -m tools.images benchmark samples/
+    python -m tools.images benchmark samples/ -j 1 2 4 --max-width 1600
+    python -m tools.images convert samples/ -o build/images
+
+``images/transform.py`` is the code of the media stack's function, imported
+as is; it needs Pillow (a dev package in the Pipfile, with AVIF support for
+the AVIF variants). ``benchmark`` transforms every image under the directory
+once per ``--jobs`` value, with that many worker processes, and prints the
+images per second and the bytes of each variant format against the
+originals. ``convert`` writes the variants as ``<image>.<format>`` under
+``--output-dir``, the way the function writes them to the bucket, to look at
+them.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from tools import render
+
+sys.path.insert(0, os.path.join(render.ROOT_DIR, "images"))
+import transform  # noqa: E402
+
+
+def images(directory):
+    """ Image files under ``directory`` the function would be called on """
+    extensions = render.load_template_module("constants.py").IMAGE_EXTENSIONS
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(directory) for name in names
+        if transform.is_image(name, extensions))
+
+
+def transform_file(args):
+    """ ``(path, original bytes, {format: bytes}, seconds)`` of one image """
+    path, max_width, quality, output_dir, directory = args
+    with open(path, "rb") as f:
+        data = f.read()
+    start = time.perf_counter()
+    variants = transform.transform(data, max_width, quality)
+    seconds = time.perf_counter() - start
+    if output_dir:
+        target = os.path.join(output_dir, os.path.relpath(path, directory))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        for extension, body in variants.items():
+            with open("{}.{}".format(target, extension), "wb") as f:
+                f.write(body)
+    return path, len(data), dict(
+        (extension, len(body)) for extension, body in variants.items()), \
+        seconds
+
+
+def run(paths, jobs, max_width, quality, output_dir=None, directory=None):
+    work = [(path, max_width, quality, output_dir, directory)
+            for path in paths]
+    if jobs == 1:
+        return list(map(transform_file, work))
+    with ProcessPoolExecutor(jobs) as executor:
+        return list(executor.map(transform_file, work))
+
+
+def quality_of(args):
+    return {"webp": args.webp_quality, "avif": args.avif_quality}
+
+
+def benchmark(args):
+    paths = images(args.directory)
+    if not paths:
+        print("no images under {}".format(args.directory), file=sys.stderr)
+        return 1
+    formats = transform.formats()
+    print("{} images, {:.1f} MB; variants: {}".format(
+        len(paths), sum(os.path.getsize(p) for p in paths) / 1e6,
+        ", ".join(formats)))
+    print("{:>5} {:>9} {:>10}".format("jobs", "seconds", "images/s"))
+    for jobs in args.jobs:
+        start = time.perf_counter()
+        results = run(paths, jobs, args.max_width, quality_of(args))
+        seconds = time.perf_counter() - start
+        print("{:>5} {:>9.2f} {:>10.1f}".format(
+            jobs, seconds, len(paths) / seconds))
+
+    # Variants missing for an image (larger than the original) count at the
+    # original's size, since that is what gets served
+    original = sum(size for _, size, _, _ in results)
+    print("{:<8} {:>8} {:>10} {:>8}".format(
+        "format", "images", "MB", "of orig"))
+    print("{:<8} {:>8} {:>10.1f} {:>7.0f}%".format(
+        "original", len(results), original / 1e6, 100))
+    for extension in formats:
+        served = sum(variants.get(extension, size)
+                     for _, size, variants, _ in results)
+        written = sum(1 for _, _, variants, _ in results
+                      if extension in variants)
+        print("{:<8} {:>8} {:>10.1f} {:>7.0f}%".format(
+            extension, written, served / 1e6, 100.0 * served / original))
+    slowest = max(results, key=lambda result: result[3])
+    print("slowest: {} ({:.2f}s)".format(slowest[0], slowest[3]))
+    return 0
+
+
+def convert(args):
+    paths = images(args.directory)
+    for path, size, variants, _ in run(
+            paths, args.jobs, args.max_width, quality_of(args),
+            args.output_dir, args.directory):
+        print("{} {} {}".format(path, size, " ".join(
+            "{}={}".format(extension, variant_size)
+            for extension, variant_size in sorted(variants.items()))))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    def add_transform_arguments(command_parser):
+        command_parser.add_argument("directory")
+        command_parser.add_argument("--max-width", type=int,
+                                    default=transform.MAX_WIDTH)
+        command_parser.add_argument("--webp-quality", type=int,
+                                    default=transform.QUALITY["webp"])
+        command_parser.add_argument("--avif-quality", type=int,
+                                    default=transform.QUALITY["avif"])
+
+    benchmark_parser = commands.add_parser("benchmark")
+    add_transform_arguments(benchmark_parser)
+    benchmark_parser.add_argument("-j", "--jobs", type=int, nargs="+",
+                                  default=sorted(set([1, os.cpu_count() or 1])),
+                                  help="worker process counts to compare")
+    benchmark_parser.set_defaults(func=benchmark)
+
+    convert_parser = commands.add_parser("convert")
+    add_transform_arguments(convert_parser)
+    convert_parser.add_argument("-o", "--output-dir", default="build/images")
+    convert_parser.add_argument("-j", "--jobs", type=int,
+                                default=os.cpu_count() or 1)
+    convert_parser.set_defaults(func=convert)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Measure the import time of every template module against a budget.
+
+Usage::
+
+    python -m tools.importtime
+    python -m tools.importtime --budget-ms 100 --repeat 10
+
+Each template is imported in a fresh interpreter under ``python -X
+importtime``; the best cumulative time over ``--repeat`` runs is reported
+together with the troposphere resource modules the import pulled in (these
+should be deferred with ``lazy.lazy_module``). Exits non-zero if any
+template is over budget or imports a resource module eagerly.
+"""
+
+import argparse
+import glob
+import os
+import subprocess
+import sys
+
+from tools import render
+
+DEFAULT_BUDGET_MS = 100
+
+
+def template_modules():
+    for path in sorted(glob.glob(os.path.join(render.TEMPLATES_DIR, "*.py"))):
+        with open(path) as f:
+            if "def sceptre_handler" in f.read():
+                yield os.path.splitext(os.path.basename(path))[0]
+
+
+def import_profile(module):
+    """
+    Cumulative import time (us) of ``module`` and the troposphere modules
+    imported along with it
+    """
+    code = "import sys; sys.path.insert(0, {!r}); import {}".format(
+        render.TEMPLATES_DIR, module)
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stderr=subprocess.PIPE, check=True, universal_newlines=True).stderr
+    cumulative = None
+    troposphere = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, total, name = line.split("|")
+        name = name.strip()
+        if name == module:
+            cumulative = int(total)
+        elif name.startswith("troposphere."):
+            troposphere.add(name)
+    return cumulative, troposphere
+
+
+def core_modules():
+    """ What ``import troposphere`` loads by itself, so cannot be deferred """
+    return import_profile("troposphere")[1]
+
+
+def measure(module, core, repeat):
+    """ Best import time (ms) of ``module`` and its eager resource modules """
+    runs = [import_profile(module) for _ in range(repeat)]
+    best = min(total for total, _ in runs) / 1000.0
+    return best, sorted(runs[0][1] - core)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    core = core_modules()
+    failed = False
+    for module in template_modules():
+        best, eager = measure(module, core, args.repeat)
+        over = best > args.budget_ms
+        failed = failed or over or bool(eager)
+        print("{:<20} {:>8.1f} ms{}{}".format(
+            module, best, "  OVER BUDGET" if over else "",
+            "  eager: " + ", ".join(eager) if eager else ""))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Static checks against the rendered CloudFormation of every stack.
+
+Usage::
+
+    python -m tools.lint                 # every environment
+    python -m tools.lint dev prod/rds    # environments or single stacks
+    python -m tools.lint -j 4 --format json
+
+Each stack is rendered once per distinct template, then the stack rules run
+against the JSON with the stack's config parameters. Environment rules look
+at all stacks of an environment together. Exits non-zero on any error.
+"""
+
+import argparse
+import collections
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from tools import render
+
+ERROR = "error"
+WARNING = "warning"
+
+Finding = collections.namedtuple(
+    "Finding", ["level", "stack", "rule", "message"])
+
+SCALE_UP_OPERATORS = ["GreaterThanThreshold", "GreaterThanOrEqualToThreshold"]
+SCALE_DOWN_OPERATORS = ["LessThanThreshold", "LessThanOrEqualToThreshold"]
+CACHE_RESOURCE_PREFIXES = [
+    "AWS::ElastiCache::", "AWS::CloudFront::Distribution"]
+DYNAMIC_HEALTH_CHECK = re.compile(r"^HTTPS?:\d+(/|/.*\.php)$")
+SUB_VARIABLE = re.compile(r"\$\{([^}!.]+)")
+
+
+def references(node):
+    """ Yield every logical name referenced by Ref, GetAtt or Fn::Sub """
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "Ref":
+                yield value
+            elif key == "Fn::GetAtt":
+                yield value[0]
+            elif key == "Fn::Sub":
+                text = value[0] if isinstance(value, list) else value
+                for name in SUB_VARIABLE.findall(text):
+                    yield name
+            for name in references(value):
+                yield name
+    elif isinstance(node, list):
+        for item in node:
+            for name in references(item):
+                yield name
+
+
+def resolve(value, template, parameters):
+    """
+    Literal value of ``value``, following a parameter Ref, an Fn::FindInMap
+    or an Fn::If on a condition that can be evaluated, if possible
+    """
+    if isinstance(value, dict) and list(value) == ["Ref"]:
+        name = value["Ref"]
+        if name in parameters and isinstance(parameters[name], str):
+            return parameters[name]
+        return template.get("Parameters", {}).get(name, {}).get("Default")
+    if isinstance(value, dict) and list(value) == ["Fn::If"]:
+        name, true, false = value["Fn::If"]
+        condition = evaluate(
+            template.get("Conditions", {}).get(name), template, parameters)
+        if condition is None:
+            return None
+        return resolve(true if condition else false, template, parameters)
+    if isinstance(value, dict) and list(value) == ["Fn::FindInMap"]:
+        name, top, second = (resolve(key, template, parameters)
+                             for key in value["Fn::FindInMap"])
+        entry = template.get("Mappings", {}).get(name, {}).get(top, {})
+        return None if second not in entry else str(entry[second])
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    return None
+
+
+def evaluate(condition, template, parameters):
+    """ Truth of an Equals/Not/And/Or condition, or None if unknown """
+    if isinstance(condition, dict) and list(condition) == ["Fn::Equals"]:
+        left, right = (resolve(side, template, parameters)
+                       for side in condition["Fn::Equals"])
+        return None if left is None or right is None else left == right
+    if isinstance(condition, dict) and list(condition) == ["Fn::Not"]:
+        inner = evaluate(condition["Fn::Not"][0], template, parameters)
+        return None if inner is None else not inner
+    if isinstance(condition, dict) and list(condition) in (
+            ["Fn::And"], ["Fn::Or"]):
+        function = list(condition)[0]
+        values = [evaluate(inner, template, parameters)
+                  for inner in condition[function]]
+        decided = False if function == "Fn::And" else True
+        if decided in values:
+            return decided
+        return None if None in values else not decided
+    if isinstance(condition, dict) and list(condition) == ["Condition"]:
+        return evaluate(template.get("Conditions", {}).get(
+            condition["Condition"]), template, parameters)
+    return None
+
+
+def resources_of_type(template, resource_type):
+    for name, resource in template.get("Resources", {}).items():
+        if resource["Type"] == resource_type:
+            yield name, resource.get("Properties", {})
+
+
+def undeclared_parameters(template, parameters):
+    declared = template.get("Parameters", {})
+    for name in sorted(set(parameters) - set(declared)):
+        yield ERROR, "config passes '{}' which the template does not " \
+            "declare".format(name)
+
+
+def missing_parameters(template, parameters):
+    for name, definition in sorted(template.get("Parameters", {}).items()):
+        if "Default" not in definition and name not in parameters:
+            yield ERROR, "parameter '{}' has no default and is not set in " \
+                "config".format(name)
+
+
+def unused_parameters(template, parameters):
+    body = dict((key, value) for key, value in template.items()
+                if key != "Parameters")
+    used = set(references(body))
+    for name in sorted(set(template.get("Parameters", {})) - used):
+        yield WARNING, "parameter '{}' is declared but never used".format(
+            name)
+
+
+def allowed_values(template, parameters):
+    for name, definition in sorted(template.get("Parameters", {}).items()):
+        allowed = definition.get("AllowedValues")
+        value = parameters.get(name)
+        if allowed and isinstance(value, str) and value not in allowed:
+            yield ERROR, "'{}' is {!r}, which is not one of its " \
+                "AllowedValues".format(name, value)
+
+
+def alarm_thresholds(template, parameters):
+    groups = collections.defaultdict(lambda: ([], []))
+    for name, alarm in resources_of_type(template, "AWS::CloudWatch::Alarm"):
+        key = json.dumps([alarm.get("Namespace"), alarm.get("MetricName"),
+                          alarm.get("Dimensions")], sort_keys=True)
+        threshold = resolve(alarm.get("Threshold"), template, parameters)
+        if threshold is None:
+            continue
+        operator = alarm.get("ComparisonOperator")
+        if operator in SCALE_UP_OPERATORS:
+            groups[key][0].append((name, float(threshold)))
+        elif operator in SCALE_DOWN_OPERATORS:
+            groups[key][1].append((name, float(threshold)))
+    for highs, lows in groups.values():
+        for high_name, high in highs:
+            for low_name, low in lows:
+                if low >= high:
+                    yield ERROR, "'{}' fires below {:g} while '{}' fires " \
+                        "above {:g}; both can be in alarm at once".format(
+                            low_name, low, high_name, high)
+
+
+def autoscaling_ranges(template, parameters):
+    policies = collections.Counter(
+        properties.get("AutoScalingGroupName", {}).get("Ref")
+        for _, properties in resources_of_type(
+            template, "AWS::AutoScaling::ScalingPolicy"))
+    for name, asg in resources_of_type(
+            template, "AWS::AutoScaling::AutoScalingGroup"):
+        if not policies[name]:
+            continue
+        low = resolve(asg.get("MinSize"), template, parameters)
+        high = resolve(asg.get("MaxSize"), template, parameters)
+        if asg.get("MinSize") == asg.get("MaxSize") or (
+                low is not None and low == high):
+            yield ERROR, "'{}' has MinSize == MaxSize so its {} scaling " \
+                "policies can never change capacity".format(
+                    name, policies[name])
+
+
+def wait_condition_counts(template, parameters):
+    groups = dict(resources_of_type(
+        template, "AWS::AutoScaling::AutoScalingGroup"))
+    for name, resource in template.get("Resources", {}).items():
+        if resource["Type"] != "AWS::CloudFormation::WaitCondition":
+            continue
+        if "Condition" in resource and evaluate(
+                {"Condition": resource["Condition"]},
+                template, parameters) is False:
+            continue
+        if "Count" in resource.get("Properties", {}):
+            continue
+        depends_on = resource.get("DependsOn", [])
+        if not isinstance(depends_on, list):
+            depends_on = [depends_on]
+        for group in depends_on:
+            if group not in groups:
+                continue
+            capacity = resolve(
+                groups[group].get("DesiredCapacity"), template, parameters)
+            if capacity != "1":
+                yield WARNING, "'{}' waits for a single signal but '{}' " \
+                    "launches {} instances".format(
+                        name, group, capacity or "several")
+
+
+def health_check_targets(template, parameters):
+    for name, lb in resources_of_type(
+            template, "AWS::ElasticLoadBalancing::LoadBalancer"):
+        target = lb.get("HealthCheck", {}).get("Target", "")
+        if DYNAMIC_HEALTH_CHECK.match(target):
+            yield WARNING, "'{}' health check '{}' renders a dynamic page " \
+                "on every probe; point it at a static file".format(
+                    name, target)
+
+
+def caching_tier(stacks):
+    types = set(resource["Type"] for template in stacks.values()
+                for resource in template.get("Resources", {}).values())
+    serves_web = "AWS::ElasticLoadBalancing::LoadBalancer" in types
+    cached = any(resource_type.startswith(prefix)
+                 for resource_type in types
+                 for prefix in CACHE_RESOURCE_PREFIXES)
+    if serves_web and not cached:
+        yield WARNING, "no ElastiCache or CloudFront resource in front of " \
+            "the web tier"
+
+
+STACK_RULES = [
+    undeclared_parameters,
+    missing_parameters,
+    unused_parameters,
+    allowed_values,
+    alarm_thresholds,
+    autoscaling_ranges,
+    wait_condition_counts,
+    health_check_targets,
+]
+
+ENVIRONMENT_RULES = [
+    caching_tier,
+]
+
+
+def lint_stacks(names):
+    """
+    Render and check a group of stacks sharing one template.
+
+    Returns the findings and the rendered templates keyed on stack name.
+    """
+    findings = []
+    templates = {}
+    for name in names:
+        try:
+            template = render.render_stack(name)
+        except Exception as e:
+            findings.append(Finding(ERROR, name, "render", repr(e)))
+            continue
+        templates[name] = template
+        parameters = render.stack_config(name)["parameters"]
+        for rule in STACK_RULES:
+            for level, message in rule(template, parameters):
+                findings.append(Finding(level, name, rule.__name__, message))
+    return findings, templates
+
+
+def group_by_template(names):
+    groups = collections.OrderedDict()
+    for name in names:
+        config = render.stack_config(name)
+        key = (config["template_path"],
+               json.dumps(config.get("sceptre_user_data"), sort_keys=True))
+        groups.setdefault(key, []).append(name)
+    return list(groups.values())
+
+
+def lint(names, jobs=1):
+    groups = group_by_template(names)
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(lint_stacks, groups))
+    else:
+        results = [lint_stacks(group) for group in groups]
+
+    findings = []
+    environments = collections.defaultdict(dict)
+    for group_findings, templates in results:
+        findings.extend(group_findings)
+        for name, template in templates.items():
+            environments[render.group_of(name)][name] = template
+    for environment, stacks in sorted(environments.items()):
+        for rule in ENVIRONMENT_RULES:
+            for level, message in rule(stacks):
+                findings.append(
+                    Finding(level, environment, rule.__name__, message))
+    return sorted(findings, key=lambda f: (f.stack, f.rule, f.message))
+
+
+def expand(targets):
+    """ Expand stack groups into their stacks """
+    names = []
+    for target in targets or render.environments():
+        if os.path.isdir(os.path.join(render.CONFIG_DIR, target)):
+            names.extend(render.stacks(target))
+        else:
+            names.append(render.stack_name(target))
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("targets", nargs="*",
+                        help="environments or env/stack names")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="render templates in this many processes")
+    parser.add_argument("--format", choices=["text", "json"],
+                        default="text")
+    args = parser.parse_args(argv)
+
+    findings = lint(expand(args.targets), args.jobs)
+    if args.format == "json":
+        print(json.dumps([f._asdict() for f in findings], indent=2))
+    else:
+        for f in findings:
+            print("{0.stack}: {0.level}: [{0.rule}] {0.message}".format(f))
+    return 1 if any(f.level == ERROR for f in findings) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
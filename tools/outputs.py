@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Count the DescribeStacks calls it takes to resolve a group's stack outputs.
+
+Usage::
+
+    python -m tools.outputs benchmark dev
+    python -m tools.outputs benchmark prod --latency 0.2
+    python -m tools.outputs benchmark dev --fixture outputs.json
+
+Stacks are resolved the way ``sceptre launch`` resolves them: in dependency
+order, with the stacks whose dependencies are done resolved in parallel
+threads. DescribeStacks is replaced by a stand-in that answers from a
+fixture of ``{stack: {output: value}}`` after ``--latency`` seconds and counts
+its calls. Without ``--fixture`` the outputs declared by each rendered
+template are used. Three strategies are compared:
+
+- ``stack_output``: sceptre's resolver, one call per parameter
+- ``cached``: ``!cached_stack_output``, one call per referenced stack
+- ``cached, warm disk``: a second run with SCEPTRE_STACK_OUTPUT_TTL set,
+  answered from the on-disk cache
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tools import render
+
+sys.path.insert(0, os.path.join(render.ROOT_DIR, "resolvers"))
+from stack_output_cache.cache import OutputCache  # noqa: E402
+
+
+def template_outputs(group):
+    """ Fixture of ``{stack: {output: placeholder}}`` from the templates """
+    return dict((name, dict(
+        (output, "{}:{}".format(name, output))
+        for output in render.render_stack(name).get("Outputs", {})))
+        for name in render.stacks(group))
+
+
+def levels(group):
+    """ Stacks of ``group`` with their configs, in waves of a launch """
+    configs = dict((name, render.stack_config(name))
+                   for name in render.stacks(group))
+    done, waves = set(), []
+    while len(done) < len(configs):
+        wave = sorted(
+            name for name, config in configs.items() if name not in done
+            and set(render.dependencies(config)) & set(configs) <= done)
+        if not wave:
+            raise ValueError("dependency cycle among {}".format(
+                ", ".join(sorted(set(configs) - done))))
+        waves.append([(name, configs[name]) for name in wave])
+        done.update(wave)
+    return waves
+
+
+class DescribeStacks(object):
+
+    """ Counting stand-in for CloudFormation DescribeStacks """
+
+    def __init__(self, fixture, latency):
+        self.fixture = fixture
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, stack_name):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return dict(self.fixture[stack_name])
+
+
+def resolve_group(waves, lookup):
+    """ Resolve every stack output parameter, wave by wave """
+    def resolve_stack(config):
+        return dict(
+            (key, lookup(value.stack)[value.output])
+            for key, value in config["parameters"].items()
+            if isinstance(value, render.StackOutput))
+
+    with ThreadPoolExecutor(max(len(wave) for wave in waves)) as executor:
+        for wave in waves:
+            list(executor.map(resolve_stack, [c for _, c in wave]))
+
+
+def benchmark(args):
+    if args.fixture:
+        with open(args.fixture) as f:
+            fixture = json.load(f)
+    else:
+        fixture = template_outputs(args.group)
+    waves = levels(args.group)
+    references = sum(
+        1 for wave in waves for _, config in wave
+        for value in config["parameters"].values()
+        if isinstance(value, render.StackOutput))
+
+    directory = tempfile.mkdtemp()
+    cache_file = os.path.join(directory, "stack-outputs.json")
+    try:
+        rows = []
+        describe = DescribeStacks(fixture, args.latency)
+        start = time.perf_counter()
+        resolve_group(waves, describe)
+        rows.append(("stack_output", describe.calls,
+                     time.perf_counter() - start))
+        for label in ["cached", "cached, warm disk"]:
+            describe = DescribeStacks(fixture, args.latency)
+            cache = OutputCache(cache_file, ttl=300)
+            start = time.perf_counter()
+            resolve_group(waves, lambda stack: cache.get(
+                stack, lambda: describe(stack)))
+            rows.append((label, describe.calls, time.perf_counter() - start))
+    finally:
+        shutil.rmtree(directory)
+
+    print("{} stack output parameters in {} stacks".format(
+        references, sum(len(wave) for wave in waves)))
+    print("{:<20} {:>8} {:>10}".format("resolver", "calls", "seconds"))
+    for label, calls, seconds in rows:
+        print("{:<20} {:>8} {:>10.2f}".format(label, calls, seconds))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    benchmark_parser = commands.add_parser("benchmark")
+    benchmark_parser.add_argument("group")
+    benchmark_parser.add_argument("--fixture",
+                                  help="JSON file of {stack: {output: value}}")
+    benchmark_parser.add_argument("--latency", type=float, default=0.1,
+                                  help="seconds per DescribeStacks call")
+    benchmark_parser.set_defaults(func=benchmark)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Render every region of a multi-region environment.
+
+Usage::
+
+    python -m tools.regions prod
+    python -m tools.regions prod -o build/templates
+    python -m tools.regions prod --promote us-west-2
+
+The environment's ``regions`` list names the primary region first. Each
+region is served by the stack group (the environment itself or a nested
+group such as ``prod/us-west-2``) whose ``region`` matches. Regions are
+rendered in parallel, one process each, into ``<output>/<stack>.json``.
+
+A secondary region is a standby: its database is a read replica, its file
+system a read-only EFS replica and it runs no web servers. ``--promote``
+makes it writable after the primary is lost: it promotes the replica, makes
+the region's replicas of the credentials secrets standalone and stops the
+file system replication. Its web servers then come up by setting
+``Standby: "false"`` on its wordpress stack and launching it.
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from tools import render
+
+DEFAULT_OUTPUT_DIR = os.path.join(render.ROOT_DIR, "build", "templates")
+
+
+def region_groups(environment):
+    """ Map each configured region to the stack group deploying it """
+    config = render.stack_group_config(environment)
+    regions = config.get("regions") or [config["region"]]
+    groups = {}
+    for group in render.stack_groups(environment):
+        region = render.stack_group_config(group)["region"]
+        if region in regions and region not in groups:
+            groups[region] = group
+    missing = [region for region in regions if region not in groups]
+    if missing:
+        raise ValueError("no stack group under {} for {}".format(
+            environment, ", ".join(missing)))
+    return [(region, groups[region]) for region in regions]
+
+
+def render_region(args):
+    region, group, output_dir = args
+    written = []
+    for name in render.stacks(group):
+        if render.group_of(name) != group:
+            continue
+        config = render.stack_config(name)
+        path = os.path.join(output_dir, name + ".json")
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(render.render(
+                config["template_path"], config.get("sceptre_user_data")))
+        written.append(path)
+    return region, written
+
+
+def promote(environment, region):
+    from tools import deploy
+    import boto3
+
+    groups = dict(region_groups(environment))
+    if region not in groups or region == region_groups(environment)[0][0]:
+        raise ValueError("{} is not a secondary region of {}".format(
+            region, environment))
+    group = groups[region]
+    config = render.stack_group_config(group)
+    session = boto3.session.Session(region_name=region)
+    cloudformation = session.client("cloudformation")
+
+    def physical_id(stack, resource):
+        return cloudformation.describe_stack_resource(
+            StackName=deploy.stack_name(config, group + "/" + stack),
+            LogicalResourceId=resource,
+        )["StackResourceDetail"]["PhysicalResourceId"]
+
+    database = physical_id("rds", "MySQLReplica")
+    session.client("rds").promote_read_replica(DBInstanceIdentifier=database)
+    print("{}: promoting {}".format(region, database))
+
+    # The replicas of the credentials secrets become standalone secrets
+    secretsmanager = session.client("secretsmanager")
+    outputs = dict(
+        (output["OutputKey"], output["OutputValue"])
+        for output in cloudformation.describe_stacks(
+            StackName=deploy.stack_name(config, group + "/rds"),
+        )["Stacks"][0].get("Outputs", []))
+    for key in ("DBSecretArn", "DBMasterSecretArn"):
+        secretsmanager.stop_replication_to_replica(SecretId=outputs[key])
+        print("{}: stopped replication to {}".format(region, outputs[key]))
+
+    efs = session.client("efs")
+    file_system = physical_id("efs", "FileSystem")
+    for replication in efs.describe_replication_configurations(
+            FileSystemId=file_system)["Replications"]:
+        efs.delete_replication_configuration(
+            SourceFileSystemId=replication["SourceFileSystemId"])
+        print("{}: stopped replication {} -> {}".format(
+            region, replication["SourceFileSystemId"], file_system))
+    print("set Standby: \"false\" in config/{}/wordpress.yaml and launch "
+          "{}/wordpress".format(group, group))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("environment")
+    parser.add_argument("-o", "--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--promote", metavar="REGION",
+                        help="make this standby region writable")
+    args = parser.parse_args(argv)
+
+    if args.promote:
+        return promote(args.environment, args.promote)
+
+    work = [(region, group, args.output_dir)
+            for region, group in region_groups(args.environment)]
+    with ProcessPoolExecutor(len(work)) as executor:
+        for region, written in executor.map(render_region, work):
+            for path in written:
+                print("{}: {}".format(region, path))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
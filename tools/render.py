@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Offline helpers shared by the tools in this directory.
+
+Reads the ``config/`` tree the way sceptre does (stack group config merged
+into each stack config, rendered with jinja) and renders the troposphere
+templates in ``templates/`` without talking to AWS. Resolver tags such as
+``!stack_output`` (or ``!cached_stack_output``) are kept as placeholders
+instead of being resolved.
+"""
+
+import collections
+import contextlib
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import yaml
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+
+# SCEPTRE_PROJECT_DIR points the tools at another checkout of this project
+ROOT_DIR = os.environ.get("SCEPTRE_PROJECT_DIR") or os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))
+CONFIG_DIR = os.path.join(ROOT_DIR, "config")
+TEMPLATES_DIR = os.path.join(ROOT_DIR, "templates")
+CONFIG_FILE = "config.yaml"
+
+StackOutput = collections.namedtuple("StackOutput", ["stack", "output"])
+Resolver = collections.namedtuple("Resolver", ["tag", "argument"])
+
+
+class ConfigLoader(yaml.SafeLoader):
+    """ YAML loader that understands sceptre resolver tags """
+
+
+def _stack_output(loader, node):
+    stack, output = loader.construct_scalar(node).split("::")
+    return StackOutput(stack_name(stack.strip()), output.strip())
+
+
+def _resolver(loader, suffix, node):
+    return Resolver("!" + suffix, loader.construct_scalar(node))
+
+
+ConfigLoader.add_constructor("!stack_output", _stack_output)
+ConfigLoader.add_constructor("!cached_stack_output", _stack_output)
+ConfigLoader.add_multi_constructor("!", _resolver)
+
+
+def stack_name(path):
+    """ Normalise ``dev/vpc.yaml`` and ``dev/vpc`` to ``dev/vpc`` """
+    if path.endswith(".yaml"):
+        path = path[:-len(".yaml")]
+    return path
+
+
+def environments():
+    """ Names of the top-level environments (stack groups) under config/ """
+    return sorted(
+        name for name in os.listdir(CONFIG_DIR)
+        if os.path.isdir(os.path.join(CONFIG_DIR, name)))
+
+
+def stack_groups(group):
+    """ ``group`` and every stack group nested below it """
+    groups = []
+    for directory, _, _ in os.walk(os.path.join(CONFIG_DIR, group)):
+        groups.append(os.path.relpath(directory, CONFIG_DIR).replace(
+            os.sep, "/"))
+    return sorted(groups)
+
+
+def stacks(group):
+    """
+    Stack names (``group/stack``) of a stack group and its nested groups,
+    as a sceptre command on ``group`` would see them
+    """
+    names = []
+    for name in stack_groups(group):
+        directory = os.path.join(CONFIG_DIR, name)
+        names.extend(
+            "/".join([name, stack_name(basename)])
+            for basename in os.listdir(directory)
+            if basename.endswith(".yaml") and basename != CONFIG_FILE)
+    return sorted(names)
+
+
+def dependencies(config):
+    """ Stacks referenced by the stack output parameters of a config """
+    names = set(stack_name(d) for d in config.get("dependencies", []))
+    for value in config["parameters"].values():
+        if isinstance(value, StackOutput):
+            names.add(value.stack)
+    return sorted(names)
+
+
+def group_of(name):
+    """ Stack group of stack ``name`` """
+    return name.rsplit("/", 1)[0]
+
+
+def _render_yaml(directory, basename, variables):
+    jinja_env = Environment(
+        loader=FileSystemLoader(directory),
+        undefined=StrictUndefined,
+    )
+    rendered = jinja_env.get_template(basename).render(
+        variables, environment_variable=os.environ)
+    return yaml.load(rendered, Loader=ConfigLoader) or {}
+
+
+def stack_group_config(group):
+    """ config.yaml of the root and every directory down to ``group`` """
+    config = {}
+    directory = CONFIG_DIR
+    for part in [""] + group.split("/"):
+        directory = os.path.join(directory, part)
+        if os.path.isfile(os.path.join(directory, CONFIG_FILE)):
+            config.update(_render_yaml(directory, CONFIG_FILE, config))
+    return config
+
+
+def stack_config(name):
+    """ Config of stack ``name`` with its stack group config merged in """
+    group = group_of(name)
+    config = stack_group_config(group)
+    config.update(_render_yaml(
+        os.path.join(CONFIG_DIR, group), name.rsplit("/", 1)[1] + ".yaml",
+        config))
+    config.setdefault("parameters", {})
+    return config
+
+
+def load_template_module(template_path):
+    """ Import a template module the way sceptre's python handler does """
+    if TEMPLATES_DIR not in sys.path:
+        sys.path.insert(0, TEMPLATES_DIR)
+    return importlib.import_module(os.path.splitext(template_path)[0])
+
+
+_rendered = {}
+
+
+def render(template_path, sceptre_user_data=None):
+    """
+    Return the JSON body produced by a template's ``sceptre_handler``.
+
+    Renders are memoized per process on the template and user data, so
+    environments sharing a template only pay for it once.
+    """
+    key = (template_path, json.dumps(sceptre_user_data, sort_keys=True))
+    if key not in _rendered:
+        module = load_template_module(template_path)
+        _rendered[key] = module.sceptre_handler(sceptre_user_data)
+    return _rendered[key]
+
+
+def render_stack(name):
+    """ Rendered template of stack ``env/stack`` parsed into a dict """
+    config = stack_config(name)
+    return json.loads(render(
+        config["template_path"], config.get("sceptre_user_data")))
+
+
+@contextlib.contextmanager
+def checkout(ref):
+    """ Export git ``ref`` of this project to a temporary directory """
+    directory = tempfile.mkdtemp()
+    try:
+        archive = subprocess.Popen(
+            ["git", "archive", ref], cwd=ROOT_DIR, stdout=subprocess.PIPE)
+        subprocess.check_call(["tar", "-x", "-C", directory],
+                              stdin=archive.stdout)
+        if archive.wait():
+            raise subprocess.CalledProcessError(archive.returncode, "git")
+        yield directory
+    finally:
+        shutil.rmtree(directory)
+
+
+def run_tool(project_dir, module, *args):
+    """
+    Run ``python -m module args`` from this checkout against the project in
+    ``project_dir`` and return its standard output
+    """
+    env = dict(os.environ, SCEPTRE_PROJECT_DIR=project_dir)
+    return subprocess.check_output(
+        [sys.executable, "-m", module] + list(args),
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env).decode("utf-8")
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Report rendered template sizes against the CloudFormation limits.
+
+Usage::
+
+    python -m tools.size                  # every environment
+    python -m tools.size prod --benchmark 20
+
+For each stack the template is rendered in every serialization mode
+(``serialization`` in sceptre_user_data, with minified UserData for the
+non-default modes) and the byte counts are printed next to the limit that
+applies: 51,200 bytes for a template body, 1,000,000 bytes when sceptre
+uploads to ``template_bucket_name``. Sizes within 80% of the limit are
+flagged, and the command exits non-zero if the configured mode of any stack
+is over its limit. ``--benchmark N`` also times N render+serialize runs per
+mode.
+"""
+
+import argparse
+import sys
+import timeit
+
+from tools import lint, render
+
+TEMPLATE_BODY_LIMIT = 51200
+TEMPLATE_URL_LIMIT = 1000000
+WARN_RATIO = 0.8
+
+MODES = [
+    ("pretty", {}),
+    ("compact", {"serialization": "compact", "minify_user_data": True}),
+    ("yaml", {"serialization": "yaml", "minify_user_data": True}),
+]
+
+
+def user_data_for(config, options):
+    user_data = dict(config.get("sceptre_user_data") or {})
+    user_data.update(options)
+    return user_data
+
+
+def configured_mode(config):
+    return (config.get("sceptre_user_data") or {}).get(
+        "serialization", "pretty")
+
+
+def status(size, limit):
+    if size > limit:
+        return "OVER"
+    if size > limit * WARN_RATIO:
+        return "near"
+    return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("targets", nargs="*",
+                        help="environments or env/stack names")
+    parser.add_argument("--benchmark", type=int, metavar="N", default=0,
+                        help="time N renders per mode")
+    args = parser.parse_args(argv)
+
+    header = "{:<32} {:>9}".format("stack", "limit")
+    for mode, _ in MODES:
+        header += " {:>14}".format(mode)
+        if args.benchmark:
+            header += " {:>9}".format("ms")
+    print(header)
+
+    failed = False
+    for name in lint.expand(args.targets):
+        config = render.stack_config(name)
+        module = render.load_template_module(config["template_path"])
+        limit = TEMPLATE_URL_LIMIT if config.get("template_bucket_name") \
+            else TEMPLATE_BODY_LIMIT
+        line = "{:<32} {:>9}".format(name, limit)
+        for mode, options in MODES:
+            user_data = user_data_for(config, options)
+            size = len(module.sceptre_handler(user_data).encode("utf-8"))
+            flag = status(size, limit)
+            if flag == "OVER" and mode == configured_mode(config):
+                failed = True
+            line += " {:>9} {:>4}".format(size, flag)
+            if args.benchmark:
+                seconds = timeit.timeit(
+                    lambda: module.sceptre_handler(user_data),
+                    number=args.benchmark)
+                line += " {:>9.2f}".format(1000.0 * seconds / args.benchmark)
+        print(line)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())